@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any
+
+from anyio.to_thread import current_default_thread_limiter
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .responses import encode_json
+
+# Bounded per route; the least recently seen client is dropped first, which only
+# ever hands it a fresh (full) bucket.
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+API_KEY_HEADER = b"x-api-key"
+FORWARDED_FOR_HEADER = b"x-forwarded-for"
+# Keys issued to integrations; each gets its own bucket. Anything else is ignored,
+# otherwise a fresh random key per request would mean a fresh full bucket.
+ADMISSION_API_KEYS = frozenset(key.strip() for key in os.getenv("ADMISSION_API_KEYS", "").split(",") if key.strip())
+# Proxies whose X-Forwarded-For is believed, e.g. the hosting platform's load
+# balancer; "*" trusts any peer. Without this every user behind the proxy shares a bucket.
+TRUSTED_PROXIES = frozenset(
+    address.strip()
+    for address in os.getenv("ADMISSION_TRUSTED_PROXIES", os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")).split(",")
+    if address.strip()
+)
+
+
+@dataclass(frozen=True, slots=True)
+class RouteLimit:
+    # Token bucket per client: sustained requests per second and burst size; rate 0 disables.
+    rate: float = 0.0
+    burst: int = 0
+    # Requests of this route in progress in this worker; 0 disables.
+    max_in_flight: int = 0
+    # Shed when this many threadpool tasks are already waiting for a slot; 0 disables.
+    max_threadpool_waiting: int = 0
+
+
+# Admin and upload routes are deliberately absent: they are never shed.
+ROUTE_LIMITS: dict[tuple[str, str], RouteLimit] = {
+    ("POST", "/price/calculate"): RouteLimit(rate=10, burst=40, max_in_flight=32, max_threadpool_waiting=20),
+    ("POST", "/quote/calculate"): RouteLimit(rate=20, burst=60, max_in_flight=64, max_threadpool_waiting=20),
+    ("POST", "/quote"): RouteLimit(rate=2, burst=10, max_in_flight=16, max_threadpool_waiting=40),
+    ("GET", "/catalog"): RouteLimit(rate=2, burst=20, max_in_flight=32, max_threadpool_waiting=20),
+    ("GET", "/products"): RouteLimit(rate=2, burst=20, max_in_flight=32, max_threadpool_waiting=20),
+}
+
+
+def _load_overrides(raw: str | None) -> None:
+    # ADMISSION_LIMITS='{"POST /price/calculate": {"rate": 5, "burst": 20}}'
+    if not raw:
+        return
+    for route, values in json.loads(raw).items():
+        method, _, path = route.partition(" ")
+        key = (method.upper(), path)
+        ROUTE_LIMITS[key] = replace(ROUTE_LIMITS.get(key, RouteLimit()), **values)
+
+
+_load_overrides(os.getenv("ADMISSION_LIMITS"))
+
+
+class _RouteState:
+    __slots__ = ("limit", "buckets", "in_flight", "allowed", "limited", "shed")
+
+    def __init__(self, limit: RouteLimit) -> None:
+        self.limit = limit
+        # client key -> [tokens, last refill time]
+        self.buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self.in_flight = 0
+        self.allowed = 0
+        self.limited = 0
+        self.shed = 0
+
+    def take(self, client: str, now: float) -> float:
+        # Returns 0 when admitted, otherwise seconds until the next token.
+        limit = self.limit
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = [float(limit.burst), now]
+            if len(self.buckets) > ADMISSION_MAX_CLIENTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(client)
+            bucket[0] = min(float(limit.burst), bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        return (1.0 - bucket[0]) / limit.rate
+
+
+_routes: dict[tuple[str, str], _RouteState] = {}
+
+
+def _state(key: tuple[str, str]) -> _RouteState | None:
+    state = _routes.get(key)
+    if state is None:
+        limit = ROUTE_LIMITS.get(key)
+        if limit is None:
+            return None
+        state = _routes[key] = _RouteState(limit)
+    return state
+
+
+def _trusted(address: str) -> bool:
+    return "*" in TRUSTED_PROXIES or address in TRUSTED_PROXIES
+
+
+def _client_key(scope: Scope) -> str:
+    forwarded: list[bytes] = []
+    for name, value in scope.get("headers", ()):
+        if name == API_KEY_HEADER and ADMISSION_API_KEYS:
+            key = value.decode("latin-1")
+            if key in ADMISSION_API_KEYS:
+                return "key:" + key
+        elif name == FORWARDED_FOR_HEADER:
+            forwarded.append(value)
+    client = scope.get("client")
+    address = client[0] if client else ""
+    if forwarded and _trusted(address):
+        # Rightmost hop not added by a trusted proxy; anything left of it is client-supplied.
+        hops = [hop.strip() for hop in b",".join(forwarded).decode("latin-1").split(",") if hop.strip()]
+        while hops:
+            address = hops.pop()
+            if not _trusted(address):
+                break
+    return address
+
+
+async def _reject(send: Send, status_code: int, detail: str, retry_after: float) -> None:
+    body = encode_json({"detail": detail})
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    # Runs on the event loop, so the counters and buckets need no locks; every
+    # check is a couple of dict lookups and some arithmetic.
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = _state((scope["method"], scope["path"]))
+        if state is None:
+            await self.app(scope, receive, send)
+            return
+
+        limit = state.limit
+        if limit.rate > 0:
+            wait = state.take(_client_key(scope), time.monotonic())
+            if wait:
+                state.limited += 1
+                await _reject(send, 429, "Túl sok kérés, kérjük próbálja újra később", wait)
+                return
+        if (limit.max_in_flight and state.in_flight >= limit.max_in_flight) or (
+            limit.max_threadpool_waiting
+            and current_default_thread_limiter().statistics().tasks_waiting >= limit.max_threadpool_waiting
+        ):
+            state.shed += 1
+            await _reject(send, 503, "A szolgáltatás túlterhelt, kérjük próbálja újra később", 1)
+            return
+
+        state.allowed += 1
+        state.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            state.in_flight -= 1
+
+
+def admission_stats() -> dict[str, Any]:
+    limiter = current_default_thread_limiter().statistics()
+    routes = {}
+    for (method, path), limit in ROUTE_LIMITS.items():
+        state = _routes.get((method, path))
+        routes[f"{method} {path}"] = {
+            "rate": limit.rate,
+            "burst": limit.burst,
+            "maxInFlight": limit.max_in_flight,
+            "maxThreadpoolWaiting": limit.max_threadpool_waiting,
+            "inFlight": state.in_flight if state else 0,
+            "clients": len(state.buckets) if state else 0,
+            "allowed": state.allowed if state else 0,
+            "limited": state.limited if state else 0,
+            "shed": state.shed if state else 0,
+        }
+    return {
+        "threadpool": {
+            "borrowed": limiter.borrowed_tokens,
+            "total": limiter.total_tokens,
+            "waiting": limiter.tasks_waiting,
+        },
+        "routes": routes,
+    }
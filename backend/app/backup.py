@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy.engine import make_url
+
+from .db import DATABASE_URL, startup_lock
+
+# Must point at a persistent disk (e.g. a mounted volume). The default sits next to
+# app.db, so it survives process restarts but not an instance recycle.
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", "./backups"))
+BACKUP_INTERVAL_SECONDS = float(os.getenv("BACKUP_INTERVAL_SECONDS", "300"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "3"))
+# Pages copied per backup step. The source is only read-locked during a step, and
+# _pause_between_steps sleeps after each one so writers are not starved.
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "1024"))
+BACKUP_STEP_PAUSE_SECONDS = 0.005
+BACKUP_PREFIX = "app-"
+BACKUP_SUFFIX = ".db"
+BACKUP_MARKERS_KEPT = 20
+# Held across processes for a whole backup, so it has to outlast the slowest copy.
+BACKUP_LOCK_TIMEOUT_SECONDS = 600.0
+
+_backup_lock = threading.Lock()
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+_state: dict[str, Any] = {"lastBackupAt": None, "lastBackupSeconds": None, "lastError": None, "restoredFrom": None}
+
+
+def database_path(url: str = DATABASE_URL) -> Path | None:
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or not parsed.database or parsed.database == ":memory:":
+        return None
+    return Path(parsed.database)
+
+
+def list_backups(directory: Path = BACKUP_DIR) -> list[Path]:
+    # Names carry a sortable UTC timestamp, newest last.
+    if not directory.exists():
+        return []
+    return sorted(
+        entry
+        for entry in directory.iterdir()
+        if entry.name.startswith(BACKUP_PREFIX) and entry.name.endswith(BACKUP_SUFFIX)
+    )
+
+
+def _fsync(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _latest_marker(path: Path) -> str | None:
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT MAX(name) FROM backup_markers").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # No marker table: a database that never had a backup taken from it.
+        return None
+
+
+def _write_marker(conn: sqlite3.Connection, name: str) -> None:
+    # Written before the copy, so the backup carries its own marker and the live
+    # database is never older than the newest marker it holds. create_backup takes
+    # it back out if the copy fails.
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO backup_markers (name, created_at) VALUES (?, ?)",
+            (name, datetime.utcnow().isoformat(sep=" ")),
+        )
+        conn.execute(
+            "DELETE FROM backup_markers WHERE name NOT IN "
+            "(SELECT name FROM backup_markers ORDER BY name DESC LIMIT ?)",
+            (BACKUP_MARKERS_KEPT,),
+        )
+
+
+def _remove_marker(conn: sqlite3.Connection, name: str) -> None:
+    with conn:
+        conn.execute("DELETE FROM backup_markers WHERE name = ?", (name,))
+
+
+def _pause_between_steps(_status: int, remaining: int, _total: int) -> None:
+    if remaining:
+        time.sleep(BACKUP_STEP_PAUSE_SECONDS)
+
+
+def create_backup(directory: Path = BACKUP_DIR, source: Path | None = None) -> Path | None:
+    source = source or database_path()
+    if source is None or not source.exists():
+        return None
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+    target = directory / f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}"
+    tmp = directory / f".{target.name}.{os.getpid()}.tmp"
+
+    started = time.monotonic()
+    src = sqlite3.connect(source, timeout=30)
+    dst = sqlite3.connect(tmp)
+    marked = False
+    try:
+        _write_marker(src, target.name)
+        marked = True
+        # Online backup: readers carry on under WAL, and a write between steps only
+        # makes the copy restart from the changed pages. `sleep` only applies to
+        # SQLITE_BUSY retries, so the pause between steps comes from the progress hook.
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=_pause_between_steps)
+        dst.execute("PRAGMA journal_mode=DELETE")
+        if dst.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise sqlite3.DatabaseError("Backup failed quick_check")
+        dst.close()
+        _fsync(tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        dst.close()
+        tmp.unlink(missing_ok=True)
+        if marked:
+            # Otherwise the live database names a backup that does not exist, and
+            # restore_latest_backup would take it as newer than every real one.
+            _remove_marker(src, target.name)
+        raise
+    finally:
+        src.close()
+
+    for stale in list_backups(directory)[:-BACKUP_KEEP] if BACKUP_KEEP > 0 else []:
+        stale.unlink(missing_ok=True)
+    _state["lastBackupAt"] = datetime.utcnow().isoformat()
+    _state["lastBackupSeconds"] = round(time.monotonic() - started, 3)
+    return target
+
+
+def restore_latest_backup(directory: Path = BACKUP_DIR, target: Path | None = None) -> Path | None:
+    # Replaces the database when the newest backup holds data it does not: it is
+    # missing, or it is an older copy (such as the app.db shipped with the code on
+    # a recycled instance) whose latest marker predates that backup.
+    # Call before init_db so migrations and seeding run against the restored copy.
+    target = target or database_path()
+    if target is None:
+        return None
+    current = _latest_marker(target) if target.exists() and target.stat().st_size > 0 else None
+    for candidate in reversed(list_backups(directory)):
+        if current is not None and current >= candidate.name:
+            return None
+        tmp = target.with_name(f".{target.name}.restore.tmp")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(candidate, tmp)
+        try:
+            conn = sqlite3.connect(tmp)
+            try:
+                ok = conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError:
+            ok = False
+        if not ok:
+            tmp.unlink(missing_ok=True)
+            continue
+        if target.exists():
+            # Kept aside rather than deleted, in case the comparison was wrong.
+            os.replace(target, target.with_name(f"{target.name}.replaced"))
+        # Leftover WAL files belong to the replaced database, not to this copy.
+        for suffix in ("-wal", "-shm"):
+            Path(f"{target}{suffix}").unlink(missing_ok=True)
+        os.replace(tmp, target)
+        _state["restoredFrom"] = candidate.name
+        return candidate
+    return None
+
+
+def _backup_dir_lock():
+    # _backup_lock only covers this process; workers under server.py share BACKUP_DIR.
+    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    return startup_lock(str(BACKUP_DIR / ".backup.lock"), timeout=BACKUP_LOCK_TIMEOUT_SECONDS)
+
+
+def run_backup(only_if_due: bool = False) -> Path | None:
+    with _backup_lock, _backup_dir_lock():
+        # Checked under the lock, so a worker that waited on another's copy skips its turn.
+        if only_if_due and not _backup_due():
+            return None
+        try:
+            return create_backup()
+        except Exception as exc:
+            _state["lastError"] = f"{datetime.utcnow().isoformat()} {exc}"
+            raise
+
+
+def _backup_due() -> bool:
+    # Workers share the backup directory; whoever finds the newest copy stale takes the turn.
+    backups = list_backups()
+    return not backups or time.time() - backups[-1].stat().st_mtime >= BACKUP_INTERVAL_SECONDS * 0.9
+
+
+def _backup_loop() -> None:
+    while not _stop.wait(BACKUP_INTERVAL_SECONDS):
+        if not _backup_due():
+            continue
+        try:
+            run_backup(only_if_due=True)
+        except Exception:
+            # Recorded in the status; the previous backups are still in place.
+            continue
+
+
+def start_backup_scheduler() -> None:
+    global _thread
+    if BACKUP_INTERVAL_SECONDS <= 0 or database_path() is None or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_backup_loop, name="db-backup", daemon=True)
+    _thread.start()
+
+
+def stop_backup_scheduler() -> None:
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5.0)
+        _thread = None
+
+
+def backup_status() -> dict[str, Any]:
+    return {
+        **_state,
+        "directory": str(BACKUP_DIR),
+        "intervalSeconds": BACKUP_INTERVAL_SECONDS,
+        "keep": BACKUP_KEEP,
+        "backups": [{"name": path.name, "bytes": path.stat().st_size} for path in list_backups()],
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.backup")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="write a backup of the database now")
+    sub.add_parser("restore", help="restore the newest backup if the database is missing or older")
+    sub.add_parser("list", help="list backups")
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        target = run_backup()
+        print(f"Wrote {target}" if target else "No SQLite database to back up")
+    elif args.command == "restore":
+        restored = restore_latest_backup()
+        print(f"Restored {restored}" if restored else "Nothing restored")
+    else:
+        for path in list_backups():
+            print(f"{path.name} {path.stat().st_size}")
+
+
+if __name__ == "__main__":
+    main()
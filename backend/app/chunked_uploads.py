@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+from .uploads import ALLOWED_EXTENSIONS, ALLOWED_MIME_TYPES, UPLOAD_DIR
+
+PARTIAL_DIR = UPLOAD_DIR / ".partial"
+MAX_RESUMABLE_UPLOAD_SIZE = int(os.getenv("MAX_RESUMABLE_UPLOAD_SIZE", str(512 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL_SECONDS = float(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+UPLOAD_GC_INTERVAL_SECONDS = 600.0
+HASH_CHUNK_SIZE = 1024 * 1024
+# Request body pieces are gathered up to this size per threadpool write.
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+EXTENSION_BY_MIME = {
+    "application/pdf": ".pdf",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+}
+
+_last_gc = 0.0
+
+
+class UploadSessionError(ValueError):
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Per session: <id>.json metadata, <id>.part preallocated data file and <id>.chunks,
+# one byte per chunk set to 1 once that chunk is on disk. Chunks land at disjoint
+# offsets, so parallel PUTs (even to different workers) never touch the same bytes.
+def _paths(upload_id: str) -> tuple[Path, Path, Path]:
+    if not upload_id or upload_id != Path(upload_id).name or "." in upload_id:
+        raise UploadSessionError("Ismeretlen feltöltés", status_code=404)
+    base = PARTIAL_DIR / upload_id
+    return base.with_suffix(".json"), base.with_suffix(".part"), base.with_suffix(".chunks")
+
+
+def _load_meta(upload_id: str) -> dict[str, Any]:
+    meta_path, _, _ = _paths(upload_id)
+    try:
+        return json.loads(meta_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise UploadSessionError("Ismeretlen vagy lejárt feltöltés", status_code=404) from None
+
+
+def _chunk_count(meta: dict[str, Any]) -> int:
+    return max(1, -(-meta["size"] // meta["chunkSize"]))
+
+
+def _received(upload_id: str, meta: dict[str, Any]) -> bytes:
+    _, _, chunks_path = _paths(upload_id)
+    data = chunks_path.read_bytes()
+    return data.ljust(_chunk_count(meta), b"\0")
+
+
+def _status(upload_id: str, meta: dict[str, Any]) -> dict[str, Any]:
+    received = _received(upload_id, meta)
+    missing = [index * meta["chunkSize"] for index, flag in enumerate(received) if not flag]
+    return {
+        "uploadId": upload_id,
+        "size": meta["size"],
+        "chunkSize": meta["chunkSize"],
+        "receivedChunks": len(received) - len(missing),
+        "missingOffsets": missing,
+        "complete": not missing,
+    }
+
+
+def create_session(filename: str, size: int, content_type: str) -> dict[str, Any]:
+    extension = Path(filename).suffix.lower()
+    if content_type not in ALLOWED_MIME_TYPES and extension not in ALLOWED_EXTENSIONS:
+        raise UploadSessionError("Csak PDF/JPG/PNG engedélyezett")
+    if size <= 0 or size > MAX_RESUMABLE_UPLOAD_SIZE:
+        raise UploadSessionError(f"Túl nagy fájl (max {MAX_RESUMABLE_UPLOAD_SIZE // (1024 * 1024)}MB)")
+    if extension not in ALLOWED_EXTENSIONS:
+        extension = EXTENSION_BY_MIME.get(content_type, "")
+
+    collect_stale_sessions()
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    upload_id = str(uuid.uuid4())
+    meta = {
+        "filename": filename,
+        "size": size,
+        "contentType": content_type,
+        "extension": extension,
+        "chunkSize": UPLOAD_CHUNK_SIZE,
+        "createdAt": time.time(),
+    }
+    meta_path, part_path, chunks_path = _paths(upload_id)
+    with part_path.open("wb") as handle:
+        # Sparse preallocation: chunks are written in place at their offsets.
+        handle.truncate(size)
+    chunks_path.write_bytes(b"\0" * _chunk_count(meta))
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+    return _status(upload_id, meta)
+
+
+def session_status(upload_id: str) -> dict[str, Any]:
+    return _status(upload_id, _load_meta(upload_id))
+
+
+def expected_chunk(upload_id: str, offset: int) -> tuple[dict[str, Any], int]:
+    meta = _load_meta(upload_id)
+    if offset < 0 or offset >= meta["size"] or offset % meta["chunkSize"]:
+        raise UploadSessionError("Érvénytelen chunk offset")
+    return meta, min(meta["chunkSize"], meta["size"] - offset)
+
+
+def _open_at(path: Path, offset: int) -> int:
+    # Each request has its own descriptor, so seek + write is safe (and works on Windows).
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        os.lseek(fd, offset, os.SEEK_SET)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _write_all(fd: int, data: bytes | bytearray) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _sync_and_close(fd: int) -> None:
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+async def write_chunk(
+    upload_id: str,
+    offset: int,
+    body: AsyncIterator[bytes],
+    chunk_sha256: str | None = None,
+) -> dict[str, Any]:
+    meta, length = await run_in_threadpool(expected_chunk, upload_id, offset)
+    _, part_path, chunks_path = _paths(upload_id)
+    digest = hashlib.sha256()
+    written = 0
+
+    fd = await run_in_threadpool(_open_at, part_path, offset)
+    try:
+        # Streams the request body to its place in the file. Disk writes go through
+        # the threadpool a buffer at a time, so memory stays at WRITE_BUFFER_SIZE
+        # regardless of chunk size and a slow disk never blocks the event loop.
+        buffer = bytearray()
+        async for piece in body:
+            if written + len(piece) > length:
+                raise UploadSessionError("A chunk hosszabb a vártnál")
+            digest.update(piece)
+            buffer += piece
+            written += len(piece)
+            if len(buffer) >= WRITE_BUFFER_SIZE:
+                await run_in_threadpool(_write_all, fd, buffer)
+                buffer = bytearray()
+        if written != length:
+            raise UploadSessionError("A chunk hiányos, küldje újra")
+        if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+            raise UploadSessionError("A chunk ellenőrzőösszege nem egyezik, küldje újra")
+        await run_in_threadpool(_write_all, fd, buffer)
+    except BaseException:
+        await run_in_threadpool(os.close, fd)
+        raise
+    await run_in_threadpool(_sync_and_close, fd)
+
+    await run_in_threadpool(_mark_received, chunks_path, offset // meta["chunkSize"])
+    return await run_in_threadpool(_status, upload_id, meta)
+
+
+def _mark_received(chunks_path: Path, index: int) -> None:
+    fd = os.open(chunks_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        os.lseek(fd, index, os.SEEK_SET)
+        os.write(fd, b"\1")
+    finally:
+        os.close(fd)
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while chunk := handle.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def finalize_session(upload_id: str, sha256: str) -> dict[str, Any]:
+    meta = _load_meta(upload_id)
+    status = _status(upload_id, meta)
+    if not status["complete"]:
+        raise UploadSessionError("Hiányzó chunkok, a feltöltés nem zárható le", status_code=409)
+
+    meta_path, part_path, chunks_path = _paths(upload_id)
+    if _sha256_file(part_path) != sha256.lower():
+        raise UploadSessionError("A fájl ellenőrzőösszege nem egyezik", status_code=422)
+
+    stored_name = f"{upload_id}{meta['extension']}"
+    try:
+        os.replace(part_path, UPLOAD_DIR / stored_name)
+    except FileNotFoundError:
+        raise UploadSessionError("A feltöltés már lezárult", status_code=409) from None
+    chunks_path.unlink(missing_ok=True)
+    meta_path.unlink(missing_ok=True)
+    return {
+        "fileId": upload_id,
+        "originalName": meta["filename"],
+        "storedName": stored_name,
+        "size": meta["size"],
+        "contentType": meta["contentType"],
+        "url": f"/uploads/{stored_name}",
+    }
+
+
+def collect_stale_sessions(force: bool = False) -> int:
+    # Runs at most every UPLOAD_GC_INTERVAL_SECONDS, piggybacking on new sessions.
+    global _last_gc
+    now = time.time()
+    if not force and now - _last_gc < UPLOAD_GC_INTERVAL_SECONDS:
+        return 0
+    _last_gc = now
+    if not PARTIAL_DIR.exists():
+        return 0
+
+    newest: dict[str, float] = {}
+    with os.scandir(PARTIAL_DIR) as entries:
+        for entry in entries:
+            upload_id = entry.name.split(".", 1)[0]
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            newest[upload_id] = max(newest.get(upload_id, 0.0), mtime)
+
+    removed = 0
+    for upload_id, mtime in newest.items():
+        if now - mtime < UPLOAD_SESSION_TTL_SECONDS:
+            continue
+        for suffix in (".json", ".part", ".chunks"):
+            (PARTIAL_DIR / f"{upload_id}{suffix}").unlink(missing_ok=True)
+        removed += 1
+    return removed
@@ -1,20 +1,84 @@
-from contextlib import contextmanager
+import os
+import sqlite3
+from contextlib import asynccontextmanager, contextmanager
 
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlmodel import Session, create_engine
 
-DATABASE_URL = "sqlite:///./app.db"
+# SQLite only: upserts use its INSERT ... ON CONFLICT / INSERT OR IGNORE syntax, and
+# backups, restores and the startup lock work on the database file. The URLs choose
+# the file and the driver, not the database engine.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "sqlite+aiosqlite:///./app.db")
+# The pricing and catalog endpoints use the async engine when enabled; admin and
+# seeding stay on the sync engine either way.
+USE_ASYNC_DB = os.getenv("USE_ASYNC_DB", "0").lower() in {"1", "true", "yes"}
+STARTUP_LOCK_PATH = os.getenv("STARTUP_LOCK_PATH", "./startup.lock")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-)
+
+
+def _require_sqlite(name: str, url: str) -> None:
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        raise RuntimeError(f"{name} must be a SQLite URL, got {parsed.render_as_string(hide_password=True)}")
+
+
+_require_sqlite("DATABASE_URL", DATABASE_URL)
+_require_sqlite("ASYNC_DATABASE_URL", ASYNC_DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+_async_engine = None
+
+
+def _sqlite_pragmas(dbapi_connection, _record) -> None:
+    # WAL lets quote reads continue while migrations and admin writes hold the write lock.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+event.listen(engine, "connect", _sqlite_pragmas)
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        # Imported lazily so the async driver (aiosqlite) is only needed when enabled.
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+        event.listen(_async_engine.sync_engine, "connect", _sqlite_pragmas)
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
 
 
 def init_db() -> None:
-    # Import models so SQLModel metadata includes AnchorPrice.
-    from .models import AnchorPrice  # noqa: F401
+    # Import models so SQLModel metadata includes every table.
+    from . import models  # noqa: F401
+    from .migrations import run_migrations
 
-    SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
+
+
+@contextmanager
+def startup_lock(path: str = STARTUP_LOCK_PATH, timeout: float = 120.0):
+    # An exclusive transaction on a scratch SQLite file works as a cross-process lock on
+    # every platform and is released by the OS if the holder dies.
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    try:
+        conn.execute("BEGIN EXCLUSIVE")
+        yield
+    finally:
+        conn.close()
 
 
 @contextmanager
@@ -28,3 +92,11 @@ def session_scope():
         raise
     finally:
         session.close()
+
+
+@asynccontextmanager
+async def async_session_scope():
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import deque
+from typing import Any, AsyncIterator
+
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+
+from .responses import encode_json
+
+EVENT_TOPICS = frozenset({"orders", "anchors"})
+# Per-client buffer; a client that falls further behind gets a "resync" event instead.
+EVENT_BUFFER_MAX = int(os.getenv("EVENT_BUFFER_MAX", "256"))
+# Picks up writes made by other worker processes; local writes wake the relay at once.
+EVENT_POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", "1.0"))
+EVENT_HEARTBEAT_SECONDS = 15.0
+EVENT_RELAY_BATCH = 500
+
+Event = dict[str, Any]
+
+
+def _order_event(change: dict[str, Any]) -> Event:
+    return {"topic": "orders", **change}
+
+
+def _pricing_version() -> int:
+    from .db import session_scope
+    from .models import PricingState
+
+    with session_scope() as session:
+        return session.exec(select(PricingState.version).where(PricingState.id == 1)).first() or 0
+
+
+def _read_heads() -> tuple[int, int]:
+    from .order_store import list_order_changes
+
+    return list_order_changes()["lastSeq"], _pricing_version()
+
+
+def _read_order_events(since: int, limit: int) -> tuple[list[Event], bool]:
+    from .order_store import list_order_changes
+
+    page = list_order_changes(since=since, limit=limit)
+    return [_order_event(change) for change in page["data"]], page["hasMore"]
+
+
+def _poll(order_seq: int) -> tuple[list[Event], bool, int]:
+    events, has_more = _read_order_events(order_seq, EVENT_RELAY_BATCH)
+    return events, has_more, _pricing_version()
+
+
+class Subscription:
+    def __init__(self, topics: frozenset[str], last_seq: int | None) -> None:
+        self.topics = topics
+        # Highest order change sequence queued for this client; also its SSE event id.
+        self.last_seq = last_seq
+        self.buffer: deque[Event] = deque()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def push(self, event: Event) -> None:
+        if event["topic"] not in self.topics:
+            return
+        seq = event.get("seq")
+        if seq is not None:
+            if self.last_seq is not None and seq <= self.last_seq:
+                return
+            self.last_seq = seq
+        if len(self.buffer) >= EVENT_BUFFER_MAX:
+            self.buffer.clear()
+            self.overflowed = True
+        else:
+            self.buffer.append(event)
+        self.ready.set()
+
+    async def next_batch(self, timeout: float) -> tuple[list[Event], bool]:
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.ready.clear()
+        events = list(self.buffer)
+        self.buffer.clear()
+        overflowed, self.overflowed = self.overflowed, False
+        return events, overflowed
+
+
+class EventBus:
+    def __init__(self) -> None:
+        self._subscriptions: set[Subscription] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._relay: asyncio.Task | None = None
+        self._started: asyncio.Future | None = None
+        self._order_seq = 0
+        self._pricing_version = 0
+
+    def publish(self, event: Event) -> None:
+        # Safe from any thread; a no-op while nobody is listening.
+        loop = self._loop
+        if loop is None or not self._subscriptions:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, event)
+        except RuntimeError:
+            pass
+
+    def notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or not self._subscriptions:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass
+
+    def _dispatch(self, event: Event) -> None:
+        if event["topic"] == "anchors":
+            self._pricing_version = max(self._pricing_version, event["version"])
+        for subscription in list(self._subscriptions):
+            subscription.push(event)
+
+    async def subscribe(self, topics: frozenset[str], last_seq: int | None = None) -> Subscription:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First subscriber on this event loop; anything tied to an old loop is dropped.
+            self._loop = loop
+            self._subscriptions = set()
+            self._relay = None
+        if self._relay is None or self._relay.done():
+            self._wake = asyncio.Event()
+            self._started = loop.create_future()
+            self._relay = asyncio.create_task(self._run_relay(self._started))
+        await asyncio.shield(self._started)
+
+        # Registered at the relay cursor so relayed events and the catch-up below never overlap.
+        cursor = self._order_seq
+        subscription = Subscription(topics, cursor)
+        self._subscriptions.add(subscription)
+
+        if last_seq is not None and last_seq < cursor and "orders" in topics:
+            # Reconnect with Last-Event-ID: replay what was missed, or ask for a reload.
+            missed, has_more = await run_in_threadpool(_read_order_events, last_seq, EVENT_BUFFER_MAX)
+            missed = [event for event in missed if event["seq"] <= cursor]
+            if has_more and (not missed or missed[-1]["seq"] < cursor):
+                subscription.overflowed = True
+            else:
+                subscription.buffer.extendleft(reversed(missed))
+            subscription.ready.set()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    async def _run_relay(self, started: asyncio.Future) -> None:
+        try:
+            self._order_seq, self._pricing_version = await run_in_threadpool(_read_heads)
+        except Exception as exc:
+            started.set_exception(exc)
+            return
+        started.set_result(None)
+
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), EVENT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._subscriptions:
+                return
+
+            try:
+                events, has_more, version = await run_in_threadpool(_poll, self._order_seq)
+            except Exception:
+                continue
+
+            for event in events:
+                self._order_seq = event["seq"]
+                self._dispatch(event)
+            if version > self._pricing_version:
+                # Changed by another worker; clients reload instead of patching rows.
+                self._dispatch({"topic": "anchors", "version": version, "changes": None})
+            if has_more:
+                self._wake.set()
+
+
+event_bus = EventBus()
+
+
+def publish_anchor_changes(version: int, changes: list[dict[str, Any]] | None) -> None:
+    event_bus.publish({"topic": "anchors", "version": version, "changes": changes})
+
+
+def notify_order_changes() -> None:
+    event_bus.notify()
+
+
+def _format_event(event: Event) -> bytes:
+    lines = b""
+    if event.get("seq") is not None:
+        lines += b"id: %d\n" % event["seq"]
+    lines += b"event: " + event["topic"].encode() + b"\n"
+    return lines + b"data: " + encode_json(event) + b"\n\n"
+
+
+async def stream_events(subscription: Subscription) -> AsyncIterator[bytes]:
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            events, overflowed = await subscription.next_batch(EVENT_HEARTBEAT_SECONDS)
+            if overflowed:
+                # The id moves past the dropped events so a reconnect does not replay them.
+                seq = subscription.last_seq or 0
+                yield b"id: %d\nevent: resync\ndata: {}\n\n" % seq
+            for event in events:
+                yield _format_event(event)
+            if not events and not overflowed:
+                yield b": ping\n\n"
+    finally:
+        event_bus.unsubscribe(subscription)
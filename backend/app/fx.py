@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Sequence
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from .db import engine
+from .models import FxRate, PriceLine, QuoteResult
+
+BASE_CURRENCY = "HUF"
+CURRENCY_PATTERN = r"^[A-Za-z]{3}$"
+# Optional JSON file, {"EUR": 395.5} or {"EUR": {"rate": 395.5, "decimals": 2}},
+# applied to the fx_rates table at startup.
+FX_RATES_FILE = os.getenv("FX_RATES_FILE")
+FX_VERSION_POLL_SECONDS = float(os.getenv("FX_VERSION_POLL_SECONDS", "5.0"))
+
+
+class UnsupportedCurrency(ValueError):
+    def __init__(self, currency: str) -> None:
+        super().__init__(f"Unsupported currency: {currency}")
+        self.currency = currency
+
+
+@dataclass(frozen=True, slots=True)
+class FxTable:
+    version: int
+    # currency -> (base units per unit, decimals)
+    rates: dict[str, tuple[float, int]] = field(default_factory=dict)
+
+    def currencies(self) -> list[str]:
+        return [BASE_CURRENCY, *sorted(self.rates)]
+
+    def convert_many(self, amounts: Sequence[int | float], currency: str) -> list[int | float]:
+        # One rate lookup per batch; callers pass whole price lists, not single values.
+        if currency == BASE_CURRENCY:
+            return list(amounts)
+        entry = self.rates.get(currency)
+        if entry is None:
+            raise UnsupportedCurrency(currency)
+        rate, decimals = entry
+        factor = 1.0 / rate
+        if decimals <= 0:
+            return [int(round(amount * factor)) for amount in amounts]
+        return [round(amount * factor, decimals) for amount in amounts]
+
+    def convert_quote(self, result: QuoteResult, currency: str) -> QuoteResult:
+        if currency == result.currency:
+            return result
+        converted = self.convert_many(
+            [result.final_price, *(line.amount for line in result.breakdown)], currency
+        )
+        amounts = converted[1:]
+        if amounts and currency != BASE_CURRENCY:
+            # Lines are rounded one by one; the last absorbs the difference so they
+            # still add up to the converted total.
+            rest = converted[0] - sum(amounts[:-1])
+            amounts[-1] = rest if isinstance(rest, int) else round(rest, self.rates[currency][1])
+        lines = tuple(PriceLine(line.label, amount) for line, amount in zip(result.breakdown, amounts))
+        return QuoteResult(converted[0], currency, lines)
+
+
+_table = FxTable(version=-1)
+_checked_at = 0.0
+
+
+def _fresh_table() -> FxTable | None:
+    if _table.version >= 0 and time.monotonic() - _checked_at < FX_VERSION_POLL_SECONDS:
+        return _table
+    return None
+
+
+def _refresh() -> FxTable:
+    global _table, _checked_at
+    with Session(engine) as session:
+        version = session.exec(select(func.max(FxRate.version))).one() or 0
+        if version != _table.version:
+            rows = session.exec(select(FxRate)).all()
+            _table = FxTable(version, {row.currency: (row.rate, row.decimals) for row in rows})
+    _checked_at = time.monotonic()
+    return _table
+
+
+def get_fx_table() -> FxTable:
+    return _fresh_table() or _refresh()
+
+
+async def load_fx_table() -> FxTable:
+    table = _fresh_table()
+    if table is not None:
+        return table
+    return await run_in_threadpool(_refresh)
+
+
+def invalidate_fx_cache() -> None:
+    global _checked_at
+    _checked_at = 0.0
+
+
+def upsert_fx_rate(session: Session, currency: str, rate: float, decimals: int = 2) -> FxRate:
+    if not re.fullmatch(CURRENCY_PATTERN, currency):
+        raise ValueError(f"Invalid currency code: {currency!r}")
+    currency = currency.upper()
+    if currency == BASE_CURRENCY:
+        raise ValueError(f"{BASE_CURRENCY} is the base currency")
+    version = (session.exec(select(func.max(FxRate.version))).one() or 0) + 1
+    row = session.get(FxRate, currency) or FxRate(currency=currency, rate=rate)
+    row.rate = rate
+    row.decimals = decimals
+    row.version = version
+    row.updated_at = datetime.utcnow()
+    session.add(row)
+    session.commit()
+    session.refresh(row)
+    invalidate_fx_cache()
+    return row
+
+
+def list_fx_rates(session: Session) -> list[FxRate]:
+    return session.exec(select(FxRate).order_by(FxRate.currency)).all()
+
+
+def seed_fx_rates(session: Session, path: str | None = FX_RATES_FILE) -> int:
+    if not path:
+        return 0
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    changed = 0
+    for currency, value in data.items():
+        rate, decimals = (value, 2) if isinstance(value, (int, float)) else (value["rate"], value.get("decimals", 2))
+        existing = session.get(FxRate, currency.upper())
+        if existing is not None and (existing.rate, existing.decimals) == (float(rate), int(decimals)):
+            continue
+        upsert_fx_rate(session, currency, float(rate), int(decimals))
+        changed += 1
+    return changed
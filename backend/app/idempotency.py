@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy import delete, select as sa_select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import func, select
+
+from .db import session_scope
+from .models import IdempotencyRecord
+from .responses import encode_json
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "50000"))
+# A claim older than this belongs to a worker that died mid-request and may be taken over.
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = 300.0
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+_last_purge = 0.0
+
+
+class IdempotencyConflict(ValueError):
+    def __init__(self, message: str, status_code: int = 409) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_fingerprint(payload: Any) -> str:
+    return hashlib.sha256(encode_json(jsonable_encoder(payload))).hexdigest()
+
+
+def _claim(scope: str, key: str, request_hash: str) -> IdempotencyRecord | None:
+    # Returns the stored record to replay, or None once this request owns the key.
+    now = datetime.utcnow()
+    with session_scope() as session:
+        inserted = session.exec(
+            insert(IdempotencyRecord)
+            .values(scope=scope, key=key, request_hash=request_hash, status_code=0, body=b"", created_at=now)
+            .on_conflict_do_nothing()
+            .returning(IdempotencyRecord.key)
+        ).first()
+        if inserted is not None:
+            return None
+
+        record = session.exec(
+            select(IdempotencyRecord).where(IdempotencyRecord.scope == scope, IdempotencyRecord.key == key)
+        ).one()
+        expired = record.created_at < now - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        abandoned = record.status_code == 0 and record.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+        if not expired and not abandoned:
+            if record.request_hash != request_hash:
+                raise IdempotencyConflict(
+                    "Az Idempotency-Key egy másik kéréshez tartozik", status_code=422
+                )
+            if record.status_code == 0:
+                raise IdempotencyConflict("A kérés feldolgozása még folyamatban van")
+            session.expunge(record)
+            return record
+
+        # Conditional on the row we read, so only one of several retries takes it over.
+        taken = session.exec(
+            update(IdempotencyRecord)
+            .where(
+                IdempotencyRecord.scope == scope,
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.created_at == record.created_at,
+            )
+            .values(request_hash=request_hash, status_code=0, body=b"", created_at=now)
+        ).rowcount
+    if not taken:
+        raise IdempotencyConflict("A kérés feldolgozása még folyamatban van")
+    return None
+
+
+def _complete(scope: str, key: str, status_code: int, body: bytes) -> None:
+    with session_scope() as session:
+        session.exec(
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.scope == scope, IdempotencyRecord.key == key)
+            .values(status_code=status_code, body=body)
+        )
+
+
+def _release(scope: str, key: str) -> None:
+    with session_scope() as session:
+        session.exec(
+            delete(IdempotencyRecord).where(
+                IdempotencyRecord.scope == scope,
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code == 0,
+            )
+        )
+
+
+def purge_idempotency_keys(force: bool = False) -> int:
+    # Runs at most every IDEMPOTENCY_PURGE_INTERVAL_SECONDS, piggybacking on new keys.
+    global _last_purge
+    now = time.time()
+    if not force and now - _last_purge < IDEMPOTENCY_PURGE_INTERVAL_SECONDS:
+        return 0
+    _last_purge = now
+
+    cutoff = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    with session_scope() as session:
+        removed = session.exec(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff)).rowcount
+        excess = session.exec(select(func.count()).select_from(IdempotencyRecord)).one() - IDEMPOTENCY_MAX_ENTRIES
+        if excess > 0:
+            # Oldest first, through the created_at index.
+            oldest = (
+                sa_select(IdempotencyRecord.created_at)
+                .order_by(IdempotencyRecord.created_at)
+                .offset(excess - 1)
+                .limit(1)
+                .scalar_subquery()
+            )
+            removed += session.exec(
+                delete(IdempotencyRecord).where(
+                    IdempotencyRecord.created_at <= oldest, IdempotencyRecord.status_code != 0
+                )
+            ).rowcount
+    return int(removed or 0)
+
+
+def run_idempotent(
+    scope: str,
+    key: str | None,
+    payload: Any,
+    execute: Callable[[], Any],
+    status_code: int = 200,
+) -> Any:
+    # Without a key the handler runs as before. With one, the first successful
+    # response is stored and duplicates get the same bytes back without executing.
+    if not key:
+        return execute()
+
+    purge_idempotency_keys()
+    record = _claim(scope, key, request_fingerprint(payload))
+    if record is not None:
+        return Response(
+            record.body,
+            status_code=record.status_code,
+            media_type="application/json",
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    try:
+        result = execute()
+    except BaseException:
+        # Failed requests had no effect worth replaying; a retry runs them again.
+        _release(scope, key)
+        raise
+    body = encode_json(jsonable_encoder(result))
+    _complete(scope, key, status_code, body)
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+def idempotency_stats() -> dict[str, Any]:
+    with session_scope() as session:
+        rows = session.exec(
+            select(IdempotencyRecord.scope, func.count(), func.min(IdempotencyRecord.created_at)).group_by(
+                IdempotencyRecord.scope
+            )
+        ).all()
+    return {
+        "ttlSeconds": IDEMPOTENCY_TTL_SECONDS,
+        "maxEntries": IDEMPOTENCY_MAX_ENTRIES,
+        "scopes": {scope: {"entries": count, "oldest": oldest} for scope, count, oldest in rows},
+    }
@@ -1,41 +1,53 @@
-﻿from pathlib import Path
-import uuid
-
-from fastapi import FastAPI, File, HTTPException, UploadFile
+﻿from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
 from sqlmodel import Session
-
-from .db import engine, init_db
-from .models import BreakdownItem, QuoteRequest, QuoteResponse
-from .order_store import create_order
-from .pricing import calculate_quote
+from starlette.concurrency import run_in_threadpool
+
+from .admission import AdmissionMiddleware
+from .backup import restore_latest_backup, start_backup_scheduler, stop_backup_scheduler
+from .db import dispose_async_engine, engine, init_db, startup_lock
+from .fx import BASE_CURRENCY, FxTable, UnsupportedCurrency, load_fx_table, seed_fx_rates
+from .idempotency import IdempotencyConflict, run_idempotent
+from .models import QuoteRequest, QuoteResponse
+from .order_log import replay_segments, start_order_log, stop_order_log
+from .order_pricing import CartPricingError, reprice_items
+from .order_store import create_order, materialize_orders
+from .pricing import calculate_anchor_price, quote_response_bytes
+from .pricing_cache import get_pricing_snapshot, load_pricing_snapshot
 from .pricing_service import (
-    calculate_anchor_quote,
-    get_catalog,
+    build_catalog,
     seed_anchor_prices,
     seed_product_specs,
     seed_sheet_prices,
     seed_sra3,
 )
+from .products import get_product_catalog, seed_products
+from .responses import (
+    COMPRESS_EXCLUDED_CONTENT_TYPES,
+    COMPRESS_MIN_BYTES,
+    DYNAMIC_GZIP_LEVEL,
+    EncodedBody,
+    PrevalidatedJSONResponse,
+)
 from .routers.admin import router as admin_router
+from .routers.uploads import router as uploads_router
 from .schemas.quote import QuoteCreateRequest, QuoteCreateResponse
+from .storage import start_storage_sweeper, stop_storage_sweeper
+from .thumbnails import shutdown_thumbnails, start_thumbnails
 
 app = FastAPI(title="print-quote-mvp", version="0.1.0")
 
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-MAX_UPLOAD_SIZE = 20 * 1024 * 1024
-ALLOWED_MIME_TYPES = {"application/pdf", "image/jpeg", "image/png"}
-ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
-
 origins = [
     "http://localhost:5173",
     "http://localhost:3000",
     "https://print-quote-mvp.vercel.app",
 ]
 
+# Innermost, so 429/503 responses still get CORS headers.
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -44,101 +56,53 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+# Handlers that return pre-compressed bytes set Content-Encoding and are passed through.
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=COMPRESS_MIN_BYTES,
+    compresslevel=DYNAMIC_GZIP_LEVEL,
+    exclude_content_types=COMPRESS_EXCLUDED_CONTENT_TYPES,
+)
 
 
 @app.on_event("startup")
 def startup() -> None:
-    init_db()
-    with Session(engine) as session:
-        seed_sra3(session)
-        seed_sheet_prices(session)
-        seed_product_specs(session)
-        seed_anchor_prices(session)
+    # Workers started together serialize migrations and seeding on the startup lock.
+    with startup_lock():
+        # A recycled instance starts from the newest backup instead of an empty database.
+        restore_latest_backup()
+        init_db()
+        with Session(engine) as session:
+            seed_sra3(session)
+            seed_sheet_prices(session)
+            seed_product_specs(session)
+            seed_anchor_prices(session)
+            seed_products(session)
+            seed_fx_rates(session)
+        # Orders acknowledged by a worker that died before materializing them.
+        replay_segments(materialize_orders)
+    start_order_log(materialize_orders)
+    start_storage_sweeper()
+    start_backup_scheduler()
+    start_thumbnails()
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    stop_order_log()
+    stop_storage_sweeper()
+    stop_backup_scheduler()
+    shutdown_thumbnails()
+    await dispose_async_engine()
 
 
 app.include_router(admin_router)
+app.include_router(uploads_router)
 
-SURCHARGE_PAPER_170G = 900
-SURCHARGE_COLOR_4_0 = 1500
-SURCHARGE_COLOR_4_4 = 3000
-SURCHARGE_LAMINATION = 2000
-MIN_PRICE = 5000
-
-PRINT_PRODUCTS = [
-    {
-        "id": "flyer-a5",
-        "slug": "szorolap-a5",
-        "name": "Szórólap A5",
-        "description": "Kétoldalas promóciós szórólap rövid határidővel.",
-        "product_code": "flyer",
-        "basePrice": 8900,
-        "imageUrl": "https://images.unsplash.com/photo-1586717791821-3f44a563fa4c?auto=format&fit=crop&w=1200&q=80",
-    },
-    {
-        "id": "poster-a3",
-        "slug": "poszter-a3",
-        "name": "Poszter A3",
-        "description": "Élénk színes poszter üzletekbe és rendezvényekre.",
-        "product_code": "poster",
-        "basePrice": 6900,
-        "imageUrl": "https://images.unsplash.com/photo-1513519245088-0e12902e5a38?auto=format&fit=crop&w=1200&q=80",
-    },
-    {
-        "id": "business-card-classic",
-        "slug": "nevjegykartya-90x50",
-        "name": "Névjegykártya 90x50",
-        "description": "Klasszikus névjegy matt vagy fényes kivitelben.",
-        "product_code": "business_card",
-        "basePrice": 4900,
-        "imageUrl": "https://images.unsplash.com/photo-1586953208448-b95a79798f07?auto=format&fit=crop&w=1200&q=80",
-    },
-    {
-        "id": "sticker-sheet",
-        "slug": "matrica-iv",
-        "name": "Matrica ív",
-        "description": "Egyedi formájú, beltéri felhasználásra.",
-        "product_code": "sticker",
-        "basePrice": 5900,
-        "imageUrl": "https://images.unsplash.com/photo-1621905252507-b35492cc74b4?auto=format&fit=crop&w=1200&q=80",
-    },
-    {
-        "id": "rollup-standard",
-        "slug": "rollup-85x200",
-        "name": "Roll-up 85x200",
-        "description": "Kiállításokra és bemutatókra kész roll-up rendszer.",
-        "product_code": "rollup",
-        "basePrice": 24900,
-        "imageUrl": "https://images.unsplash.com/photo-1523726491678-bf852e717f6a?auto=format&fit=crop&w=1200&q=80",
-    },
-    {
-        "id": "brochure-a4",
-        "slug": "brossura-a4",
-        "name": "Brossúra A4 hajtott",
-        "description": "Termékbemutatókhoz és árlistákhoz ideális.",
-        "product_code": "brochure",
-        "basePrice": 15900,
-        "imageUrl": "https://images.unsplash.com/photo-1455390582262-044cdead277a?auto=format&fit=crop&w=1200&q=80",
-    },
-    {
-        "id": "booklet-a5",
-        "slug": "fuzet-a5",
-        "name": "Füzet A5",
-        "description": "Kisebb oldalszámú promóciós füzet.",
-        "product_code": "booklet",
-        "basePrice": 19900,
-        "imageUrl": "https://images.unsplash.com/photo-1512820790803-83ca734da794?auto=format&fit=crop&w=1200&q=80",
-    },
-    {
-        "id": "banner-custom",
-        "slug": "molino-egyedi",
-        "name": "Molinó egyedi méret",
-        "description": "Időjárásálló kültéri reklámfelület.",
-        "product_code": "banner",
-        "basePrice": 12900,
-        "imageUrl": "https://images.unsplash.com/photo-1469474968028-56623f02e42e?auto=format&fit=crop&w=1200&q=80",
-    },
-]
+# (pricing version, encoded body)
+_products_body: tuple[int, EncodedBody] | None = None
+# (catalog format, currency) -> ((pricing version, fx version), encoded body)
+_catalog_bodies: dict[tuple[str, str], tuple[tuple[int, int], EncodedBody]] = {}
 
 
 class ProductPriceRequest(BaseModel):
@@ -148,6 +112,7 @@ class ProductPriceRequest(BaseModel):
     color: str
     qty: int
     lamination: bool = False
+    currency: str = Field(default=BASE_CURRENCY, min_length=3, max_length=3)
 
 
 @app.get("/health")
@@ -156,113 +121,112 @@ def health():
 
 
 @app.get("/products")
-def list_products():
-    return PRINT_PRODUCTS
+def list_products(
+    accept_encoding: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
+    global _products_body
+    catalog = get_product_catalog(get_pricing_snapshot().version)
+    cached = _products_body
+    if cached is None or cached[0] != catalog.version:
+        cached = _products_body = (catalog.version, EncodedBody.from_content(catalog.products).precompress())
+    return cached[1].response(accept_encoding, if_none_match)
 
 
 @app.get("/products/{slug}")
 def product_details(slug: str):
-    product = next((item for item in PRINT_PRODUCTS if item["slug"] == slug), None)
+    product = get_product_catalog(get_pricing_snapshot().version).by_slug.get(slug)
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
 
+def _encode_catalog(snapshot, fx: FxTable, catalog_format: str, currency: str) -> EncodedBody:
+    products = get_product_catalog(snapshot.version).products
+    if currency != BASE_CURRENCY:
+        prices = fx.convert_many([product["basePrice"] for product in products], currency)
+        products = [{**product, "basePrice": price} for product, price in zip(products, prices)]
+    content = build_catalog(snapshot.anchor_rows, snapshot.print_modes, products, catalog_format)
+    content["currency"] = currency
+    return EncodedBody.from_content(content).precompress()
+
+
 @app.get("/catalog")
-def catalog():
-    with Session(engine) as session:
-        return get_catalog(session, PRINT_PRODUCTS)
+async def catalog(
+    catalog_format: str = Query(default="full", alias="format", pattern="^(full|compact)$"),
+    currency: str = Query(default=BASE_CURRENCY, min_length=3, max_length=3),
+    accept_encoding: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
+    # Encoded and compressed once per pricing and rate version, not once per request.
+    snapshot = await load_pricing_snapshot()
+    fx = await load_fx_table()
+    currency = currency.upper()
+    version = (snapshot.version, fx.version)
+    cached = _catalog_bodies.get((catalog_format, currency))
+    if cached is None or cached[0] != version:
+        try:
+            body = await run_in_threadpool(_encode_catalog, snapshot, fx, catalog_format, currency)
+        except UnsupportedCurrency as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        cached = _catalog_bodies[(catalog_format, currency)] = (version, body)
+    return cached[1].response(accept_encoding, if_none_match)
 
 
 @app.post("/price/calculate", response_model=QuoteResponse)
-def price_calculate(payload: ProductPriceRequest):
-    with Session(engine) as session:
-        resolved_qty, anchor = calculate_anchor_quote(
-            session,
-            product_code=payload.product_code,
-            size_key=payload.size,
-            material_code=payload.paper,
-            qty=payload.qty,
-        )
-
-    breakdown = [
-        BreakdownItem(
-            label=f"Anchor - {payload.product_code} / {payload.size} / {resolved_qty} db",
-            amount=anchor,
-        )
-    ]
-    total = anchor
-
-    if payload.paper == "170g":
-        total += SURCHARGE_PAPER_170G
-        breakdown.append(BreakdownItem(label="Papír felár: 170g", amount=SURCHARGE_PAPER_170G))
-
-    if payload.color == "4+0":
-        total += SURCHARGE_COLOR_4_0
-        breakdown.append(BreakdownItem(label="Szín felár: 4+0", amount=SURCHARGE_COLOR_4_0))
-    elif payload.color == "4+4":
-        total += SURCHARGE_COLOR_4_4
-        breakdown.append(BreakdownItem(label="Szín felár: 4+4", amount=SURCHARGE_COLOR_4_4))
-
-    if payload.lamination:
-        total += SURCHARGE_LAMINATION
-        breakdown.append(BreakdownItem(label="Fóliázás felár", amount=SURCHARGE_LAMINATION))
-
-    if total < MIN_PRICE:
-        adjust = MIN_PRICE - total
-        total = MIN_PRICE
-        breakdown.append(BreakdownItem(label="Minimum ár korrekció", amount=adjust))
-
-    return QuoteResponse(final_price=total, currency="HUF", breakdown=breakdown)
+async def price_calculate(payload: ProductPriceRequest):
+    snapshot = await load_pricing_snapshot()
+    result = calculate_anchor_price(
+        snapshot,
+        product_code=payload.product_code,
+        size=payload.size,
+        paper=payload.paper,
+        color=payload.color,
+        qty=payload.qty,
+        lamination=payload.lamination,
+    )
+    currency = payload.currency.upper()
+    if currency != BASE_CURRENCY:
+        try:
+            result = (await load_fx_table()).convert_quote(result, currency)
+        except UnsupportedCurrency as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return PrevalidatedJSONResponse(result)
 
 
 @app.post("/quote/calculate", response_model=QuoteResponse)
-def quote_calculate(payload: QuoteRequest):
+async def quote_calculate(payload: QuoteRequest):
+    snapshot = await load_pricing_snapshot()
+    fx = await load_fx_table()
     try:
-        final_price, breakdown = calculate_quote(payload)
+        body = quote_response_bytes(snapshot, payload, fx)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    return QuoteResponse(final_price=final_price, currency="HUF", breakdown=breakdown)
+    return Response(body, media_type="application/json")
 
 
 @app.post("/quote", response_model=QuoteCreateResponse)
-def create_quote(payload: QuoteCreateRequest):
-    order = create_order(payload.model_dump())
-    return QuoteCreateResponse(message="Ajánlatkérés rögzítve", id=order["id"])
-
-
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    original_name = file.filename or "unknown"
-    content_type = file.content_type or "application/octet-stream"
-    extension = Path(original_name).suffix.lower()
-
-    if content_type not in ALLOWED_MIME_TYPES and extension not in ALLOWED_EXTENSIONS:
-        raise HTTPException(status_code=400, detail="Csak PDF/JPG/PNG engedélyezett")
-
-    content = await file.read()
-    size = len(content)
-
-    if size > MAX_UPLOAD_SIZE:
-        raise HTTPException(status_code=400, detail="Túl nagy fájl (max 20MB)")
-
-    if extension not in ALLOWED_EXTENSIONS:
-        extension = {
-            "application/pdf": ".pdf",
-            "image/jpeg": ".jpg",
-            "image/png": ".png",
-        }.get(content_type, "")
-
-    file_id = str(uuid.uuid4())
-    stored_name = f"{file_id}{extension}"
-    (UPLOAD_DIR / stored_name).write_bytes(content)
-
-    return {
-        "fileId": file_id,
-        "originalName": original_name,
-        "storedName": stored_name,
-        "size": size,
-        "contentType": content_type,
-        "url": f"/uploads/{stored_name}",
-    }
+def create_quote(payload: QuoteCreateRequest, idempotency_key: str | None = Header(default=None, max_length=200)):
+    # The cart page sends one key per submission, so its retries never create a second order.
+    try:
+        return run_idempotent("quote", idempotency_key, payload, lambda: _create_quote(payload))
+    except IdempotencyConflict as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+
+
+def _create_quote(payload: QuoteCreateRequest) -> QuoteCreateResponse:
+    data = payload.model_dump()
+    try:
+        snapshot = get_pricing_snapshot()
+        codes_by_slug = get_product_catalog(snapshot.version).codes_by_slug
+        items, total = reprice_items(data["items"], codes_by_slug, snapshot)
+    except CartPricingError as exc:
+        raise HTTPException(
+            status_code=400, detail=f"Érvénytelen tétel a kosárban: {'; '.join(exc.problems)}"
+        ) from exc
+
+    # The server price is authoritative; the client's figure is kept for reference.
+    data.update(items=items, totalFt=total, clientTotalFt=data["totalFt"])
+    order = create_order(data)
+    return QuoteCreateResponse(message="Ajánlatkérés rögzítve", id=order["id"], totalFt=total)
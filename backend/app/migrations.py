@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    Engine,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    UniqueConstraint,
+    inspect,
+    text,
+)
+from sqlmodel import SQLModel
+
+MIGRATIONS_TABLE = "schema_migrations"
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_PAUSE_SECONDS = 0.01
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    # Schema step: runs in one short transaction and must be idempotent.
+    apply: Callable[[Connection], None]
+    # Optional backfill step: processes one batch per call and returns the number
+    # of rows touched; the runner commits and pauses between batches until it returns 0.
+    backfill: Callable[[Connection, int], int] | None = None
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str, backfill: Callable[[Connection, int], int] | None = None):
+    def register(func: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        MIGRATIONS.append(Migration(version=version, name=name, apply=func, backfill=backfill))
+        MIGRATIONS.sort(key=lambda item: item.version)
+        return func
+
+    return register
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(item["name"] == column for item in inspect(conn).get_columns(table))
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl_type: str) -> None:
+    # SQLite ADD COLUMN only rewrites the schema row, so it does not lock the table for long.
+    if not has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _backfill_updated_at(table: str) -> Callable[[Connection, int], int]:
+    def run(conn: Connection, batch_size: int) -> int:
+        result = conn.execute(
+            text(
+                f"UPDATE {table} SET updated_at = created_at "
+                f"WHERE id IN (SELECT id FROM {table} WHERE updated_at IS NULL LIMIT :limit)"
+            ),
+            {"limit": batch_size},
+        )
+        return int(result.rowcount or 0)
+
+    return run
+
+
+# The tables as the first release created them. Frozen here rather than taken from
+# the models, so a fresh database goes through the same steps as an upgraded one.
+_BASELINE = MetaData()
+Table(
+    "anchor_prices",
+    _BASELINE,
+    Column("id", Integer, primary_key=True),
+    Column("product_code", String, nullable=False, index=True),
+    Column("material_code", String, nullable=False, index=True),
+    Column("size_key", String, nullable=False, index=True),
+    Column("anchor_qty", Integer, nullable=False, index=True),
+    Column("anchor_price", Float, nullable=False),
+    Column("currency", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    UniqueConstraint("product_code", "material_code", "size_key", "anchor_qty", name="uq_anchor_price_key"),
+)
+Table(
+    "print_sheets",
+    _BASELINE,
+    Column("id", Integer, primary_key=True),
+    Column("code", String, nullable=False, index=True, unique=True),
+    Column("width_mm", Integer, nullable=False),
+    Column("height_mm", Integer, nullable=False),
+    Column("printable_width_mm", Integer, nullable=False),
+    Column("printable_height_mm", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+Table(
+    "sheet_prices",
+    _BASELINE,
+    Column("id", Integer, primary_key=True),
+    Column("sheet_code", String, nullable=False, index=True),
+    Column("print_mode", String, nullable=False),
+    Column("base_price_per_sheet", Integer, nullable=False),
+    Column("setup_fee", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    UniqueConstraint("sheet_code", "print_mode", name="uq_sheet_price_mode"),
+)
+Table(
+    "product_specs",
+    _BASELINE,
+    Column("id", Integer, primary_key=True),
+    Column("product_code", String, nullable=False, index=True),
+    Column("finished_w_mm", Integer, nullable=False),
+    Column("finished_h_mm", Integer, nullable=False),
+    Column("bleed_mm", Integer, nullable=False),
+    Column("default_sheet_code", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    UniqueConstraint("product_code", "finished_w_mm", "finished_h_mm", name="uq_product_spec_size"),
+)
+
+
+@migration(1, "baseline")
+def _baseline(conn: Connection) -> None:
+    _BASELINE.create_all(conn)
+
+
+@migration(2, "anchor_prices_updated_at", backfill=_backfill_updated_at("anchor_prices"))
+def _anchor_prices_updated_at(conn: Connection) -> None:
+    add_column_if_missing(conn, "anchor_prices", "updated_at", "DATETIME")
+
+
+@migration(3, "product_specs_updated_at", backfill=_backfill_updated_at("product_specs"))
+def _product_specs_updated_at(conn: Connection) -> None:
+    add_column_if_missing(conn, "product_specs", "updated_at", "DATETIME")
+
+
+@migration(4, "orders_and_pricing_state")
+def _orders_and_pricing_state(conn: Connection) -> None:
+    from .models import Order, PricingState
+
+    SQLModel.metadata.create_all(conn, tables=[Order.__table__, PricingState.__table__])
+    conn.execute(text("INSERT OR IGNORE INTO pricing_state (id, version) VALUES (1, 1)"))
+
+
+@migration(5, "orders_client_total_ft")
+def _orders_client_total_ft(conn: Connection) -> None:
+    add_column_if_missing(conn, "orders", "client_total_ft", "FLOAT")
+
+
+@migration(6, "order_stats")
+def _order_stats(conn: Connection) -> None:
+    from .models import OrderStat
+    from .order_stats import add_order, apply_deltas, new_deltas
+
+    SQLModel.metadata.create_all(conn, tables=[OrderStat.__table__])
+    # Rebuilt from scratch so rerunning after a partial failure cannot double count.
+    conn.execute(text("DELETE FROM order_stats"))
+    deltas = new_deltas()
+    rows = conn.execute(text("SELECT created_at, status, total_ft, items FROM orders"))
+    for created_at, status, total_ft, items in rows:
+        add_order(deltas, created_at, status, total_ft, json.loads(items or "[]"))
+    apply_deltas(conn, deltas)
+
+
+@migration(7, "order_changes")
+def _order_changes(conn: Connection) -> None:
+    from .models import OrderChange
+
+    SQLModel.metadata.create_all(conn, tables=[OrderChange.__table__])
+
+
+# Orders the stored_files backfill still has to count, as rowids (after, until].
+# The schema step resets it; orders created later reference their files themselves.
+_stored_files_backfill = {"after": 0, "until": 0}
+
+
+def _backfill_stored_files(conn: Connection, batch_size: int) -> int:
+    from .storage import order_file_ids, reference_uploads
+
+    rows = conn.execute(
+        text(
+            "SELECT rowid, items FROM orders WHERE rowid > :after AND rowid <= :until "
+            "ORDER BY rowid LIMIT :limit"
+        ),
+        {**_stored_files_backfill, "limit": batch_size},
+    ).all()
+    file_ids: list[str] = []
+    for _, items in rows:
+        file_ids.extend(order_file_ids(json.loads(items or "[]")))
+    # Looks up each referenced file on disk; unreferenced uploads are left to the
+    # sweeper's incremental walk rather than listing the whole directory here.
+    if file_ids:
+        reference_uploads(conn, file_ids)
+    if rows:
+        _stored_files_backfill["after"] = rows[-1][0]
+    return len(rows)
+
+
+@migration(8, "stored_files", backfill=_backfill_stored_files)
+def _stored_files(conn: Connection) -> None:
+    from .models import StorageUsage, StoredFile
+
+    SQLModel.metadata.create_all(conn, tables=[StoredFile.__table__, StorageUsage.__table__])
+    # Rebuilt from scratch so rerunning after a partial failure cannot double count.
+    conn.execute(text("DELETE FROM stored_files"))
+    conn.execute(text("DELETE FROM storage_usage"))
+    until = conn.execute(text("SELECT COALESCE(MAX(rowid), 0) FROM orders")).scalar_one()
+    _stored_files_backfill.update(after=0, until=int(until))
+
+
+@migration(9, "products")
+def _products(conn: Connection) -> None:
+    from .models import Product
+
+    # Rows come from seed_products at startup, like the other seed data.
+    SQLModel.metadata.create_all(conn, tables=[Product.__table__])
+
+
+@migration(10, "fx_rates")
+def _fx_rates(conn: Connection) -> None:
+    from .models import FxRate
+
+    SQLModel.metadata.create_all(conn, tables=[FxRate.__table__])
+
+
+@migration(11, "idempotency_keys")
+def _idempotency_keys(conn: Connection) -> None:
+    from .models import IdempotencyRecord
+
+    SQLModel.metadata.create_all(conn, tables=[IdempotencyRecord.__table__])
+
+
+@migration(12, "anchor_price_history")
+def _anchor_price_history(conn: Connection) -> None:
+    from .models import AnchorPriceHistory
+
+    SQLModel.metadata.create_all(conn, tables=[AnchorPriceHistory.__table__])
+    # Earlier values were overwritten in place; history starts from each anchor's
+    # current price as of its last update.
+    conn.execute(
+        text(
+            """
+            INSERT INTO anchor_price_history
+                (anchor_id, action, pricing_version, changed_at,
+                 product_code, material_code, size_key, anchor_qty, anchor_price)
+            SELECT id, 'create', (SELECT COALESCE(MAX(version), 0) FROM pricing_state),
+                   COALESCE(updated_at, created_at),
+                   product_code, material_code, size_key, anchor_qty, anchor_price
+            FROM anchor_prices
+            ORDER BY id
+            """
+        )
+    )
+
+
+
+@migration(13, "stored_files_protected")
+def _stored_files_protected(conn: Connection) -> None:
+    add_column_if_missing(conn, "stored_files", "protected", "BOOLEAN NOT NULL DEFAULT 0")
+    # Unreferenced files the walk already registered may predate the index; keep
+    # them until an admin has looked at them.
+    conn.execute(text("UPDATE stored_files SET protected = 1 WHERE ref_count = 0 AND owner_key IS NULL"))
+
+
+@migration(14, "backup_markers")
+def _backup_markers(conn: Connection) -> None:
+    from .models import BackupMarker
+
+    SQLModel.metadata.create_all(conn, tables=[BackupMarker.__table__])
+
+def _ensure_migrations_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+                "version INTEGER PRIMARY KEY, "
+                "name VARCHAR NOT NULL, "
+                "applied_at DATETIME NOT NULL)"
+            )
+        )
+
+
+def applied_versions(engine: Engine) -> dict[int, str]:
+    _ensure_migrations_table(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT version, applied_at FROM {MIGRATIONS_TABLE}")).all()
+    return {int(row[0]): str(row[1]) for row in rows}
+
+
+def _run_backfill(
+    engine: Engine,
+    item: Migration,
+    batch_size: int,
+    pause_seconds: float,
+) -> int:
+    total = 0
+    while True:
+        # One transaction per batch keeps write locks short so quotes keep flowing.
+        with engine.begin() as conn:
+            touched = item.backfill(conn, batch_size)
+        total += touched
+        if touched < batch_size:
+            return total
+        time.sleep(pause_seconds)
+
+
+def run_migrations(
+    engine: Engine,
+    target: int | None = None,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    pause_seconds: float = BACKFILL_PAUSE_SECONDS,
+) -> list[int]:
+    done = applied_versions(engine)
+    applied: list[int] = []
+
+    for item in MIGRATIONS:
+        if target is not None and item.version > target:
+            break
+        if item.version in done:
+            continue
+
+        with engine.begin() as conn:
+            item.apply(conn)
+
+        if item.backfill is not None:
+            _run_backfill(engine, item, batch_size, pause_seconds)
+
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"INSERT OR IGNORE INTO {MIGRATIONS_TABLE} (version, name, applied_at) "
+                    "VALUES (:version, :name, :applied_at)"
+                ),
+                {"version": item.version, "name": item.name, "applied_at": datetime.utcnow()},
+            )
+        applied.append(item.version)
+
+    return applied
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    upgrade = sub.add_parser("upgrade", help="apply pending migrations")
+    upgrade.add_argument("--target", type=int, default=None)
+    upgrade.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    upgrade.add_argument("--pause", type=float, default=BACKFILL_PAUSE_SECONDS)
+
+    sub.add_parser("status", help="list migrations and their state")
+
+    args = parser.parse_args(argv)
+
+    from .db import engine, startup_lock
+
+    if args.command == "upgrade":
+        with startup_lock():
+            applied = run_migrations(
+                engine,
+                target=args.target,
+                batch_size=args.batch_size,
+                pause_seconds=args.pause,
+            )
+        print(f"Applied: {applied}" if applied else "Nothing to apply")
+        return
+
+    done = applied_versions(engine)
+    for item in MIGRATIONS:
+        state = f"applied {done[item.version]}" if item.version in done else "pending"
+        print(f"{item.version:04d} {item.name}: {state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
+from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import JSON, Column, Index, LargeBinary, UniqueConstraint
 from sqlmodel import Field as SQLField
 from sqlmodel import SQLModel
 
@@ -11,6 +12,12 @@ Paper = Literal["130g", "170g"]
 Color = Literal["1+0", "4+0", "4+4"]
 Qty = Literal[100, 250, 500, 1000]
 
+FLYER_SIZE_MM: dict[str, tuple[int, int]] = {
+    "A6": (105, 148),
+    "A5": (148, 210),
+    "A4": (210, 297),
+}
+
 
 class QuoteRequest(BaseModel):
     product: Literal["flyer"] = "flyer"
@@ -19,19 +26,35 @@ class QuoteRequest(BaseModel):
     color: Color
     qty: Qty
     lamination: bool = False
+    currency: str = Field(default="HUF", min_length=3, max_length=3)
 
 
 class BreakdownItem(BaseModel):
     label: str
-    amount: int
+    amount: float
 
 
 class QuoteResponse(BaseModel):
-    final_price: int
-    currency: Literal["HUF"] = "HUF"
+    # Whole forints for HUF; other currencies carry that currency's decimals.
+    final_price: float
+    currency: str = "HUF"
     breakdown: List[BreakdownItem] = Field(default_factory=list)
 
 
+@dataclass(slots=True, frozen=True)
+class PriceLine:
+    # Internal breakdown row; same JSON shape as BreakdownItem without pydantic validation.
+    label: str
+    amount: int | float
+
+
+@dataclass(slots=True, frozen=True)
+class QuoteResult:
+    final_price: int | float
+    currency: str
+    breakdown: tuple[PriceLine, ...]
+
+
 class AnchorPrice(SQLModel, table=True):
     __tablename__ = "anchor_prices"
     __table_args__ = (
@@ -52,6 +75,30 @@ class AnchorPrice(SQLModel, table=True):
     anchor_price: float
     currency: str = SQLField(default="HUF")
     created_at: datetime = SQLField(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = SQLField(default_factory=datetime.utcnow)
+
+
+class AnchorPriceHistory(SQLModel, table=True):
+    __tablename__ = "anchor_price_history"
+    __table_args__ = (
+        Index("ix_anchor_price_history_anchor", "anchor_id", "seq"),
+        Index("ix_anchor_price_history_group", "product_code", "material_code", "size_key", "changed_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq: Optional[int] = SQLField(default=None, primary_key=True)
+    anchor_id: int
+    # "create", "update" or "delete"
+    action: str
+    pricing_version: int = 0
+    changed_at: datetime = SQLField(default_factory=datetime.utcnow)
+    # The group key is kept on every create/update row so as-of lookups can find
+    # the anchors of a group; quantity and price only when they changed.
+    product_code: Optional[str] = None
+    material_code: Optional[str] = None
+    size_key: Optional[str] = None
+    anchor_qty: Optional[int] = None
+    anchor_price: Optional[float] = None
 
 
 class PrintSheet(SQLModel, table=True):
@@ -98,3 +145,129 @@ class ProductSpec(SQLModel, table=True):
     bleed_mm: int = 3
     default_sheet_code: str = "SRA3"
     created_at: datetime = SQLField(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = SQLField(default_factory=datetime.utcnow)
+
+
+class Product(SQLModel, table=True):
+    __tablename__ = "products"
+
+    id: str = SQLField(primary_key=True)
+    slug: str = SQLField(index=True, unique=True)
+    product_code: str = SQLField(index=True)
+    name: str
+    description: str = ""
+    base_price: int = 0
+    image_url: str = ""
+    # When set, the catalog offers only this size, whatever size keys the anchors use.
+    fixed_size: Optional[str] = None
+    sort_order: int = 0
+    active: bool = True
+    updated_at: datetime = SQLField(default_factory=datetime.utcnow)
+
+
+class FxRate(SQLModel, table=True):
+    __tablename__ = "fx_rates"
+
+    currency: str = SQLField(primary_key=True)
+    # Base currency (HUF) per one unit of this currency.
+    rate: float
+    decimals: int = 2
+    # Table-wide version is max(version); every write takes the next number.
+    version: int = SQLField(default=0, index=True)
+    updated_at: datetime = SQLField(default_factory=datetime.utcnow)
+
+
+class PricingState(SQLModel, table=True):
+    __tablename__ = "pricing_state"
+
+    id: Optional[int] = SQLField(default=None, primary_key=True)
+    version: int = 0
+
+
+class Order(SQLModel, table=True):
+    __tablename__ = "orders"
+
+    id: str = SQLField(primary_key=True)
+    created_at: datetime = SQLField(default_factory=datetime.utcnow, index=True)
+    client_created_at: Optional[str] = None
+    customer: dict = SQLField(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    items: list = SQLField(default_factory=list, sa_column=Column(JSON, nullable=False))
+    total_ft: float = 0
+    client_total_ft: Optional[float] = None
+    status: str = SQLField(default="Beérkezett", index=True)
+    admin_note: Optional[str] = None
+    # Lowercased id/name/email/phone so the admin search is a single LIKE.
+    search_text: str = ""
+
+
+class OrderStat(SQLModel, table=True):
+    __tablename__ = "order_stats"
+
+    # metric is "total", "status", "day" or "product"; bucket is the key within it.
+    metric: str = SQLField(primary_key=True)
+    bucket: str = SQLField(primary_key=True)
+    count: int = 0
+    revenue_ft: float = 0
+
+
+class OrderChange(SQLModel, table=True):
+    __tablename__ = "order_changes"
+    # AUTOINCREMENT keeps sequence numbers strictly increasing, never reused.
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Optional[int] = SQLField(default=None, primary_key=True)
+    order_id: str = SQLField(index=True)
+    # "created", "status" or "adminNote"
+    kind: str
+    value: Optional[str] = None
+    changed_at: datetime = SQLField(default_factory=datetime.utcnow)
+
+
+class StoredFile(SQLModel, table=True):
+    __tablename__ = "stored_files"
+    # Serves the orphan sweep: unreferenced files, oldest first.
+    __table_args__ = (Index("ix_stored_files_orphans", "ref_count", "created_at"),)
+
+    file_id: str = SQLField(primary_key=True)
+    stored_name: str
+    size: int = 0
+    # Client address of the uploader; None for files found on disk by the sweep.
+    owner_key: Optional[str] = None
+    # Number of orders whose items point at this file.
+    ref_count: int = 0
+    # Found on disk by the walk with no record of its origin (e.g. uploads from before
+    # the index existed); never swept until an admin releases it.
+    protected: bool = False
+    created_at: datetime = SQLField(default_factory=datetime.utcnow)
+
+
+class StorageUsage(SQLModel, table=True):
+    __tablename__ = "storage_usage"
+
+    # "" holds the totals across all owners.
+    owner_key: str = SQLField(primary_key=True)
+    files: int = 0
+    bytes: int = 0
+    unreferenced_bytes: int = 0
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+
+    # Route the key was used on; the same key may be reused on another route.
+    scope: str = SQLField(primary_key=True)
+    key: str = SQLField(primary_key=True)
+    request_hash: str
+    # 0 while the first request is still executing.
+    status_code: int = 0
+    body: bytes = SQLField(default=b"", sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = SQLField(default_factory=datetime.utcnow, index=True)
+
+
+class BackupMarker(SQLModel, table=True):
+    __tablename__ = "backup_markers"
+
+    # Name of a backup file, written to the live database just before the copy is
+    # taken; the newest one says which backup this database already contains.
+    name: str = SQLField(primary_key=True)
+    created_at: datetime = SQLField(default_factory=datetime.utcnow)
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+ORDER_LOG_DIR = Path(os.getenv("ORDER_LOG_DIR", "./order_log"))
+# How long the writer waits to gather more appends into one fsync.
+ORDER_LOG_FSYNC_WINDOW_SECONDS = float(os.getenv("ORDER_LOG_FSYNC_WINDOW_SECONDS", "0.002"))
+ORDER_LOG_SEGMENT_MAX_BYTES = int(os.getenv("ORDER_LOG_SEGMENT_MAX_BYTES", str(8 * 1024 * 1024)))
+MATERIALIZE_BATCH_SIZE = 500
+# Failed batches are retried this many times before records are tried one by one.
+MATERIALIZE_MAX_ATTEMPTS = 5
+# Records that cannot be materialized end up here for manual recovery. Not a
+# .jsonl name, so replay_segments never picks it up.
+DEAD_LETTER_NAME = "dead-letter.ndjson"
+
+logger = logging.getLogger(__name__)
+
+Materializer = Callable[[list[dict[str, Any]]], None]
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+else:
+    import fcntl
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+
+def _read_segment(fd: int) -> list[dict[str, Any]]:
+    # Reads through the locked descriptor; Windows byte-range locks are per handle.
+    chunks = []
+    while True:
+        chunk = os.read(fd, 1024 * 1024)
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+    records = []
+    for line in b"".join(chunks).splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # Torn final line from a crash mid-write; it was never acknowledged.
+            break
+    return records
+
+
+def replay_segments(materialize: Materializer, directory: Path = ORDER_LOG_DIR) -> int:
+    # Segments whose lock can be taken belong to dead processes: materialize and drop them.
+    if not directory.exists():
+        return 0
+
+    replayed = 0
+    for entry in sorted(os.scandir(directory), key=lambda item: item.name):
+        if not entry.name.endswith(".jsonl"):
+            continue
+        fd = os.open(entry.path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            if not _try_lock(fd):
+                continue
+            records = _read_segment(fd)
+            for start in range(0, len(records), MATERIALIZE_BATCH_SIZE):
+                materialize(records[start : start + MATERIALIZE_BATCH_SIZE])
+            replayed += len(records)
+        finally:
+            os.close(fd)
+        os.unlink(entry.path)
+    return replayed
+
+
+class OrderLog:
+    def __init__(self, materialize: Materializer, directory: Path = ORDER_LOG_DIR) -> None:
+        self._materialize = materialize
+        self._directory = directory
+        self._cond = threading.Condition()
+        self._appends: list[bytes] = []
+        self._appended_tickets = 0
+        self._synced_tickets = 0
+        self._to_materialize: deque[dict[str, Any]] = deque()
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._segment: Path | None = None
+        self._fd = -1
+        self._written = 0
+        self._unmaterialized = 0
+        self._closing = False
+        self._failed: Exception | None = None
+        self._writer = threading.Thread(target=self._write_loop, name="order-log-writer", daemon=True)
+        self._consumer = threading.Thread(target=self._consume_loop, name="order-log-consumer", daemon=True)
+
+    def start(self) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._open_segment()
+        self._writer.start()
+        self._consumer.start()
+
+    def _open_segment(self) -> None:
+        name = f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+        self._segment = self._directory / name
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._fd = os.open(self._segment, flags, 0o644)
+        # Held for the life of the segment so replay_segments in other workers skips it.
+        _try_lock(self._fd)
+        self._written = 0
+
+    def _roll_segment(self) -> None:
+        old_fd, old_segment = self._fd, self._segment
+        self._open_segment()
+        os.close(old_fd)
+        if old_segment is not None:
+            old_segment.unlink(missing_ok=True)
+
+    def append(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._cond:
+            if self._closing or self._failed is not None:
+                raise RuntimeError("Order log is not accepting writes") from self._failed
+            self._appends.append(line)
+            self._pending[record["id"]] = record
+            self._to_materialize.append(record)
+            self._appended_tickets += 1
+            ticket = self._appended_tickets
+            self._cond.notify_all()
+            # Returns once the batch holding this record is fsynced; the DB write happens later.
+            while self._synced_tickets < ticket:
+                if self._failed is not None:
+                    raise RuntimeError("Order log write failed") from self._failed
+                self._cond.wait()
+
+    def pending(self, order_id: str) -> dict[str, Any] | None:
+        with self._cond:
+            return self._pending.get(order_id)
+
+    def _write_loop(self) -> None:
+        try:
+            self._write_batches()
+        except Exception as exc:
+            with self._cond:
+                self._failed = exc
+                self._cond.notify_all()
+
+    def _write_batches(self) -> None:
+        while True:
+            with self._cond:
+                while not self._appends and not self._closing:
+                    self._cond.wait()
+                if not self._appends and self._closing:
+                    return
+            time.sleep(ORDER_LOG_FSYNC_WINDOW_SECONDS)
+            with self._cond:
+                batch, self._appends = self._appends, []
+                ticket = self._appended_tickets
+                if self._written >= ORDER_LOG_SEGMENT_MAX_BYTES and self._unmaterialized == 0:
+                    self._roll_segment()
+
+            data = b"".join(batch)
+            os.write(self._fd, data)
+            os.fsync(self._fd)
+
+            with self._cond:
+                self._written += len(data)
+                self._unmaterialized += len(batch)
+                self._synced_tickets = ticket
+                self._cond.notify_all()
+
+    def _dead_letter(self, record: dict[str, Any], exc: Exception) -> None:
+        entry = {"failedAt": datetime.utcnow().isoformat(), "error": repr(exc), "record": record}
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        fd = os.open(self._directory / DEAD_LETTER_NAME, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        logger.error("Order %s could not be materialized, moved to %s: %r", record.get("id"), DEAD_LETTER_NAME, exc)
+
+    def _materialize_isolated(self, batch: list[dict[str, Any]], give_up: bool) -> bool:
+        # One record at a time, so a bad record cannot hold back the ones behind it.
+        # Returns False when nothing went through, which looks like the database
+        # rather than the data; then only the head record is given up, and only
+        # once give_up says the retries are exhausted.
+        failed: list[tuple[dict[str, Any], Exception]] = []
+        for record in batch:
+            try:
+                self._materialize([record])
+            except Exception as exc:
+                failed.append((record, exc))
+        if len(failed) < len(batch):
+            for record, exc in failed:
+                self._dead_letter(record, exc)
+            return True
+        if give_up:
+            self._dead_letter(*failed[0])
+        return False
+
+    def _consume_loop(self) -> None:
+        attempts = 0
+        while True:
+            with self._cond:
+                # The first _unmaterialized queued records are the ones already fsynced.
+                while self._unmaterialized == 0:
+                    if self._closing and not self._writer.is_alive():
+                        return
+                    self._cond.wait(timeout=0.5)
+                count = min(self._unmaterialized, MATERIALIZE_BATCH_SIZE)
+                batch = [self._to_materialize[index] for index in range(count)]
+
+            try:
+                self._materialize(batch)
+                attempts = 0
+            except Exception:
+                if self._closing:
+                    # Left in the segment; the next startup replays it.
+                    return
+                attempts += 1
+                if attempts < MATERIALIZE_MAX_ATTEMPTS:
+                    time.sleep(1.0)
+                    continue
+                give_up = attempts >= 2 * MATERIALIZE_MAX_ATTEMPTS
+                if not self._materialize_isolated(batch, give_up):
+                    if not give_up:
+                        time.sleep(1.0)
+                        continue
+                    batch = batch[:1]
+                attempts = 0
+
+            with self._cond:
+                for _ in batch:
+                    record = self._to_materialize.popleft()
+                    self._pending.pop(record["id"], None)
+                self._unmaterialized -= len(batch)
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._consumer.join()
+        os.close(self._fd)
+        if self._segment is not None and not self._to_materialize:
+            self._segment.unlink(missing_ok=True)
+
+
+_log: OrderLog | None = None
+
+
+def start_order_log(materialize: Materializer) -> OrderLog:
+    global _log
+    if _log is None:
+        _log = OrderLog(materialize)
+        _log.start()
+    return _log
+
+
+def stop_order_log() -> None:
+    global _log
+    if _log is not None:
+        _log.close()
+        _log = None
+
+
+def get_order_log() -> OrderLog | None:
+    return _log
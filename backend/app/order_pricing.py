@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from typing import Any, Mapping
+
+from .models import QuoteResult
+from .price_snapshot import PricingSnapshot
+from .pricing import calculate_anchor_price
+
+LAMINATION_EXTRA = "Fóliázás"
+LINE_CACHE_MAX_ENTRIES = 4096
+
+LineKey = tuple[str, str, str, str, int, bool]
+
+# Keyed by (pricing version, line key) so a concurrent version bump never mixes prices.
+_line_cache: dict[tuple[int, LineKey], QuoteResult | str] = {}
+
+
+class CartPricingError(ValueError):
+    def __init__(self, problems: list[str]) -> None:
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+def normalize_item(item: dict[str, Any], product_codes: Mapping[str, str]) -> LineKey:
+    selections = item.get("selections") or {}
+    product_code = product_codes.get(str(item.get("productSlug", "")))
+    if product_code is None:
+        raise ValueError("ismeretlen termék")
+
+    try:
+        qty = int(selections.get("quantity"))
+    except (TypeError, ValueError):
+        raise ValueError("hiányzó mennyiség") from None
+
+    size = str(selections.get("size") or "").strip()
+    paper = str(selections.get("paper") or "").strip()
+    color = str(selections.get("color") or "").strip()
+    if not size or not paper or not color:
+        raise ValueError("hiányzó méret, papír vagy szín")
+
+    lamination = LAMINATION_EXTRA in (selections.get("extras") or [])
+    return product_code, size, paper, color, qty, lamination
+
+
+def _cached_line_price(snapshot: PricingSnapshot, key: LineKey) -> QuoteResult | str:
+    cache_key = (snapshot.version, key)
+    cached = _line_cache.get(cache_key)
+    if cached is None:
+        if len(_line_cache) >= LINE_CACHE_MAX_ENTRIES:
+            _line_cache.clear()
+        product_code, size, paper, color, qty, lamination = key
+        try:
+            cached = calculate_anchor_price(snapshot, product_code, size, paper, color, qty, lamination)
+        except ValueError as exc:
+            cached = str(exc)
+        _line_cache[cache_key] = cached
+    return cached
+
+
+def reprice_items(
+    items: list[dict[str, Any]],
+    product_codes: Mapping[str, str],
+    snapshot: PricingSnapshot,
+) -> tuple[list[dict[str, Any]], int]:
+    # One pass over the cart against a single snapshot; identical lines hit the cache.
+    repriced: list[dict[str, Any]] = []
+    problems: list[str] = []
+    total = 0
+
+    for index, item in enumerate(items, start=1):
+        try:
+            key = normalize_item(item, product_codes)
+        except ValueError as exc:
+            problems.append(f"#{index}: {exc}")
+            continue
+
+        result = _cached_line_price(snapshot, key)
+        if isinstance(result, str):
+            problems.append(f"#{index}: nincs ár ehhez a kombinációhoz")
+            continue
+
+        repriced.append(
+            {
+                **item,
+                "productCode": key[0],
+                "clientLineTotalFt": item.get("lineTotalFt"),
+                "unitPriceFt": result.final_price,
+                "lineTotalFt": result.final_price,
+            }
+        )
+        total += result.final_price
+
+    if problems:
+        raise CartPricingError(problems)
+
+    return repriced, total
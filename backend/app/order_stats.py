@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable
+
+from sqlalchemy import Connection
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+
+from .models import OrderStat
+
+StatKey = tuple[str, str]
+# (metric, bucket) -> [count, revenue_ft]
+StatDeltas = dict[StatKey, list[float]]
+
+
+def new_deltas() -> StatDeltas:
+    return defaultdict(lambda: [0, 0.0])
+
+
+def _day(created_at: datetime | str) -> str:
+    if isinstance(created_at, datetime):
+        return created_at.date().isoformat()
+    return str(created_at)[:10]
+
+
+def _product_code(item: dict[str, Any]) -> str:
+    # Orders placed before server-side repricing only carry the slug.
+    return str(item.get("productCode") or item.get("productSlug") or "")
+
+
+def add_order(
+    deltas: StatDeltas,
+    created_at: datetime | str,
+    status: str,
+    total_ft: float,
+    items: Iterable[dict[str, Any]],
+    sign: int = 1,
+) -> None:
+    revenue = sign * float(total_ft or 0)
+    for key in (("total", ""), ("status", status), ("day", _day(created_at))):
+        deltas[key][0] += sign
+        deltas[key][1] += revenue
+
+    for item in items or []:
+        entry = deltas[("product", _product_code(item))]
+        entry[0] += sign
+        entry[1] += sign * float(item.get("lineTotalFt") or 0)
+
+
+def move_status(deltas: StatDeltas, old_status: str, new_status: str, total_ft: float) -> None:
+    if old_status == new_status:
+        return
+    revenue = float(total_ft or 0)
+    deltas[("status", old_status)][0] -= 1
+    deltas[("status", old_status)][1] -= revenue
+    deltas[("status", new_status)][0] += 1
+    deltas[("status", new_status)][1] += revenue
+
+
+def apply_deltas(target: Session | Connection, deltas: StatDeltas) -> None:
+    # Counters are incremented in SQL so concurrent workers never lose an update;
+    # callers run this in the same transaction as the order write.
+    rows = [
+        {"metric": metric, "bucket": bucket, "count": int(count), "revenue_ft": revenue}
+        for (metric, bucket), (count, revenue) in deltas.items()
+        if count or revenue
+    ]
+    if not rows:
+        return
+
+    statement = insert(OrderStat).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["metric", "bucket"],
+        set_={
+            "count": OrderStat.count + statement.excluded.count,
+            "revenue_ft": OrderStat.revenue_ft + statement.excluded.revenue_ft,
+        },
+    )
+    target.execute(statement)
+
+
+def read_order_stats(session: Session, statuses: list[str], days: int = 30) -> dict[str, Any]:
+    since = (date.today() - timedelta(days=max(days, 1) - 1)).isoformat()
+    rows = session.exec(
+        select(OrderStat).where(
+            (OrderStat.metric != "day") | (OrderStat.bucket >= since)
+        )
+    ).all()
+
+    by_metric: dict[str, dict[str, OrderStat]] = defaultdict(dict)
+    for row in rows:
+        by_metric[row.metric][row.bucket] = row
+
+    total = by_metric["total"].get("")
+    total_orders = total.count if total is not None else 0
+    total_revenue = total.revenue_ft if total is not None else 0.0
+
+    by_status = {}
+    for status in statuses:
+        row = by_metric["status"].get(status)
+        by_status[status] = {
+            "count": row.count if row is not None else 0,
+            "revenueFt": row.revenue_ft if row is not None else 0.0,
+        }
+
+    return {
+        "totalOrders": total_orders,
+        "totalRevenueFt": total_revenue,
+        "averageTicketFt": round(total_revenue / total_orders, 2) if total_orders else 0.0,
+        "byStatus": by_status,
+        "revenueByDay": [
+            {"day": day, "count": row.count, "revenueFt": row.revenue_ft}
+            for day, row in sorted(by_metric["day"].items())
+        ],
+        "revenueByProduct": [
+            {"productCode": code, "count": row.count, "revenueFt": row.revenue_ft}
+            for code, row in sorted(by_metric["product"].items())
+        ],
+    }
@@ -1,70 +1,309 @@
 from __future__ import annotations
 
 import uuid
+from datetime import datetime
 from typing import Any
 
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from .db import session_scope
+from .events import notify_order_changes
+from .models import Order, OrderChange
+from .order_log import get_order_log
+from .order_stats import add_order, apply_deltas, move_status, new_deltas, read_order_stats
+from .storage import order_file_ids, reference_uploads
+
 ORDER_STATUS_VALUES = ["Beérkezett", "Gyártás alatt", "Kész", "Átadva", "Elutasítva"]
+ORDER_CHANGES_PAGE_MAX = 1000
+# Bound on ids per IN (...) clause, well below SQLite's variable limit.
+ID_CHUNK_SIZE = 500
+# Rounds of re-reading orders whose status changed under a bulk update.
+STATUS_UPDATE_PASSES = 3
+
+
+def _chunks(values: list[str], size: int = ID_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _search_text(order_id: str, customer: dict[str, Any]) -> str:
+    return "\n".join(
+        str(value).lower()
+        for value in (order_id, customer.get("name", ""), customer.get("email", ""), customer.get("phone", ""))
+    )
+
+
+def _to_dict(order: Order) -> dict[str, Any]:
+    return {
+        "id": order.id,
+        "createdAt": order.client_created_at,
+        "customer": order.customer or {},
+        "items": order.items or [],
+        "totalFt": order.total_ft,
+        "clientTotalFt": order.client_total_ft,
+        "status": order.status,
+        "adminNote": order.admin_note,
+    }
+
+
+def _order_from_record(record: dict[str, Any]) -> Order:
+    customer = record.get("customer", {}) or {}
+    return Order(
+        id=record["id"],
+        created_at=datetime.fromisoformat(record["receivedAt"]),
+        client_created_at=record.get("createdAt"),
+        customer=customer,
+        items=record.get("items", []),
+        total_ft=record.get("totalFt", 0),
+        client_total_ft=record.get("clientTotalFt"),
+        status="Beérkezett",
+        admin_note=None,
+        search_text=_search_text(record["id"], customer),
+    )
 
-_orders: list[dict[str, Any]] = []
+
+def _record_to_dict(record: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": record["id"],
+        "createdAt": record.get("createdAt"),
+        "customer": record.get("customer", {}) or {},
+        "items": record.get("items", []),
+        "totalFt": record.get("totalFt", 0),
+        "clientTotalFt": record.get("clientTotalFt"),
+        "status": "Beérkezett",
+        "adminNote": None,
+    }
+
+
+def materialize_orders(records: list[dict[str, Any]]) -> None:
+    # Idempotent so replaying an order log segment never duplicates orders. The
+    # conflict clause, not a prior lookup, decides: the log consumer and an admin
+    # update materializing the same pending order may run at the same time.
+    orders = {record["id"]: _order_from_record(record) for record in records}
+    with session_scope() as session:
+        inserted = set(
+            session.execute(
+                sqlite_insert(Order)
+                .values([order.model_dump() for order in orders.values()])
+                .on_conflict_do_nothing()
+                .returning(Order.id)
+            ).scalars()
+        )
+        deltas = new_deltas()
+        file_ids: list[str] = []
+        for order_id in inserted:
+            order = orders[order_id]
+            session.add(OrderChange(order_id=order.id, kind="created", value=order.status))
+            add_order(deltas, order.created_at, order.status, order.total_ft, order.items)
+            file_ids.extend(order_file_ids(order.items))
+        session.flush()
+        apply_deltas(session, deltas)
+        reference_uploads(session, file_ids)
+    notify_order_changes()
 
 
 def create_order(payload: dict[str, Any]) -> dict[str, Any]:
-    order = {
+    record = {
         "id": str(uuid.uuid4()),
+        "receivedAt": datetime.utcnow().isoformat(),
         "createdAt": payload.get("createdAt"),
         "customer": payload.get("customer", {}),
         "items": payload.get("items", []),
         "totalFt": payload.get("totalFt", 0),
-        "status": "Beérkezett",
-        "adminNote": None,
+        "clientTotalFt": payload.get("clientTotalFt"),
     }
-    _orders.append(order)
-    return order
+    log = get_order_log()
+    if log is not None:
+        log.append(record)
+    else:
+        materialize_orders([record])
+    return _record_to_dict(record)
 
 
 def list_orders(
     page: int = 1, page_size: int = 20, status: str | None = None, q: str | None = None
 ) -> tuple[list[dict[str, Any]], int]:
-    rows = _orders
+    query = select(Order)
+    count_query = select(func.count()).select_from(Order)
     if status:
-        rows = [row for row in rows if row.get("status") == status]
+        query = query.where(Order.status == status)
+        count_query = count_query.where(Order.status == status)
 
     if q:
-        needle = q.strip().lower()
-
-        def _match(item: dict[str, Any]) -> bool:
-            customer = item.get("customer") or {}
-            return (
-                needle in str(item.get("id", "")).lower()
-                or needle in str(customer.get("name", "")).lower()
-                or needle in str(customer.get("email", "")).lower()
-                or needle in str(customer.get("phone", "")).lower()
-            )
+        needle = q.strip().lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        criteria = Order.search_text.like(f"%{needle}%", escape="\\")
+        query = query.where(criteria)
+        count_query = count_query.where(criteria)
 
-        rows = [item for item in rows if _match(item)]
-
-    total = len(rows)
     page = max(page, 1)
     page_size = max(1, min(page_size, 100))
     start = (page - 1) * page_size
-    end = start + page_size
-    return rows[start:end], total
+
+    with session_scope() as session:
+        total = int(session.exec(count_query).one() or 0)
+        rows = session.exec(
+            query.order_by(Order.created_at, Order.id).offset(start).limit(page_size)
+        ).all()
+        return [_to_dict(row) for row in rows], total
+
+
+def _pending_order(order_id: str) -> dict[str, Any] | None:
+    log = get_order_log()
+    record = log.pending(order_id) if log is not None else None
+    return _record_to_dict(record) if record is not None else None
 
 
 def get_order(order_id: str) -> dict[str, Any] | None:
-    return next((item for item in _orders if item.get("id") == order_id), None)
+    with session_scope() as session:
+        order = session.get(Order, order_id)
+        if order is not None:
+            return _to_dict(order)
+    return _pending_order(order_id)
+
+
+def _materialize_pending(order_ids: list[str]) -> None:
+    # Orders still in the write-behind queue are materialized first so updates land.
+    log = get_order_log()
+    if log is None:
+        return
+    pending = [record for record in map(log.pending, order_ids) if record is not None]
+    if pending:
+        materialize_orders(pending)
 
 
 def update_order(
     order_id: str, status: str | None = None, admin_note: str | None = None
 ) -> dict[str, Any] | None:
-    order = get_order(order_id)
-    if order is None:
-        return None
+    _materialize_pending([order_id])
+
+    with session_scope() as session:
+        order = session.get(Order, order_id)
+        if order is None:
+            return None
+
+        if status is not None and status != order.status:
+            deltas = new_deltas()
+            move_status(deltas, order.status, status, order.total_ft)
+            apply_deltas(session, deltas)
+            order.status = status
+            session.add(OrderChange(order_id=order_id, kind="status", value=status))
+        if admin_note is not None and admin_note != order.admin_note:
+            order.admin_note = admin_note
+            session.add(OrderChange(order_id=order_id, kind="adminNote", value=admin_note))
+        session.add(order)
+        session.flush()
+        updated = _to_dict(order)
+
+    notify_order_changes()
+    return updated
+
+
+def bulk_update_status(order_ids: list[str], status: str) -> dict[str, Any]:
+    order_ids = list(dict.fromkeys(order_ids))
+    _materialize_pending(order_ids)
+
+    changed: list[str] = []
+    unchanged: list[str] = []
+    conflicts: list[str] = []
+    with session_scope() as session:
+        current: dict[str, str] = {}
+        for chunk in _chunks(order_ids):
+            rows = session.exec(select(Order.id, Order.status).where(Order.id.in_(chunk))).all()
+            current.update((row[0], row[1]) for row in rows)
+        not_found = [order_id for order_id in order_ids if order_id not in current]
+
+        deltas = new_deltas()
+        for _ in range(STATUS_UPDATE_PASSES):
+            by_old: dict[str, list[str]] = {}
+            for order_id, old in current.items():
+                if old == status:
+                    unchanged.append(order_id)
+                else:
+                    by_old.setdefault(old, []).append(order_id)
+
+            # Guarded on the status that was read, and the stats deltas come from the
+            # rows the UPDATE reports, so a concurrent change is never counted twice.
+            lost: list[str] = []
+            for old, ids in by_old.items():
+                for chunk in _chunks(ids):
+                    rows = session.execute(
+                        update(Order)
+                        .where(Order.id.in_(chunk), Order.status == old)
+                        .values(status=status)
+                        .returning(Order.id, Order.total_ft)
+                    ).all()
+                    for order_id, total_ft in rows:
+                        move_status(deltas, old, status, total_ft)
+                        changed.append(order_id)
+                    done = {row[0] for row in rows}
+                    lost.extend(order_id for order_id in chunk if order_id not in done)
+            if not lost:
+                break
+            # Changed by someone else since the read; classify them again.
+            current = {}
+            for chunk in _chunks(lost):
+                rows = session.exec(select(Order.id, Order.status).where(Order.id.in_(chunk))).all()
+                current.update((row[0], row[1]) for row in rows)
+            not_found.extend(order_id for order_id in lost if order_id not in current)
+        else:
+            # Still changing under us after every pass; left as they are.
+            for order_id, old in current.items():
+                (unchanged if old == status else conflicts).append(order_id)
+
+        apply_deltas(session, deltas)
+        if changed:
+            changed_at = datetime.utcnow()
+            session.execute(
+                insert(OrderChange),
+                [
+                    {"order_id": order_id, "kind": "status", "value": status, "changed_at": changed_at}
+                    for order_id in changed
+                ],
+            )
+
+    notify_order_changes()
+    return {
+        "updated": len(changed),
+        "unchanged": len(unchanged),
+        "notFoundIds": not_found,
+        "conflictIds": conflicts,
+    }
+
+
+def list_order_changes(since: int | None = None, limit: int = 200) -> dict[str, Any]:
+    limit = max(1, min(limit, ORDER_CHANGES_PAGE_MAX))
+    with session_scope() as session:
+        if since is None:
+            # No cursor yet: hand out the current head so the caller starts from now.
+            head = session.exec(select(func.max(OrderChange.seq))).one()
+            return {"data": [], "lastSeq": head or 0, "hasMore": False}
+
+        rows = session.exec(
+            select(OrderChange)
+            .where(OrderChange.seq > since)
+            .order_by(OrderChange.seq)
+            .limit(limit + 1)
+        ).all()
+        data = [
+            {
+                "seq": row.seq,
+                "orderId": row.order_id,
+                "kind": row.kind,
+                "value": row.value,
+                "changedAt": row.changed_at.isoformat(),
+            }
+            for row in rows[:limit]
+        ]
+
+    return {
+        "data": data,
+        "lastSeq": data[-1]["seq"] if data else since,
+        "hasMore": len(rows) > limit,
+    }
 
-    if status is not None:
-        order["status"] = status
-    if admin_note is not None:
-        order["adminNote"] = admin_note
-    return order
 
+def get_order_stats(days: int = 30) -> dict[str, Any]:
+    with session_scope() as session:
+        return read_order_stats(session, ORDER_STATUS_VALUES, days=days)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlmodel import Session, select
+
+from .models import AnchorPriceHistory, QuoteResult
+from .pricing import calculate_anchor_price
+from .pricing_service import resolve_anchor_price
+
+_FIELDS = ("product_code", "material_code", "size_key", "anchor_qty", "anchor_price")
+
+
+def as_utc_naive(value: datetime) -> datetime:
+    # History timestamps are stored as naive UTC, like every other table.
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def anchor_history(session: Session, anchor_id: int) -> list[AnchorPriceHistory]:
+    return session.exec(
+        select(AnchorPriceHistory).where(AnchorPriceHistory.anchor_id == anchor_id).order_by(AnchorPriceHistory.seq)
+    ).all()
+
+
+def anchors_as_of(
+    session: Session, product_code: str, material_code: str, size_key: str, at: datetime
+) -> dict[int, float]:
+    at = as_utc_naive(at)
+    # Anchors that belonged to the group at some point before `at`; their full event
+    # streams are folded, since one may have moved to another group since.
+    members = (
+        select(AnchorPriceHistory.anchor_id)
+        .where(
+            AnchorPriceHistory.product_code == product_code,
+            AnchorPriceHistory.material_code == material_code,
+            AnchorPriceHistory.size_key == size_key,
+            AnchorPriceHistory.changed_at <= at,
+        )
+        .distinct()
+    )
+    rows = session.exec(
+        select(AnchorPriceHistory)
+        .where(AnchorPriceHistory.anchor_id.in_(members), AnchorPriceHistory.changed_at <= at)
+        .order_by(AnchorPriceHistory.seq)
+    ).all()
+
+    state: dict[int, dict[str, Any] | None] = {}
+    for row in rows:
+        if row.action == "delete":
+            state[row.anchor_id] = None
+            continue
+        current = dict(state.get(row.anchor_id) or {}) if row.action == "update" else {}
+        for field in _FIELDS:
+            value = getattr(row, field)
+            if value is not None:
+                current[field] = value
+        state[row.anchor_id] = current
+
+    group = (product_code, material_code, size_key)
+    return {
+        values["anchor_qty"]: values["anchor_price"]
+        for values in state.values()
+        if values
+        and (values.get("product_code"), values.get("material_code"), values.get("size_key")) == group
+        and "anchor_qty" in values
+        and "anchor_price" in values
+    }
+
+
+class _HistoricalAnchors:
+    # Stands in for the pricing snapshot in calculate_anchor_price.
+    def __init__(self, group: tuple[str, str, str], anchors: dict[int, float]) -> None:
+        self.group = group
+        self.anchors = anchors
+
+    def resolve_anchor(
+        self, product_code: str, material_code: str, size_key: str, qty: int
+    ) -> tuple[int, float] | None:
+        if (product_code, material_code, size_key) != self.group or not self.anchors:
+            return None
+        return resolve_anchor_price(self.anchors, qty)
+
+
+def price_as_of(
+    session: Session,
+    at: datetime,
+    product_code: str,
+    size: str,
+    paper: str,
+    color: str,
+    qty: int,
+    lamination: bool = False,
+) -> QuoteResult:
+    anchors = anchors_as_of(session, product_code, paper, size, at)
+    return calculate_anchor_price(
+        _HistoricalAnchors((product_code, paper, size), anchors), product_code, size, paper, color, qty, lamination
+    )
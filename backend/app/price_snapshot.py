@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, NamedTuple
+
+from .models import FLYER_SIZE_MM, AnchorPrice, PrintSheet, ProductSpec, SheetPrice
+
+SNAPSHOT_DIR = Path(os.getenv("PRICING_SNAPSHOT_DIR", "./snapshots"))
+
+MAGIC = b"PQSNAP01"
+BYTE_ORDER_MARK = 0x01020304
+
+# Fixed section order. Record tables are flat int64 arrays with a fixed stride.
+SEC_STR_BLOB = 0
+SEC_STR_OFFSETS = 1
+SEC_GROUPS = 2  # product, material, size, start, count
+SEC_QTY = 3
+SEC_PRICE = 4
+SEC_SPECS = 5  # product, finished_w_mm, finished_h_mm, bleed_mm, default_sheet_code
+SEC_SHEETS = 6  # code, width_mm, height_mm, printable_width_mm, printable_height_mm
+SEC_SHEET_PRICES = 7  # sheet_code, print_mode, base_price_per_sheet, setup_fee
+SEC_INDEX_HASH = 8
+SEC_INDEX_VALUE = 9
+SECTION_COUNT = 10
+
+GROUP_STRIDE = 5
+SPEC_STRIDE = 5
+SHEET_STRIDE = 5
+SHEET_PRICE_STRIDE = 4
+
+_HEADER = struct.Struct(f"=8sIIq{SECTION_COUNT * 2}q")
+
+KEY_ANCHOR = b"a"
+KEY_SPEC_SIZE = b"s"
+KEY_SPEC_FIRST = b"f"
+KEY_SHEET = b"h"
+KEY_SHEET_PRICE = b"p"
+
+
+class AnchorRecord(NamedTuple):
+    product_code: str
+    material_code: str
+    size_key: str
+    anchor_qty: int
+    anchor_price: float
+
+
+class SpecRecord(NamedTuple):
+    product_code: str
+    finished_w_mm: int
+    finished_h_mm: int
+    bleed_mm: int
+    default_sheet_code: str
+
+
+class SheetRecord(NamedTuple):
+    code: str
+    width_mm: int
+    height_mm: int
+    printable_width_mm: int
+    printable_height_mm: int
+
+
+class SheetPriceRecord(NamedTuple):
+    sheet_code: str
+    print_mode: str
+    base_price_per_sheet: int
+    setup_fee: int
+
+
+def _key(kind: bytes, *parts: object) -> bytes:
+    return kind + b"\0".join(str(part).encode("utf-8") for part in parts)
+
+
+def _key_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def snapshot_path(version: int, directory: Path = SNAPSHOT_DIR) -> Path:
+    return directory / f"pricing-{version}.snap"
+
+
+def compile_snapshot(
+    version: int,
+    anchors: Iterable[AnchorPrice],
+    specs: Iterable[ProductSpec],
+    sheets: Iterable[PrintSheet],
+    sheet_prices: Iterable[SheetPrice],
+) -> bytes:
+    strings: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    keys: list[tuple[int, int]] = []
+
+    ordered = sorted(
+        anchors,
+        key=lambda row: (row.product_code, row.size_key, row.material_code, row.anchor_qty),
+    )
+    groups = array("q")
+    qty = array("q")
+    price = array("d")
+    current: tuple[str, str, str] | None = None
+    for row in ordered:
+        group_key = (row.product_code, row.material_code, row.size_key)
+        if group_key != current:
+            current = group_key
+            keys.append((_key_hash(_key(KEY_ANCHOR, *group_key)), len(groups) // GROUP_STRIDE))
+            groups.extend(
+                [intern(row.product_code), intern(row.material_code), intern(row.size_key), len(qty), 0]
+            )
+        groups[-1] += 1
+        qty.append(int(row.anchor_qty))
+        price.append(float(row.anchor_price))
+
+    spec_table = array("q")
+    seen_products: set[str] = set()
+    for spec in sorted(specs, key=lambda item: item.id or 0):
+        index = len(spec_table) // SPEC_STRIDE
+        keys.append(
+            (_key_hash(_key(KEY_SPEC_SIZE, spec.product_code, spec.finished_w_mm, spec.finished_h_mm)), index)
+        )
+        if spec.product_code not in seen_products:
+            seen_products.add(spec.product_code)
+            keys.append((_key_hash(_key(KEY_SPEC_FIRST, spec.product_code)), index))
+        spec_table.extend(
+            [
+                intern(spec.product_code),
+                spec.finished_w_mm,
+                spec.finished_h_mm,
+                spec.bleed_mm,
+                intern(spec.default_sheet_code),
+            ]
+        )
+
+    sheet_table = array("q")
+    for sheet in sheets:
+        keys.append((_key_hash(_key(KEY_SHEET, sheet.code)), len(sheet_table) // SHEET_STRIDE))
+        sheet_table.extend(
+            [
+                intern(sheet.code),
+                sheet.width_mm,
+                sheet.height_mm,
+                sheet.printable_width_mm,
+                sheet.printable_height_mm,
+            ]
+        )
+
+    sheet_price_table = array("q")
+    for row in sheet_prices:
+        index = len(sheet_price_table) // SHEET_PRICE_STRIDE
+        keys.append((_key_hash(_key(KEY_SHEET_PRICE, row.sheet_code, row.print_mode)), index))
+        sheet_price_table.extend(
+            [intern(row.sheet_code), intern(row.print_mode), row.base_price_per_sheet, row.setup_fee]
+        )
+
+    keys.sort()
+    index_hash = array("Q", (item[0] for item in keys))
+    index_value = array("q", (item[1] for item in keys))
+
+    blob = bytearray()
+    offsets = array("q", [0])
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+
+    sections = [
+        bytes(blob),
+        offsets.tobytes(),
+        groups.tobytes(),
+        qty.tobytes(),
+        price.tobytes(),
+        spec_table.tobytes(),
+        sheet_table.tobytes(),
+        sheet_price_table.tobytes(),
+        index_hash.tobytes(),
+        index_value.tobytes(),
+    ]
+
+    table: list[int] = []
+    body = bytearray()
+    position = _HEADER.size
+    for data in sections:
+        # Keep every section 8-byte aligned so memoryview casts read aligned words.
+        padding = (-position) % 8
+        body += b"\0" * padding
+        position += padding
+        table.extend([position, len(data)])
+        body += data
+        position += len(data)
+
+    return _HEADER.pack(MAGIC, BYTE_ORDER_MARK, 0, version, *table) + bytes(body)
+
+
+def write_snapshot(version: int, data: bytes, directory: Path = SNAPSHOT_DIR) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    target = snapshot_path(version, directory)
+    tmp = directory / f".pricing-{version}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as handle:
+        handle.write(data)
+        handle.flush()
+        os.fsync(handle.fileno())
+    # Versioned names mean workers only ever map a finished file; if another worker
+    # published the same version first, its identical copy wins.
+    try:
+        os.replace(tmp, target)
+    except PermissionError:
+        tmp.unlink(missing_ok=True)
+    return target
+
+
+def prune_snapshots(keep_version: int, directory: Path = SNAPSHOT_DIR) -> None:
+    # Only older versions: a newer file may have just been written by another worker.
+    if not directory.exists():
+        return
+    for entry in os.scandir(directory):
+        if not (entry.name.startswith("pricing-") and entry.name.endswith(".snap")):
+            continue
+        try:
+            version = int(entry.name[len("pricing-") : -len(".snap")])
+        except ValueError:
+            continue
+        if version < keep_version:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                # Still mapped by another worker on platforms that refuse to unlink.
+                pass
+
+
+class PricingSnapshot:
+    def __init__(self, buffer: mmap.mmap) -> None:
+        header = _HEADER.unpack_from(buffer, 0)
+        magic, mark, _reserved, version = header[:4]
+        if magic != MAGIC or mark != BYTE_ORDER_MARK:
+            raise ValueError("Not a pricing snapshot for this platform")
+
+        self._buffer = buffer
+        self.version = version
+        view = memoryview(buffer)
+        table = header[4:]
+
+        def section(number: int, fmt: str | None = None) -> memoryview:
+            start = table[number * 2]
+            data = view[start : start + table[number * 2 + 1]]
+            return data.cast(fmt) if fmt else data
+
+        self._blob = section(SEC_STR_BLOB)
+        self._offsets = section(SEC_STR_OFFSETS, "q")
+        self._groups = section(SEC_GROUPS, "q")
+        self._qty = section(SEC_QTY, "q")
+        self._price = section(SEC_PRICE, "d")
+        self._specs = section(SEC_SPECS, "q")
+        self._sheets = section(SEC_SHEETS, "q")
+        self._sheet_prices = section(SEC_SHEET_PRICES, "q")
+        self._index_hash = section(SEC_INDEX_HASH, "Q")
+        self._index_value = section(SEC_INDEX_VALUE, "q")
+        self.print_modes = sorted(
+            {self._string(self._sheet_prices[i + 1]) for i in range(0, len(self._sheet_prices), SHEET_PRICE_STRIDE)}
+        )
+
+    def _string(self, index: int) -> str:
+        return str(self._blob[self._offsets[index] : self._offsets[index + 1]], "utf-8")
+
+    def _string_is(self, index: int, value: object) -> bool:
+        return self._blob[self._offsets[index] : self._offsets[index + 1]] == str(value).encode("utf-8")
+
+    def _candidates(self, key: bytes) -> Iterator[int]:
+        wanted = _key_hash(key)
+        position = bisect_left(self._index_hash, wanted)
+        while position < len(self._index_hash) and self._index_hash[position] == wanted:
+            yield self._index_value[position]
+            position += 1
+
+    def _group(self, product_code: str, material_code: str, size_key: str) -> tuple[int, int] | None:
+        for group in self._candidates(_key(KEY_ANCHOR, product_code, material_code, size_key)):
+            base = group * GROUP_STRIDE
+            fields = self._groups[base : base + GROUP_STRIDE]
+            if (
+                self._string_is(fields[0], product_code)
+                and self._string_is(fields[1], material_code)
+                and self._string_is(fields[2], size_key)
+            ):
+                return fields[3], fields[3] + fields[4]
+        return None
+
+    def anchor_map(self, product_code: str, material_code: str, size_key: str) -> Dict[int, float]:
+        bounds = self._group(product_code, material_code, size_key)
+        if bounds is None:
+            return {}
+        start, end = bounds
+        return dict(zip(self._qty[start:end], self._price[start:end]))
+
+    def resolve_anchor(
+        self, product_code: str, material_code: str, size_key: str, qty: int
+    ) -> tuple[int, float] | None:
+        # Same rule as pricing_service.resolve_anchor_price, read straight off the columns.
+        bounds = self._group(product_code, material_code, size_key)
+        if bounds is None:
+            return None
+        start, end = bounds
+        position = bisect_right(self._qty, qty, start, end) - 1
+        if position < start:
+            position = start
+        return self._qty[position], self._price[position]
+
+    @property
+    def anchor_rows(self) -> list[AnchorRecord]:
+        rows: list[AnchorRecord] = []
+        for base in range(0, len(self._groups), GROUP_STRIDE):
+            product, material, size, start, count = self._groups[base : base + GROUP_STRIDE]
+            names = (self._string(product), self._string(material), self._string(size))
+            for position in range(start, start + count):
+                rows.append(AnchorRecord(*names, self._qty[position], self._price[position]))
+        return rows
+
+    def _spec(self, index: int) -> SpecRecord:
+        product, w_mm, h_mm, bleed, sheet = self._specs[index * SPEC_STRIDE : (index + 1) * SPEC_STRIDE]
+        return SpecRecord(self._string(product), w_mm, h_mm, bleed, self._string(sheet))
+
+    def product_spec(self, product_code: str, size_key: str | None) -> SpecRecord | None:
+        if product_code == "flyer":
+            if size_key is None or size_key not in FLYER_SIZE_MM:
+                return None
+            w_mm, h_mm = FLYER_SIZE_MM[size_key]
+            for index in self._candidates(_key(KEY_SPEC_SIZE, product_code, w_mm, h_mm)):
+                spec = self._spec(index)
+                if (spec.product_code, spec.finished_w_mm, spec.finished_h_mm) == (product_code, w_mm, h_mm):
+                    return spec
+            return None
+
+        for index in self._candidates(_key(KEY_SPEC_FIRST, product_code)):
+            spec = self._spec(index)
+            if spec.product_code == product_code:
+                return spec
+        return None
+
+    def sheet(self, code: str) -> SheetRecord | None:
+        for index in self._candidates(_key(KEY_SHEET, code)):
+            fields = self._sheets[index * SHEET_STRIDE : (index + 1) * SHEET_STRIDE]
+            if self._string_is(fields[0], code):
+                return SheetRecord(code, *fields[1:])
+        return None
+
+    def sheet_price(self, sheet_code: str, print_mode: str) -> SheetPriceRecord | None:
+        for index in self._candidates(_key(KEY_SHEET_PRICE, sheet_code, print_mode)):
+            fields = self._sheet_prices[index * SHEET_PRICE_STRIDE : (index + 1) * SHEET_PRICE_STRIDE]
+            if self._string_is(fields[0], sheet_code) and self._string_is(fields[1], print_mode):
+                return SheetPriceRecord(sheet_code, print_mode, fields[2], fields[3])
+        return None
+
+
+def open_snapshot(version: int, directory: Path = SNAPSHOT_DIR) -> PricingSnapshot | None:
+    path = snapshot_path(version, directory)
+    try:
+        with open(path, "rb") as handle:
+            # The mapping stays valid after the file handle is closed.
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    return PricingSnapshot(buffer)
@@ -1,33 +1,131 @@
 from __future__ import annotations
 import math
-from typing import List
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
 
-from sqlmodel import Session
-
-from .db import engine
-from .models import BreakdownItem, QuoteRequest
-from .pricing_service import calc_per_sheet, get_product_spec, get_sheet, get_sheet_price
+from .fx import FxTable
+from .models import PriceLine, QuoteRequest, QuoteResult
+from .price_snapshot import PricingSnapshot, SheetPriceRecord, SheetRecord, SpecRecord
+from .pricing_cache import get_pricing_snapshot, load_pricing_snapshot
+from .pricing_service import calc_per_sheet
+from .responses import encode_json
 
 SURCHARGE_PAPER_170G = 900
 SURCHARGE_LAMINATION = 2000
 MIN_PRICE = 5000
 
+SURCHARGE_COLOR_4_0 = 1500
+SURCHARGE_COLOR_4_4 = 3000
+
+_PAPER_170G_LINE = PriceLine("Papir felar: 170g", SURCHARGE_PAPER_170G)
+_LAMINATION_LINE = PriceLine("Foliazas felar", SURCHARGE_LAMINATION)
+
+# The anchor engine behind /price/calculate labels its surcharges with accents.
+_ANCHOR_PAPER_170G_LINE = PriceLine("Papír felár: 170g", SURCHARGE_PAPER_170G)
+_ANCHOR_COLOR_4_0_LINE = PriceLine("Szín felár: 4+0", SURCHARGE_COLOR_4_0)
+_ANCHOR_COLOR_4_4_LINE = PriceLine("Szín felár: 4+4", SURCHARGE_COLOR_4_4)
+_ANCHOR_LAMINATION_LINE = PriceLine("Fóliázás felár", SURCHARGE_LAMINATION)
+
+
+
+@dataclass(frozen=True, slots=True)
+class AnchorSurcharges:
+    # The amounts calculate_anchor_price adds; the offline simulation passes candidates.
+    paper_170g: int = SURCHARGE_PAPER_170G
+    color_4_0: int = SURCHARGE_COLOR_4_0
+    color_4_4: int = SURCHARGE_COLOR_4_4
+    lamination: int = SURCHARGE_LAMINATION
+    min_price: int = MIN_PRICE
+
+
+ANCHOR_SURCHARGES = AnchorSurcharges()
+
+# The whole QuoteRequest domain is 144 requests, so this never evicts in practice.
+QUOTE_MEMO_MAX_ENTRIES = 512
+
+# (product, size, paper, color, qty, lamination, currency) -> encoded QuoteResponse,
+# or the error message for combinations that cannot be priced.
+_quote_memo: OrderedDict[tuple, bytes | str] = OrderedDict()
+# (pricing version, fx rate version) the entries were computed with.
+_quote_memo_version: tuple[int, int] | None = None
+_quote_memo_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def quote_from_snapshot(snapshot: PricingSnapshot, req: QuoteRequest) -> QuoteResult:
+    product_spec = snapshot.product_spec(req.product, req.size)
+    if product_spec is None:
+        raise ValueError(f"No product spec for product={req.product} size={req.size}")
+
+    sheet = snapshot.sheet(product_spec.default_sheet_code)
+    if sheet is None:
+        raise ValueError(f"No sheet found for code={product_spec.default_sheet_code}")
+
+    sheet_price = snapshot.sheet_price(sheet.code, req.color)
+    if sheet_price is None:
+        raise ValueError(f"No sheet price for sheet={sheet.code} print_mode={req.color}")
+
+    return build_quote(req, product_spec, sheet, sheet_price)
+
+
+def calculate_quote(req: QuoteRequest) -> QuoteResult:
+    return quote_from_snapshot(get_pricing_snapshot(), req)
+
 
-def calculate_quote(req: QuoteRequest) -> tuple[int, List[BreakdownItem]]:
-    with Session(engine) as session:
-        product_spec = get_product_spec(session, product_code=req.product, size_key=req.size)
-        if product_spec is None:
-            raise ValueError(f"No product spec for product={req.product} size={req.size}")
+async def calculate_quote_async(req: QuoteRequest) -> QuoteResult:
+    return quote_from_snapshot(await load_pricing_snapshot(), req)
 
-        sheet = get_sheet(session, product_spec.default_sheet_code)
-        if sheet is None:
-            raise ValueError(f"No sheet found for code={product_spec.default_sheet_code}")
 
-        print_mode = req.color
-        sheet_price = get_sheet_price(session, sheet.code, print_mode)
-        if sheet_price is None:
-            raise ValueError(f"No sheet price for sheet={sheet.code} print_mode={print_mode}")
+def quote_response_bytes(snapshot: PricingSnapshot, req: QuoteRequest, fx: FxTable) -> bytes:
+    # Entries are only valid for the pricing and rate versions they were computed from.
+    global _quote_memo_version
+    version = (snapshot.version, fx.version)
+    if version != _quote_memo_version:
+        if _quote_memo:
+            _quote_memo.clear()
+            _quote_memo_stats["invalidations"] += 1
+        _quote_memo_version = version
 
+    currency = req.currency.upper()
+    key = (req.product, req.size, req.paper, req.color, int(req.qty), bool(req.lamination), currency)
+    cached = _quote_memo.get(key)
+    if cached is not None:
+        _quote_memo_stats["hits"] += 1
+        _quote_memo.move_to_end(key)
+    else:
+        _quote_memo_stats["misses"] += 1
+        try:
+            cached = encode_json(fx.convert_quote(quote_from_snapshot(snapshot, req), currency))
+        except ValueError as exc:
+            cached = str(exc)
+        _quote_memo[key] = cached
+        if len(_quote_memo) > QUOTE_MEMO_MAX_ENTRIES:
+            _quote_memo.popitem(last=False)
+            _quote_memo_stats["evictions"] += 1
+
+    if isinstance(cached, str):
+        raise ValueError(cached)
+    return cached
+
+
+def quote_memo_stats() -> dict[str, Any]:
+    lookups = _quote_memo_stats["hits"] + _quote_memo_stats["misses"]
+    return {
+        **_quote_memo_stats,
+        "entries": len(_quote_memo),
+        "maxEntries": QUOTE_MEMO_MAX_ENTRIES,
+        "version": _quote_memo_version,
+        "hitRate": round(_quote_memo_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
+
+
+def build_quote(
+    req: QuoteRequest,
+    product_spec: SpecRecord,
+    sheet: SheetRecord,
+    sheet_price: SheetPriceRecord,
+) -> QuoteResult:
+    print_mode = req.color
     per_sheet = calc_per_sheet(sheet, product_spec)
     if per_sheet <= 0:
         raise ValueError(
@@ -38,39 +136,75 @@ def calculate_quote(req: QuoteRequest) -> tuple[int, List[BreakdownItem]]:
     billable_qty = sheets_needed * per_sheet
     printing_price = sheets_needed * sheet_price.base_price_per_sheet + sheet_price.setup_fee
 
-    breakdown: List[BreakdownItem] = []
-    breakdown.append(
-        BreakdownItem(
-            label=(
-                f"Iv: {sheet.code} "
-                f"(printable {sheet.printable_width_mm}x{sheet.printable_height_mm} mm)"
-            ),
-            amount=0,
-        )
-    )
-    breakdown.append(BreakdownItem(label=f"Impozicio: {per_sheet} db/iv", amount=0))
-    breakdown.append(BreakdownItem(label=f"Ivek szama: {sheets_needed} iv", amount=0))
-    breakdown.append(BreakdownItem(label=f"Szamlazott darab: {billable_qty} db", amount=0))
-    breakdown.append(
-        BreakdownItem(
-            label=f"Nyomtatas: {print_mode} - {sheets_needed} iv",
-            amount=int(printing_price),
-        )
-    )
+    breakdown = [
+        PriceLine(
+            f"Iv: {sheet.code} (printable {sheet.printable_width_mm}x{sheet.printable_height_mm} mm)",
+            0,
+        ),
+        PriceLine(f"Impozicio: {per_sheet} db/iv", 0),
+        PriceLine(f"Ivek szama: {sheets_needed} iv", 0),
+        PriceLine(f"Szamlazott darab: {billable_qty} db", 0),
+        PriceLine(f"Nyomtatas: {print_mode} - {sheets_needed} iv", int(printing_price)),
+    ]
 
     total = int(printing_price)
 
     if req.paper == "170g":
         total += SURCHARGE_PAPER_170G
-        breakdown.append(BreakdownItem(label="Papir felar: 170g", amount=SURCHARGE_PAPER_170G))
+        breakdown.append(_PAPER_170G_LINE)
 
     if req.lamination:
         total += SURCHARGE_LAMINATION
-        breakdown.append(BreakdownItem(label="Foliazas felar", amount=SURCHARGE_LAMINATION))
+        breakdown.append(_LAMINATION_LINE)
 
     if total < MIN_PRICE:
         adjust = MIN_PRICE - total
         total = MIN_PRICE
-        breakdown.append(BreakdownItem(label="Minimum ar korrekcio", amount=adjust))
+        breakdown.append(PriceLine("Minimum ar korrekcio", adjust))
+
+    return QuoteResult(total, "HUF", tuple(breakdown))
+
+
+def _surcharge_line(line: PriceLine, amount: int) -> PriceLine:
+    return line if line.amount == amount else PriceLine(line.label, amount)
+
+
+def calculate_anchor_price(
+    snapshot: PricingSnapshot,
+    product_code: str,
+    size: str,
+    paper: str,
+    color: str,
+    qty: int,
+    lamination: bool = False,
+    surcharges: AnchorSurcharges = ANCHOR_SURCHARGES,
+) -> QuoteResult:
+    resolved = snapshot.resolve_anchor(product_code, paper, size, qty)
+    if resolved is None:
+        raise ValueError(f"No anchor price for product={product_code} material={paper} size={size}")
+    resolved_qty, anchor = resolved[0], int(round(resolved[1]))
+
+    breakdown = [PriceLine(f"Anchor - {product_code} / {size} / {resolved_qty} db", anchor)]
+    total = anchor
+
+    if paper == "170g":
+        total += surcharges.paper_170g
+        breakdown.append(_surcharge_line(_ANCHOR_PAPER_170G_LINE, surcharges.paper_170g))
+
+    if color == "4+0":
+        total += surcharges.color_4_0
+        breakdown.append(_surcharge_line(_ANCHOR_COLOR_4_0_LINE, surcharges.color_4_0))
+    elif color == "4+4":
+        total += surcharges.color_4_4
+        breakdown.append(_surcharge_line(_ANCHOR_COLOR_4_4_LINE, surcharges.color_4_4))
+
+    if lamination:
+        total += surcharges.lamination
+        breakdown.append(_surcharge_line(_ANCHOR_LAMINATION_LINE, surcharges.lamination))
+
+    if total < surcharges.min_price:
+        adjust = surcharges.min_price - total
+        total = surcharges.min_price
+        breakdown.append(PriceLine("Minimum ár korrekció", adjust))
 
-    return total, breakdown
+    return QuoteResult(total, "HUF", tuple(breakdown))
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import os
+import time
+
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from .db import USE_ASYNC_DB, async_session_scope, engine
+from .models import AnchorPrice, PricingState, PrintSheet, ProductSpec, SheetPrice
+from .price_snapshot import (
+    PricingSnapshot,
+    compile_snapshot,
+    open_snapshot,
+    prune_snapshots,
+    write_snapshot,
+)
+
+# How often a worker asks the database whether pricing data changed. Between polls
+# lookups read the memory-mapped snapshot shared by all workers.
+PRICING_VERSION_POLL_SECONDS = float(os.getenv("PRICING_VERSION_POLL_SECONDS", "0.5"))
+# Re-reads when a pricing commit lands while the rows are being read.
+SNAPSHOT_READ_ATTEMPTS = 5
+
+
+_snapshot: PricingSnapshot | None = None
+_checked_at = 0.0
+
+
+def _version_query():
+    return select(PricingState.version).where(PricingState.id == 1)
+
+
+def _fresh_snapshot() -> PricingSnapshot | None:
+    if _snapshot is not None and time.monotonic() - _checked_at < PRICING_VERSION_POLL_SECONDS:
+        return _snapshot
+    return None
+
+
+def _store(snapshot: PricingSnapshot) -> PricingSnapshot:
+    global _snapshot, _checked_at
+    _snapshot = snapshot
+    _checked_at = time.monotonic()
+    return snapshot
+
+
+def _swap(version: int) -> PricingSnapshot | None:
+    if _snapshot is not None and _snapshot.version == version:
+        return _store(_snapshot)
+    mapped = open_snapshot(version)
+    return _store(mapped) if mapped is not None else None
+
+
+def _publish(version: int, anchors, specs, sheets, sheet_prices) -> PricingSnapshot:
+    # Whichever worker first sees a new version compiles the file; the rest just map it.
+    data = compile_snapshot(version, anchors, specs, sheets, sheet_prices)
+    write_snapshot(version, data)
+    prune_snapshots(version)
+    mapped = open_snapshot(version)
+    # Unmappable file (e.g. removed by an outdated worker): serve the compiled bytes.
+    return _store(mapped if mapped is not None else PricingSnapshot(data))
+
+
+def _refresh_sync() -> PricingSnapshot:
+    with Session(engine) as session:
+        version = session.exec(_version_query()).first() or 0
+        for _ in range(SNAPSHOT_READ_ATTEMPTS):
+            swapped = _swap(version)
+            if swapped is not None:
+                return swapped
+            rows = (
+                session.exec(select(AnchorPrice)).all(),
+                session.exec(select(ProductSpec)).all(),
+                session.exec(select(PrintSheet)).all(),
+                session.exec(select(SheetPrice)).all(),
+            )
+            # The reads are not one transaction; every pricing write bumps the version
+            # in its own commit, so an unchanged version means the rows belong to it.
+            after = session.exec(_version_query()).first() or 0
+            if after == version:
+                break
+            version = after
+        return _publish(version, *rows)
+
+
+async def _refresh_async() -> PricingSnapshot:
+    async with async_session_scope() as session:
+        version = (await session.exec(_version_query())).first() or 0
+        for _ in range(SNAPSHOT_READ_ATTEMPTS):
+            swapped = _swap(version)
+            if swapped is not None:
+                return swapped
+            rows = (
+                (await session.exec(select(AnchorPrice))).all(),
+                (await session.exec(select(ProductSpec))).all(),
+                (await session.exec(select(PrintSheet))).all(),
+                (await session.exec(select(SheetPrice))).all(),
+            )
+            after = (await session.exec(_version_query())).first() or 0
+            if after == version:
+                break
+            version = after
+        return _publish(version, *rows)
+
+
+def get_pricing_snapshot() -> PricingSnapshot:
+    return _fresh_snapshot() or _refresh_sync()
+
+
+async def load_pricing_snapshot() -> PricingSnapshot:
+    snapshot = _fresh_snapshot()
+    if snapshot is not None:
+        return snapshot
+    if USE_ASYNC_DB:
+        return await _refresh_async()
+    return await run_in_threadpool(_refresh_sync)
+
+
+def invalidate_pricing_cache() -> None:
+    # Forces a version check on the next lookup; used after writes in this process.
+    global _checked_at
+    _checked_at = 0.0
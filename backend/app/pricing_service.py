@@ -1,17 +1,75 @@
+from __future__ import annotations
+
+import base64
 import math
+from datetime import datetime
 from typing import Dict, Tuple
 
-from sqlalchemy import func, or_
+from sqlalchemy import func, insert, or_
 from sqlmodel import Session, select
 
-from .models import AnchorPrice, PrintSheet, ProductSpec, SheetPrice
-from .schemas.anchor import AnchorCreate, AnchorUpdate
+from .models import AnchorPrice, AnchorPriceHistory, PricingState, PrintSheet, ProductSpec, SheetPrice
+from .events import publish_anchor_changes
+from .pricing_cache import invalidate_pricing_cache
+from .schemas.anchor import AnchorCreate, AnchorRead, AnchorUpdate
+
+
+def bump_pricing_version(session: Session) -> PricingState:
+    # Every pricing write bumps the shared counter in the same transaction so other
+    # workers drop their cached snapshot on their next poll.
+    state = session.get(PricingState, 1)
+    if state is None:
+        state = PricingState(id=1, version=0)
+    state.version += 1
+    session.add(state)
+    return state
+
+
+def _anchor_change(anchor: AnchorPrice) -> dict:
+    return {"action": "upsert", "anchor": AnchorRead.model_validate(anchor).model_dump(mode="json")}
 
-FLYER_SIZE_MM: dict[str, tuple[int, int]] = {
-    "A6": (105, 148),
-    "A5": (148, 210),
-    "A4": (210, 297),
-}
+
+# Rows per multi-row INSERT into the history table, well below SQLite's variable limit.
+HISTORY_INSERT_CHUNK = 500
+
+
+def _history_row(action: str, anchor_id: int, anchor: AnchorPrice | None = None, **changed) -> dict:
+    row = {
+        "anchor_id": anchor_id,
+        "action": action,
+        "product_code": None,
+        "material_code": None,
+        "size_key": None,
+        "anchor_qty": None,
+        "anchor_price": None,
+    }
+    if anchor is not None:
+        row.update(product_code=anchor.product_code, material_code=anchor.material_code, size_key=anchor.size_key)
+    row.update(changed)
+    return row
+
+
+def _history_create(anchor: AnchorPrice) -> dict:
+    return _history_row(
+        "create", anchor.id, anchor, anchor_qty=anchor.anchor_qty, anchor_price=float(anchor.anchor_price)
+    )
+
+
+def _commit_pricing_change(
+    session: Session, changes: list[dict] | None = None, history: list[dict] | None = None
+) -> None:
+    state = bump_pricing_version(session)
+    if history:
+        # Same transaction as the anchor writes; one statement per chunk, not per row.
+        changed_at = datetime.utcnow()
+        for row in history:
+            row.update(pricing_version=state.version, changed_at=changed_at)
+        for start in range(0, len(history), HISTORY_INSERT_CHUNK):
+            session.exec(insert(AnchorPriceHistory).values(history[start : start + HISTORY_INSERT_CHUNK]))
+    session.commit()
+    invalidate_pricing_cache()
+    # Live admin views patch rows from these deltas; without them they reload.
+    publish_anchor_changes(state.version, changes)
 
 
 def seed_anchor_prices(session: Session) -> int:
@@ -56,7 +114,7 @@ def seed_anchor_prices(session: Session) -> int:
         AnchorPrice(product_code="booklet", material_code="115g", size_key="A5", anchor_qty=500, anchor_price=67900.0),
     ]
 
-    inserted = 0
+    added: list[AnchorPrice] = []
     for row in defaults:
         existing = session.exec(
             select(AnchorPrice)
@@ -69,12 +127,13 @@ def seed_anchor_prices(session: Session) -> int:
             continue
 
         session.add(row)
-        inserted += 1
+        added.append(row)
 
-    if inserted:
-        session.commit()
+    if added:
+        session.flush()
+        _commit_pricing_change(session, history=[_history_create(row) for row in added])
 
-    return inserted
+    return len(added)
 
 
 def seed_sra3(session: Session) -> int:
@@ -90,7 +149,7 @@ def seed_sra3(session: Session) -> int:
         printable_height_mm=440,
     )
     session.add(row)
-    session.commit()
+    _commit_pricing_change(session)
     return 1
 
 
@@ -122,7 +181,7 @@ def seed_sheet_prices(session: Session) -> int:
         inserted += 1
 
     if inserted:
-        session.commit()
+        _commit_pricing_change(session)
 
     return inserted
 
@@ -150,38 +209,29 @@ def seed_product_specs(session: Session) -> int:
         inserted += 1
 
     if inserted:
-        session.commit()
+        _commit_pricing_change(session)
 
     return inserted
 
 
-def get_sheet(session: Session, code: str) -> PrintSheet | None:
-    return session.exec(select(PrintSheet).where(PrintSheet.code == code)).first()
+def _sheet_query(code: str):
+    return select(PrintSheet).where(PrintSheet.code == code)
 
 
-def get_sheet_price(session: Session, sheet_code: str, print_mode: str) -> SheetPrice | None:
-    return session.exec(
+def _sheet_price_query(sheet_code: str, print_mode: str):
+    return (
         select(SheetPrice)
         .where(SheetPrice.sheet_code == sheet_code)
         .where(SheetPrice.print_mode == print_mode)
-    ).first()
+    )
 
 
-def get_product_spec(session: Session, product_code: str, size_key: str | None) -> ProductSpec | None:
-    if product_code == "flyer":
-        if size_key is None or size_key not in FLYER_SIZE_MM:
-            return None
-        w_mm, h_mm = FLYER_SIZE_MM[size_key]
-        return session.exec(
-            select(ProductSpec)
-            .where(ProductSpec.product_code == product_code)
-            .where(ProductSpec.finished_w_mm == w_mm)
-            .where(ProductSpec.finished_h_mm == h_mm)
-        ).first()
+def get_sheet(session: Session, code: str) -> PrintSheet | None:
+    return session.exec(_sheet_query(code)).first()
+
 
-    return session.exec(
-        select(ProductSpec).where(ProductSpec.product_code == product_code).order_by(ProductSpec.id)
-    ).first()
+def get_sheet_price(session: Session, sheet_code: str, print_mode: str) -> SheetPrice | None:
+    return session.exec(_sheet_price_query(sheet_code, print_mode)).first()
 
 
 def calc_per_sheet(sheet: PrintSheet, product_spec: ProductSpec) -> int:
@@ -280,6 +330,8 @@ def bulk_update_anchor_prices(
 ) -> dict:
     updated = 0
     not_found_ids: list[int] = []
+    changes: list[dict] = []
+    history: list[dict] = []
 
     for item in updates:
         anchor_id = int(item["id"])
@@ -288,12 +340,16 @@ def bulk_update_anchor_prices(
         if anchor is None:
             not_found_ids.append(anchor_id)
             continue
+        if anchor.anchor_price != price:
+            history.append(_history_row("update", anchor_id, anchor, anchor_price=price))
         anchor.anchor_price = price
+        anchor.updated_at = datetime.utcnow()
         session.add(anchor)
+        changes.append(_anchor_change(anchor))
         updated += 1
 
     if updated:
-        session.commit()
+        _commit_pricing_change(session, changes, history)
 
     return {"updated": updated, "notFoundIds": not_found_ids}
 
@@ -301,6 +357,7 @@ def bulk_update_anchor_prices(
 def bulk_delete_anchors(session: Session, ids: list[int]) -> dict:
     deleted = 0
     not_found_ids: list[int] = []
+    changes: list[dict] = []
 
     for anchor_id in ids:
         anchor = session.get(AnchorPrice, int(anchor_id))
@@ -308,10 +365,12 @@ def bulk_delete_anchors(session: Session, ids: list[int]) -> dict:
             not_found_ids.append(int(anchor_id))
             continue
         session.delete(anchor)
+        changes.append({"action": "delete", "id": int(anchor_id)})
         deleted += 1
 
     if deleted:
-        session.commit()
+        history = [_history_row("delete", change["id"]) for change in changes]
+        _commit_pricing_change(session, changes, history)
 
     return {"deleted": deleted, "notFoundIds": not_found_ids}
 
@@ -319,7 +378,8 @@ def bulk_delete_anchors(session: Session, ids: list[int]) -> dict:
 def create_anchor(session: Session, payload: AnchorCreate) -> AnchorPrice:
     anchor = AnchorPrice(**payload.model_dump())
     session.add(anchor)
-    session.commit()
+    session.flush()
+    _commit_pricing_change(session, [_anchor_change(anchor)], [_history_create(anchor)])
     session.refresh(anchor)
     return anchor
 
@@ -333,11 +393,21 @@ def update_anchor(session: Session, anchor_id: int, payload: AnchorUpdate) -> An
     if not updates:
         raise ValueError("No fields to update")
 
+    key_before = (anchor.product_code, anchor.material_code, anchor.size_key)
+    changed = {
+        field: updates[field]
+        for field in ("anchor_qty", "anchor_price")
+        if field in updates and updates[field] != getattr(anchor, field)
+    }
     for key, value in updates.items():
         setattr(anchor, key, value)
+    anchor.updated_at = datetime.utcnow()
 
+    history = []
+    if changed or key_before != (anchor.product_code, anchor.material_code, anchor.size_key):
+        history.append(_history_row("update", anchor.id, anchor, **changed))
     session.add(anchor)
-    session.commit()
+    _commit_pricing_change(session, [_anchor_change(anchor)], history)
     session.refresh(anchor)
     return anchor
 
@@ -348,27 +418,10 @@ def delete_anchor(session: Session, anchor_id: int) -> bool:
         return False
 
     session.delete(anchor)
-    session.commit()
+    _commit_pricing_change(session, [{"action": "delete", "id": anchor_id}], [_history_row("delete", anchor_id)])
     return True
 
 
-def get_anchor_map(
-    session: Session,
-    product_code: str,
-    material_code: str,
-    size_key: str,
-) -> Dict[int, float]:
-    rows = session.exec(
-        select(AnchorPrice)
-        .where(AnchorPrice.product_code == product_code)
-        .where(AnchorPrice.material_code == material_code)
-        .where(AnchorPrice.size_key == size_key)
-        .order_by(AnchorPrice.anchor_qty)
-    ).all()
-
-    return {row.anchor_qty: row.anchor_price for row in rows}
-
-
 def resolve_anchor_price(anchor_map: Dict[int, float], qty: int) -> Tuple[int, float]:
     if not anchor_map:
         raise ValueError("No anchors available")
@@ -383,59 +436,37 @@ def resolve_anchor_price(anchor_map: Dict[int, float], qty: int) -> Tuple[int, f
     return smallest, anchor_map[smallest]
 
 
-def get_calculator_options(session: Session) -> dict:
-    rows = session.exec(
-        select(AnchorPrice)
-        .where(AnchorPrice.product_code == "flyer")
-        .where(AnchorPrice.material_code == "130g")
-        .order_by(AnchorPrice.size_key, AnchorPrice.anchor_qty)
-    ).all()
-
-    sizes = sorted({row.size_key for row in rows})
-    qtys = sorted({int(row.anchor_qty) for row in rows})
-    papers = ["130g", "170g"]
-    colors = ["1+0", "4+0", "4+4"]
-
-    valid_combinations = []
+def _combination_bits(
+    rows: list[AnchorPrice],
+    sizes: list[str],
+    papers: list[str],
+    quantities: list[int],
+    colors: list[str],
+    fixed_size: str | None,
+) -> str:
+    # One bit per (size, paper, quantity, color) cell in row-major order over the
+    # option lists, least significant bit first within each byte, base64 encoded.
+    size_index = {value: index for index, value in enumerate(sizes)}
+    paper_index = {value: index for index, value in enumerate(papers)}
+    qty_index = {value: index for index, value in enumerate(quantities)}
+    color_count = len(colors)
+    bits = bytearray(-(-len(sizes) * len(papers) * len(quantities) * color_count // 8))
     for row in rows:
-        for paper in papers:
-            for color in colors:
-                valid_combinations.append(
-                    {
-                        "size": row.size_key,
-                        "paper": paper,
-                        "qty": int(row.anchor_qty),
-                        "color": color,
-                    }
-                )
-
-    return {
-        "products": [
-            {
-                "product_code": "flyer",
-                "label": "Szórólap",
-                "options": {
-                    "size": sizes,
-                    "paper": papers,
-                    "qty": qtys,
-                    "color": colors,
-                },
-                "valid_combinations": valid_combinations,
-            }
-        ]
-    }
-
-
-def get_catalog(session: Session, products: list[dict]) -> dict:
-    anchor_rows = session.exec(
-        select(AnchorPrice).order_by(
-            AnchorPrice.product_code,
-            AnchorPrice.size_key,
-            AnchorPrice.material_code,
-            AnchorPrice.anchor_qty,
-        )
-    ).all()
-    print_modes = session.exec(select(SheetPrice.print_mode).distinct()).all()
+        cell = size_index[fixed_size or row.size_key]
+        cell = cell * len(papers) + paper_index[row.material_code]
+        cell = (cell * len(quantities) + qty_index[int(row.anchor_qty)]) * color_count
+        for offset in range(color_count):
+            bit = cell + offset
+            bits[bit >> 3] |= 1 << (bit & 7)
+    return base64.b64encode(bits).decode("ascii")
+
+
+def build_catalog(
+    anchor_rows: list[AnchorPrice],
+    print_modes: list[str],
+    products: list[dict],
+    catalog_format: str = "full",
+) -> dict:
     colors = sorted(print_modes) if print_modes else ["1+0", "4+0", "4+4"]
 
     by_product: dict[str, list[AnchorPrice]] = {}
@@ -447,66 +478,43 @@ def get_catalog(session: Session, products: list[dict]) -> dict:
         product_code = product["product_code"]
         rows = by_product.get(product_code, [])
 
-        if product_code == "business_card":
-            sizes = ["90x50"]
-        else:
-            sizes = sorted({row.size_key for row in rows})
-
+        fixed_size = product.get("fixedSize")
+        sizes = [fixed_size] if fixed_size else sorted({row.size_key for row in rows})
         papers = sorted({row.material_code for row in rows})
         quantities = sorted({int(row.anchor_qty) for row in rows})
-
-        combinations = []
-        for row in rows:
-            size_value = "90x50" if product_code == "business_card" else row.size_key
-            for color in colors:
-                combinations.append(
-                    {
-                        "size": size_value,
-                        "paper": row.material_code,
-                        "quantity": int(row.anchor_qty),
-                        "color": color,
-                    }
-                )
-
-        catalog_products.append(
-            {
-                "id": product["id"],
-                "slug": product["slug"],
-                "name": product["name"],
-                "description": product["description"],
-                "basePrice": product["basePrice"],
-                "imageUrl": product.get("imageUrl", ""),
-                "product_code": product_code,
-                "options": {
-                    "sizes": sizes,
-                    "papers": papers,
-                    "quantities": quantities,
-                    "colors": colors if rows else [],
-                },
-                "validCombinations": combinations,
-            }
-        )
-
-    return {"products": catalog_products}
-
-
-def calculate_anchor_quote(
-    session: Session,
-    product_code: str,
-    size_key: str,
-    material_code: str,
-    qty: int,
-) -> tuple[int, int]:
-    anchor_map = get_anchor_map(
-        session,
-        product_code=product_code,
-        material_code=material_code,
-        size_key=size_key,
-    )
-    if not anchor_map:
-        raise ValueError(
-            f"No anchor price for product={product_code} material={material_code} size={size_key}"
-        )
-
-    resolved_qty, anchor_price = resolve_anchor_price(anchor_map, qty)
-    return resolved_qty, int(round(anchor_price))
+        product_colors = colors if rows else []
+
+        entry = {
+            "id": product["id"],
+            "slug": product["slug"],
+            "name": product["name"],
+            "description": product["description"],
+            "basePrice": product["basePrice"],
+            "imageUrl": product.get("imageUrl", ""),
+            "product_code": product_code,
+            "fixedSize": fixed_size,
+            "options": {
+                "sizes": sizes,
+                "papers": papers,
+                "quantities": quantities,
+                "colors": product_colors,
+            },
+        }
+        if catalog_format == "compact":
+            entry["validCombinationBits"] = _combination_bits(
+                rows, sizes, papers, quantities, product_colors, fixed_size
+            )
+        else:
+            entry["validCombinations"] = [
+                {
+                    "size": fixed_size or row.size_key,
+                    "paper": row.material_code,
+                    "quantity": int(row.anchor_qty),
+                    "color": color,
+                }
+                for row in rows
+                for color in colors
+            ]
+        catalog_products.append(entry)
+
+    return {"format": catalog_format, "products": catalog_products}
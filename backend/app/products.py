@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+from sqlmodel import Session, select
+
+from .db import engine
+from .models import Product
+from .pricing_cache import invalidate_pricing_cache
+from .pricing_service import bump_pricing_version
+from .schemas.product import ProductUpsert
+
+
+@dataclass(slots=True)
+class ProductCatalog:
+    # Active products at one pricing version; product writes bump that version.
+    version: int
+    products: list[dict[str, Any]]
+    by_slug: dict[str, dict[str, Any]] = field(default_factory=dict)
+    codes_by_slug: dict[str, str] = field(default_factory=dict)
+
+
+_catalog: ProductCatalog | None = None
+_lock = threading.Lock()
+
+
+def _product_dict(row: Product) -> dict[str, Any]:
+    return {
+        "id": row.id,
+        "slug": row.slug,
+        "name": row.name,
+        "description": row.description,
+        "product_code": row.product_code,
+        "basePrice": row.base_price,
+        "imageUrl": row.image_url,
+        "fixedSize": row.fixed_size,
+    }
+
+
+def load_product_catalog(session: Session, version: int) -> ProductCatalog:
+    rows = session.exec(
+        select(Product).where(Product.active).order_by(Product.sort_order, Product.id)
+    ).all()
+    products = [_product_dict(row) for row in rows]
+    return ProductCatalog(
+        version=version,
+        products=products,
+        by_slug={product["slug"]: product for product in products},
+        codes_by_slug={product["slug"]: product["product_code"] for product in products},
+    )
+
+
+def get_product_catalog(version: int) -> ProductCatalog:
+    # Reloaded only when the pricing version moves; lookups in between are dict hits.
+    global _catalog
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _lock:
+        if _catalog is None or _catalog.version != version:
+            with Session(engine) as session:
+                _catalog = load_product_catalog(session, version)
+        return _catalog
+
+
+def seed_products(session: Session) -> int:
+    rows = [
+        Product(
+            id="flyer-a5",
+            slug="szorolap-a5",
+            name="Szórólap A5",
+            description="Kétoldalas promóciós szórólap rövid határidővel.",
+            product_code="flyer",
+            base_price=8900,
+            image_url="https://images.unsplash.com/photo-1586717791821-3f44a563fa4c?auto=format&fit=crop&w=1200&q=80",
+            sort_order=0,
+        ),
+        Product(
+            id="poster-a3",
+            slug="poszter-a3",
+            name="Poszter A3",
+            description="Élénk színes poszter üzletekbe és rendezvényekre.",
+            product_code="poster",
+            base_price=6900,
+            image_url="https://images.unsplash.com/photo-1513519245088-0e12902e5a38?auto=format&fit=crop&w=1200&q=80",
+            sort_order=1,
+        ),
+        Product(
+            id="business-card-classic",
+            slug="nevjegykartya-90x50",
+            name="Névjegykártya 90x50",
+            description="Klasszikus névjegy matt vagy fényes kivitelben.",
+            product_code="business_card",
+            base_price=4900,
+            image_url="https://images.unsplash.com/photo-1586953208448-b95a79798f07?auto=format&fit=crop&w=1200&q=80",
+            fixed_size="90x50",
+            sort_order=2,
+        ),
+        Product(
+            id="sticker-sheet",
+            slug="matrica-iv",
+            name="Matrica ív",
+            description="Egyedi formájú, beltéri felhasználásra.",
+            product_code="sticker",
+            base_price=5900,
+            image_url="https://images.unsplash.com/photo-1621905252507-b35492cc74b4?auto=format&fit=crop&w=1200&q=80",
+            sort_order=3,
+        ),
+        Product(
+            id="rollup-standard",
+            slug="rollup-85x200",
+            name="Roll-up 85x200",
+            description="Kiállításokra és bemutatókra kész roll-up rendszer.",
+            product_code="rollup",
+            base_price=24900,
+            image_url="https://images.unsplash.com/photo-1523726491678-bf852e717f6a?auto=format&fit=crop&w=1200&q=80",
+            sort_order=4,
+        ),
+        Product(
+            id="brochure-a4",
+            slug="brossura-a4",
+            name="Brossúra A4 hajtott",
+            description="Termékbemutatókhoz és árlistákhoz ideális.",
+            product_code="brochure",
+            base_price=15900,
+            image_url="https://images.unsplash.com/photo-1455390582262-044cdead277a?auto=format&fit=crop&w=1200&q=80",
+            sort_order=5,
+        ),
+        Product(
+            id="booklet-a5",
+            slug="fuzet-a5",
+            name="Füzet A5",
+            description="Kisebb oldalszámú promóciós füzet.",
+            product_code="booklet",
+            base_price=19900,
+            image_url="https://images.unsplash.com/photo-1512820790803-83ca734da794?auto=format&fit=crop&w=1200&q=80",
+            sort_order=6,
+        ),
+        Product(
+            id="banner-custom",
+            slug="molino-egyedi",
+            name="Molinó egyedi méret",
+            description="Időjárásálló kültéri reklámfelület.",
+            product_code="banner",
+            base_price=12900,
+            image_url="https://images.unsplash.com/photo-1469474968028-56623f02e42e?auto=format&fit=crop&w=1200&q=80",
+            sort_order=7,
+        ),
+    ]
+
+    existing = set(session.exec(select(Product.id)).all())
+    inserted = 0
+    for row in rows:
+        if row.id in existing:
+            continue
+        session.add(row)
+        inserted += 1
+
+    if inserted:
+        _commit_product_change(session)
+
+    return inserted
+
+
+def _commit_product_change(session: Session) -> None:
+    # Products are part of the catalog, so they share the pricing version and cache.
+    bump_pricing_version(session)
+    session.commit()
+    invalidate_pricing_cache()
+
+
+def list_all_products(session: Session) -> list[Product]:
+    return session.exec(select(Product).order_by(Product.sort_order, Product.id)).all()
+
+
+def upsert_product(session: Session, product_id: str, payload: ProductUpsert) -> Product:
+    product = session.get(Product, product_id)
+    if product is None:
+        product = Product(id=product_id, **payload.model_dump())
+    else:
+        for key, value in payload.model_dump().items():
+            setattr(product, key, value)
+        product.updated_at = datetime.utcnow()
+    session.add(product)
+    _commit_product_change(session)
+    session.refresh(product)
+    return product
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import dataclasses
+import gzip
+import hashlib
+import json
+import os
+from typing import Any
+
+from fastapi.responses import Response
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Bodies below this go out uncompressed; the headers would eat the saving.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# Per-request compression by the middleware trades ratio for CPU; cached bodies
+# are compressed once, so they use the maximum levels.
+DYNAMIC_GZIP_LEVEL = 6
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 11
+COMPRESS_EXCLUDED_CONTENT_TYPES = DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/pdf",)
+# Server preference when the client weighs encodings equally.
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _default(value: Any) -> Any:
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=CACHED_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=CACHED_GZIP_LEVEL, mtime=0)
+
+
+class EncodedBody:
+    # A JSON body encoded once and kept with its compressed variants, for handlers
+    # that serve the same payload to many clients (catalog, product list).
+    __slots__ = ("raw", "etag", "_variants")
+
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw
+        self.etag = f'"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"'
+        self._variants: dict[str, bytes] = {}
+
+    @classmethod
+    def from_content(cls, content: Any) -> "EncodedBody":
+        return cls(encode_json(content))
+
+    def precompress(self) -> "EncodedBody":
+        # Call off the event loop: maximum-level brotli on a large body takes a while.
+        if len(self.raw) >= COMPRESS_MIN_BYTES:
+            for encoding in SUPPORTED_ENCODINGS:
+                self.variant(encoding)
+        return self
+
+    def variant(self, encoding: str | None) -> bytes:
+        if encoding is None:
+            return self.raw
+        data = self._variants.get(encoding)
+        if data is None:
+            data = self._variants[encoding] = _compress(self.raw, encoding)
+        return data
+
+    def response(
+        self,
+        accept_encoding: str | None,
+        if_none_match: str | None = None,
+        cache_control: str = "no-cache",
+    ) -> Response:
+        encoding = negotiate_encoding(accept_encoding) if len(self.raw) >= COMPRESS_MIN_BYTES else None
+        # Each representation gets its own strong ETag.
+        etag = self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+        headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": cache_control}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            # Already set, so the compression middleware passes the body through.
+            headers["Content-Encoding"] = encoding
+        return Response(self.variant(encoding), media_type="application/json", headers=headers)
+
+
+class PrevalidatedJSONResponse(Response):
+    # For payloads the server built itself: skips response_model validation and
+    # encodes slotted dataclasses directly.
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
@@ -1,12 +1,29 @@
-﻿from typing import Literal
+﻿from datetime import datetime
+from typing import Literal
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 
+from ..admission import admission_stats
+from ..backup import backup_status, run_backup
 from ..db import engine
-from ..order_store import ORDER_STATUS_VALUES, get_order, list_orders, update_order
+from ..events import EVENT_TOPICS, event_bus, stream_events
+from ..fx import CURRENCY_PATTERN, list_fx_rates, upsert_fx_rate
+from ..idempotency import IdempotencyConflict, idempotency_stats, run_idempotent
+from ..order_store import (
+    ORDER_STATUS_VALUES,
+    bulk_update_status,
+    get_order,
+    get_order_stats,
+    list_order_changes,
+    list_orders,
+    update_order,
+)
+from ..price_history import anchor_history, price_as_of
+from ..pricing import quote_memo_stats
 from ..pricing_service import (
     bulk_delete_anchors,
     bulk_update_anchor_prices,
@@ -15,11 +32,38 @@ from ..pricing_service import (
     list_anchors_paginated,
     update_anchor,
 )
+from ..products import list_all_products, upsert_product
+from ..responses import PrevalidatedJSONResponse
 from ..schemas.anchor import AnchorCreate, AnchorRead, AnchorUpdate
+from ..schemas.product import ProductRead, ProductUpsert
+from ..storage import release_protected, run_sweep, storage_report
 
 router = APIRouter(tags=["admin"])
 
 
+IDEMPOTENCY_KEY = Header(default=None, alias="Idempotency-Key", max_length=200)
+
+
+class StorageReleaseRequest(BaseModel):
+    # None releases every protected file.
+    fileIds: list[str] | None = None
+
+
+class FxRateUpdate(BaseModel):
+    rate: float = Field(gt=0)
+    decimals: int = Field(default=2, ge=0, le=4)
+
+
+class PriceAsOfRequest(BaseModel):
+    product_code: str
+    size: str
+    paper: str
+    color: str
+    qty: int = Field(ge=1)
+    lamination: bool = False
+    at: datetime
+
+
 class AnchorListResponse(BaseModel):
     data: list[AnchorRead]
     page: int
@@ -152,21 +196,155 @@ def remove_anchor(anchor_id: int):
     return {"ok": True}
 
 
-@router.patch("/anchors/bulk")
-def patch_anchor_bulk(payload: AnchorBulkUpdateRequest):
+@router.get("/admin/anchors/{anchor_id}/history")
+def get_anchor_history(anchor_id: int):
     with Session(engine) as session:
-        result = bulk_update_anchor_prices(
+        return anchor_history(session, anchor_id)
+
+
+@router.post("/admin/price/as-of")
+def post_price_as_of(payload: PriceAsOfRequest):
+    # What the anchor engine would have quoted at `at`, rebuilt from the price history.
+    with Session(engine) as session:
+        try:
+            result = price_as_of(
+                session,
+                payload.at,
+                payload.product_code,
+                payload.size,
+                payload.paper,
+                payload.color,
+                payload.qty,
+                payload.lamination,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=404, detail=str(exc)) from exc
+    return PrevalidatedJSONResponse(result)
+
+
+def _idempotent(scope: str, key: str | None, payload: BaseModel, execute):
+    try:
+        return run_idempotent(scope, key, payload, execute)
+    except IdempotencyConflict as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+
+
+def _bulk_update_anchors(payload: AnchorBulkUpdateRequest) -> dict:
+    with Session(engine) as session:
+        return bulk_update_anchor_prices(
             session,
             updates=[{"id": item.id, "priceFt": item.priceFt} for item in payload.updates],
         )
-    return result
+
+
+@router.patch("/anchors/bulk")
+def patch_anchor_bulk(payload: AnchorBulkUpdateRequest, idempotency_key: str | None = IDEMPOTENCY_KEY):
+    return _idempotent("anchors-bulk-update", idempotency_key, payload, lambda: _bulk_update_anchors(payload))
+
+
+def _bulk_delete_anchors(payload: AnchorBulkDeleteRequest) -> dict:
+    with Session(engine) as session:
+        return bulk_delete_anchors(session, payload.ids)
 
 
 @router.delete("/anchors/bulk")
-def delete_anchor_bulk(payload: AnchorBulkDeleteRequest):
+def delete_anchor_bulk(payload: AnchorBulkDeleteRequest, idempotency_key: str | None = IDEMPOTENCY_KEY):
+    return _idempotent("anchors-bulk-delete", idempotency_key, payload, lambda: _bulk_delete_anchors(payload))
+
+
+@router.get("/admin/products", response_model=list[ProductRead])
+def get_admin_products():
+    with Session(engine) as session:
+        return list_all_products(session)
+
+
+@router.put("/admin/products/{product_id}", response_model=ProductRead)
+def put_admin_product(product_id: str, payload: ProductUpsert):
     with Session(engine) as session:
-        result = bulk_delete_anchors(session, payload.ids)
-    return result
+        try:
+            return upsert_product(session, product_id, payload)
+        except IntegrityError as exc:
+            session.rollback()
+            raise HTTPException(status_code=409, detail="Product slug already exists.") from exc
+
+
+@router.get("/admin/backups")
+def get_admin_backups():
+    return backup_status()
+
+
+@router.post("/admin/backups")
+def post_admin_backup():
+    try:
+        target = run_backup()
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Backup failed: {exc}") from exc
+    if target is None:
+        raise HTTPException(status_code=409, detail="No SQLite database to back up")
+    return {"name": target.name, "bytes": target.stat().st_size}
+
+
+@router.get("/admin/idempotency")
+def get_admin_idempotency():
+    return idempotency_stats()
+
+
+@router.get("/admin/admission")
+async def get_admin_admission():
+    return admission_stats()
+
+
+@router.get("/admin/quote-cache")
+def get_admin_quote_cache():
+    return quote_memo_stats()
+
+
+@router.get("/admin/fx-rates")
+def get_admin_fx_rates():
+    with Session(engine) as session:
+        return list_fx_rates(session)
+
+
+@router.put("/admin/fx-rates/{currency}")
+def put_admin_fx_rate(payload: FxRateUpdate, currency: str = Path(pattern=CURRENCY_PATTERN)):
+    with Session(engine) as session:
+        try:
+            return upsert_fx_rate(session, currency, payload.rate, payload.decimals)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.get("/admin/events")
+async def get_admin_events(
+    topics: str = Query(default="orders,anchors"),
+    last_event_id: str | None = Header(default=None, alias="Last-Event-ID"),
+):
+    wanted = frozenset(topic for topic in topics.split(",") if topic in EVENT_TOPICS)
+    if not wanted:
+        raise HTTPException(status_code=400, detail="Unknown topics")
+
+    since = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    subscription = await event_bus.subscribe(wanted, since)
+    return StreamingResponse(
+        stream_events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/admin/storage")
+def get_admin_storage():
+    return storage_report()
+
+
+@router.post("/admin/storage/sweep")
+def post_admin_storage_sweep():
+    return run_sweep()
+
+
+@router.post("/admin/storage/release")
+def post_admin_storage_release(payload: StorageReleaseRequest):
+    return {"released": release_protected(payload.fileIds)}
 
 
 @router.get("/admin/orders", response_model=OrderListResponse)
@@ -180,6 +358,30 @@ def get_admin_orders(
     return OrderListResponse(data=data, page=page, pageSize=page_size, total=total)
 
 
+@router.get("/admin/orders/stats")
+def get_admin_order_stats(days: int = Query(default=30, ge=1, le=366)):
+    return get_order_stats(days=days)
+
+
+@router.get("/admin/orders/changes")
+def get_admin_order_changes(
+    since: int | None = Query(default=None, ge=0),
+    limit: int = Query(default=200, ge=1, le=1000),
+):
+    return list_order_changes(since=since, limit=limit)
+
+
+# Declared before the /admin/orders/{order_id} routes so "bulk-status" is not taken as an id.
+@router.patch("/admin/orders/bulk-status")
+def patch_admin_orders_bulk_status(payload: BulkOrderStatusRequest, idempotency_key: str | None = IDEMPOTENCY_KEY):
+    if payload.status not in ORDER_STATUS_VALUES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+
+    return _idempotent(
+        "orders-bulk-status", idempotency_key, payload, lambda: bulk_update_status(payload.ids, payload.status)
+    )
+
+
 @router.get("/admin/orders/{order_id}")
 def get_admin_order_detail(order_id: str):
     order = get_order(order_id)
@@ -197,20 +399,3 @@ def patch_admin_order(order_id: str, payload: OrderPatchRequest):
     if updated is None:
         raise HTTPException(status_code=404, detail="Order not found")
     return updated
-
-
-@router.patch("/admin/orders/bulk-status")
-def patch_admin_orders_bulk_status(payload: BulkOrderStatusRequest):
-    if payload.status not in ORDER_STATUS_VALUES:
-        raise HTTPException(status_code=400, detail="Invalid status")
-
-    updated = 0
-    not_found: list[str] = []
-    for order_id in payload.ids:
-        row = update_order(order_id, status=payload.status)
-        if row is None:
-            not_found.append(order_id)
-        else:
-            updated += 1
-
-    return {"updated": updated, "notFoundIds": not_found}
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import uuid
+from pathlib import Path
+
+from fastapi import APIRouter, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, Response
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from ..chunked_uploads import (
+    UploadSessionError,
+    create_session,
+    finalize_session,
+    session_status,
+    write_chunk,
+)
+from ..responses import etag_matches
+from ..storage import StorageQuotaExceeded, check_quota, register_upload
+from ..thumbnails import (
+    THUMB_RENDER_TIMEOUT_SECONDS,
+    find_source,
+    schedule_thumbnail,
+    thumbnail_path,
+    thumbnail_queue_full,
+)
+from ..uploads import (
+    ALLOWED_EXTENSIONS,
+    ALLOWED_MIME_TYPES,
+    MAX_UPLOAD_SIZE,
+    UPLOAD_CACHE_CONTROL,
+    UPLOAD_DIR,
+    content_etag,
+    file_etag,
+    remember_etag,
+    resolve_upload,
+)
+
+router = APIRouter(tags=["uploads"])
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(min_length=1)
+    size: int = Field(gt=0)
+    contentType: str = "application/octet-stream"
+
+
+class UploadSessionFinalize(BaseModel):
+    # Whole-file digest; the per-chunk checksums cannot catch a chunk written at the
+    # wrong offset or one marked received that is not on disk.
+    sha256: str = Field(pattern="^[0-9a-fA-F]{64}$")
+
+
+def _client_key(request: Request) -> str | None:
+    # Uploads are anonymous; quotas are kept per client address.
+    return request.client.host if request.client else None
+
+
+def _write_upload(path: Path, content: bytes) -> None:
+    path.write_bytes(content)
+    # The content is already in memory, so the download ETag costs nothing here.
+    remember_etag(path.name, path.stat(), content_etag(content))
+
+
+@router.post("/upload")
+async def upload(request: Request, file: UploadFile = File(...)):
+    original_name = file.filename or "unknown"
+    content_type = file.content_type or "application/octet-stream"
+    extension = Path(original_name).suffix.lower()
+
+    if content_type not in ALLOWED_MIME_TYPES and extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Csak PDF/JPG/PNG engedélyezett")
+
+    content = await file.read()
+    size = len(content)
+
+    if size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=400, detail="Túl nagy fájl (max 20MB)")
+
+    if extension not in ALLOWED_EXTENSIONS:
+        extension = {
+            "application/pdf": ".pdf",
+            "image/jpeg": ".jpg",
+            "image/png": ".png",
+        }.get(content_type, "")
+
+    owner = _client_key(request)
+    try:
+        await run_in_threadpool(check_quota, owner, size)
+    except StorageQuotaExceeded as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+
+    file_id = str(uuid.uuid4())
+    stored_name = f"{file_id}{extension}"
+    path = UPLOAD_DIR / stored_name
+    # Up to MAX_UPLOAD_SIZE of disk writes and hashing, kept off the event loop.
+    await run_in_threadpool(_write_upload, path, content)
+    await run_in_threadpool(register_upload, file_id, stored_name, size, owner)
+    schedule_thumbnail(file_id)
+
+    return {
+        "fileId": file_id,
+        "originalName": original_name,
+        "storedName": stored_name,
+        "size": size,
+        "contentType": content_type,
+        "url": f"/uploads/{stored_name}",
+    }
+
+
+@router.post("/uploads/sessions", status_code=201)
+def post_upload_session(payload: UploadSessionCreate, request: Request):
+    try:
+        check_quota(_client_key(request), payload.size)
+        return create_session(payload.filename, payload.size, payload.contentType)
+    except (UploadSessionError, StorageQuotaExceeded) as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+
+
+@router.get("/uploads/sessions/{upload_id}")
+def get_upload_session(upload_id: str):
+    try:
+        return session_status(upload_id)
+    except UploadSessionError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+
+
+@router.put("/uploads/sessions/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(ge=0),
+    chunk_sha256: str | None = Header(default=None, alias="X-Chunk-Sha256"),
+):
+    try:
+        return await write_chunk(upload_id, offset, request.stream(), chunk_sha256)
+    except UploadSessionError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+
+
+@router.post("/uploads/sessions/{upload_id}/finalize")
+def post_upload_finalize(upload_id: str, payload: UploadSessionFinalize, request: Request):
+    try:
+        result = finalize_session(upload_id, payload.sha256)
+    except UploadSessionError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+    register_upload(result["fileId"], result["storedName"], result["size"], _client_key(request))
+    schedule_thumbnail(result["fileId"])
+    return result
+
+
+async def _serve_immutable(path: Path, if_none_match: str | None) -> Response:
+    stat_result = await run_in_threadpool(os.stat, path)
+    etag = await run_in_threadpool(file_etag, path, stat_result)
+    headers = {"ETag": etag, "Cache-Control": UPLOAD_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse answers Range/If-Range requests and hands the whole file to the
+    # server via pathsend where the server supports it.
+    return FileResponse(path, headers=headers, stat_result=stat_result)
+
+
+@router.api_route("/uploads/{name}", methods=["GET", "HEAD"])
+async def get_upload(name: str, if_none_match: str | None = Header(default=None)):
+    path = resolve_upload(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return await _serve_immutable(path, if_none_match)
+
+
+@router.get("/uploads/{file_id}/thumb")
+async def get_upload_thumbnail(file_id: str, if_none_match: str | None = Header(default=None)):
+    if file_id != Path(file_id).name or "." in file_id:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    path = thumbnail_path(file_id)
+    if not path.exists():
+        # Not rendered yet (queue was full, or the server restarted): render now,
+        # within the same queue bound as uploads.
+        job = schedule_thumbnail(file_id)
+        if job is None and thumbnail_queue_full() and await run_in_threadpool(find_source, file_id):
+            return Response(status_code=202, headers={"Retry-After": "5", "Cache-Control": "no-store"})
+        if job is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), THUMB_RENDER_TIMEOUT_SECONDS)
+            except Exception:
+                pass
+        if not path.exists():
+            raise HTTPException(status_code=404, detail="Nincs előnézet")
+
+    return await _serve_immutable(path, if_none_match)
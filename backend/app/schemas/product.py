@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class ProductUpsert(BaseModel):
+    slug: str = Field(min_length=1)
+    product_code: str = Field(min_length=1)
+    name: str = Field(min_length=1)
+    description: str = ""
+    base_price: int = Field(default=0, ge=0)
+    image_url: str = ""
+    fixed_size: str | None = None
+    sort_order: int = 0
+    active: bool = True
+
+
+class ProductRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    slug: str
+    product_code: str
+    name: str
+    description: str
+    base_price: int
+    image_url: str
+    fixed_size: str | None
+    sort_order: int
+    active: bool
+    updated_at: datetime
@@ -29,3 +29,4 @@ class QuoteCreateRequest(BaseModel):
 class QuoteCreateResponse(BaseModel):
     message: str
     id: str
+    totalFt: float | None = None
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Any, Iterable
+
+from sqlalchemy import Engine, create_engine, inspect, text
+
+from .order_pricing import LineKey, normalize_item
+from .price_snapshot import AnchorRecord, PricingSnapshot, compile_snapshot
+from .pricing import AnchorSurcharges, calculate_anchor_price
+from .pricing_service import build_catalog
+
+# Offline what-if pricing: python -m app.simulation --db copy-of-app.db --candidate candidate.json
+#
+# The candidate file is JSON with any of:
+#   "anchors":    [{"product_code", "material_code", "size_key", "anchor_qty", "anchor_price"}, ...]
+#                 added, or replacing the row with the same key; anchor_price null removes it
+#   "scale":      {"<product_code>": 1.05, ...} multiplies that product's current anchor prices;
+#                 applied before "anchors", so prices listed there are used as written
+#   "surcharges": {"paper_170g", "color_4_0", "color_4_4", "lamination", "min_price"}
+#
+# The database is opened read-only and nothing here touches the live pricing
+# snapshot or caches, so it is safe to run next to a running server.
+
+GRID_MAX_QTY = 10_000
+GRID_QTY_STEP = 10
+
+AnchorKey = tuple[str, str, str, int]
+# (product_code, size, paper) as the calculator sends them.
+CatalogLine = tuple[str, str, str]
+
+
+class Model:
+    # Prices go through calculate_anchor_price on a snapshot compiled from the rows,
+    # so the simulation follows the live rules rather than a copy of them.
+    def __init__(self, rows: Iterable[AnchorRecord], surcharges: AnchorSurcharges) -> None:
+        self.rows = list(rows)
+        self.snapshot = PricingSnapshot(compile_snapshot(0, self.rows, [], [], []))
+        self.surcharges = surcharges
+
+    def line_price(self, key: LineKey) -> int | None:
+        product_code, size, paper, color, qty, lamination = key
+        try:
+            result = calculate_anchor_price(
+                self.snapshot, product_code, size, paper, color, qty, lamination, self.surcharges
+            )
+        except ValueError:
+            return None
+        return int(result.final_price)
+
+    def resolved_quantities(self, line: CatalogLine, quantities: list[int]) -> list[int] | None:
+        product_code, size, paper = line
+        if not quantities or self.snapshot.resolve_anchor(product_code, paper, size, quantities[0]) is None:
+            return None
+        return [self.snapshot.resolve_anchor(product_code, paper, size, qty)[0] for qty in quantities]
+
+    def grid_prices(self, line: CatalogLine, resolved: list[int], color: str, lamination: bool) -> list[int]:
+        # A price only depends on the anchor a quantity resolves to, so each anchor
+        # is priced once and the column is filled from those.
+        product_code, size, paper = line
+        prices = {
+            anchor_qty: self.line_price((product_code, size, paper, color, anchor_qty, lamination))
+            for anchor_qty in set(resolved)
+        }
+        return [prices[anchor_qty] for anchor_qty in resolved]
+
+
+def open_readonly(path: Path) -> Engine:
+    if not path.is_file():
+        raise SystemExit(f"Database not found: {path}")
+    return create_engine(f"sqlite:///file:{path.resolve()}?mode=ro&uri=true")
+
+
+def load_anchor_rows(engine: Engine) -> list[AnchorRecord]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT product_code, material_code, size_key, anchor_qty, anchor_price FROM anchor_prices")
+        ).all()
+    return [AnchorRecord(row[0], row[1], row[2], int(row[3]), float(row[4])) for row in rows]
+
+
+def load_order_items(engine: Engine) -> tuple[list[dict[str, Any]], dict[str, str]]:
+    tables = set(inspect(engine).get_table_names())
+    items: list[dict[str, Any]] = []
+    codes: dict[str, str] = {}
+    with engine.connect() as conn:
+        if "products" in tables:
+            codes.update(conn.execute(text("SELECT slug, product_code FROM products")).all())
+        if "orders" in tables:
+            for (raw,) in conn.execute(text("SELECT items FROM orders")):
+                items.extend(json.loads(raw or "[]"))
+    return items, codes
+
+
+def load_catalog_inputs(engine: Engine) -> tuple[list[dict[str, Any]], list[str]]:
+    # What build_catalog needs to list the configurations the calculator offers.
+    tables = set(inspect(engine).get_table_names())
+    products: list[dict[str, Any]] = []
+    print_modes: list[str] = []
+    with engine.connect() as conn:
+        if "products" in tables:
+            rows = conn.execute(
+                text(
+                    "SELECT id, slug, name, description, base_price, product_code, fixed_size "
+                    "FROM products WHERE active ORDER BY sort_order, id"
+                )
+            ).all()
+            products = [
+                {
+                    "id": row[0],
+                    "slug": row[1],
+                    "name": row[2],
+                    "description": row[3],
+                    "basePrice": row[4],
+                    "product_code": row[5],
+                    "fixedSize": row[6],
+                }
+                for row in rows
+            ]
+        if "sheet_prices" in tables:
+            print_modes = [row[0] for row in conn.execute(text("SELECT DISTINCT print_mode FROM sheet_prices"))]
+    return products, print_modes
+
+
+def catalog_lines(
+    rows: list[AnchorRecord], products: list[dict[str, Any]], print_modes: list[str]
+) -> dict[CatalogLine, set[str]]:
+    # The size/paper/color combinations the live catalog offers for these anchors,
+    # so the grid prices what customers can actually pick.
+    if not products:
+        # A database from before the products table: one entry per anchored product.
+        products = [
+            {"id": code, "slug": code, "name": code, "description": "", "basePrice": 0, "product_code": code}
+            for code in sorted({row.product_code for row in rows})
+        ]
+    lines: dict[CatalogLine, set[str]] = defaultdict(set)
+    for product in build_catalog(rows, print_modes, products)["products"]:
+        for combination in product["validCombinations"]:
+            line = (product["product_code"], combination["size"], combination["paper"])
+            lines[line].add(combination["color"])
+    return lines
+
+
+def apply_candidate(
+    rows: list[AnchorRecord], candidate: dict[str, Any]
+) -> tuple[list[AnchorRecord], AnchorSurcharges]:
+    scale = candidate.get("scale", {})
+    by_key: dict[AnchorKey, AnchorRecord] = {
+        (row.product_code, row.material_code, row.size_key, row.anchor_qty): row._replace(
+            anchor_price=row.anchor_price * float(scale.get(row.product_code, 1.0))
+        )
+        for row in rows
+    }
+    for entry in candidate.get("anchors", []):
+        key = (entry["product_code"], entry["material_code"], entry["size_key"], int(entry["anchor_qty"]))
+        if entry.get("anchor_price") is None:
+            by_key.pop(key, None)
+        else:
+            by_key[key] = AnchorRecord(*key, float(entry["anchor_price"]))
+    surcharges = replace(AnchorSurcharges(), **candidate.get("surcharges", {}))
+    return list(by_key.values()), surcharges
+
+
+def _product_summary() -> dict[str, Any]:
+    return {"lines": 0, "baselineFt": 0, "candidateFt": 0, "changed": 0, "unpriced": 0}
+
+
+def _finish(summary: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    for entry in summary.values():
+        entry["deltaFt"] = entry["candidateFt"] - entry["baselineFt"]
+        entry["deltaPct"] = round(100 * entry["deltaFt"] / entry["baselineFt"], 2) if entry["baselineFt"] else None
+    return dict(sorted(summary.items()))
+
+
+def simulate_orders(
+    items: list[dict[str, Any]], codes: dict[str, str], baseline: Model, candidate: Model
+) -> dict[str, dict[str, Any]]:
+    # Each distinct line is priced once under each model, then weighted by its count.
+    lines: Counter[LineKey] = Counter()
+    invalid: Counter[str] = Counter()
+    for item in items:
+        mapping = codes
+        if item.get("productCode"):
+            mapping = {str(item.get("productSlug", "")): item["productCode"]}
+        try:
+            lines[normalize_item(item, mapping)] += 1
+        except ValueError:
+            invalid[str(item.get("productCode") or item.get("productSlug") or "")] += 1
+
+    summary: dict[str, dict[str, Any]] = defaultdict(_product_summary)
+    for key, count in lines.items():
+        entry = summary[key[0]]
+        before, after = baseline.line_price(key), candidate.line_price(key)
+        entry["lines"] += count
+        if before is None or after is None:
+            entry["unpriced"] += count
+            continue
+        entry["baselineFt"] += before * count
+        entry["candidateFt"] += after * count
+        if before != after:
+            entry["changed"] += count
+    for product_code, count in invalid.items():
+        summary[product_code]["lines"] += count
+        summary[product_code]["unpriced"] += count
+    return _finish(summary)
+
+
+def grid_quantities(max_qty: int = GRID_MAX_QTY, step: int = GRID_QTY_STEP) -> list[int]:
+    return list(range(step, max_qty + 1, step))
+
+
+def simulate_grid(
+    baseline: Model,
+    candidate: Model,
+    quantities: list[int],
+    products: list[dict[str, Any]] | None = None,
+    print_modes: list[str] | None = None,
+) -> tuple[dict[str, dict[str, Any]], int, dict[str, int]]:
+    # Every catalog configuration x lamination x quantity, evaluated a column at a time.
+    # Also counts the quotes each surcharge applies to, so a candidate surcharge no
+    # configuration uses shows up as such instead of as "no change".
+    lines: dict[CatalogLine, set[str]] = defaultdict(set)
+    for model in (baseline, candidate):
+        for line, colors in catalog_lines(model.rows, products or [], print_modes or []).items():
+            lines[line] |= colors
+
+    summary: dict[str, dict[str, Any]] = defaultdict(_product_summary)
+    coverage = {"paper_170g": 0, "color_4_0": 0, "color_4_4": 0, "lamination": 0}
+    evaluated = 0
+    for line in sorted(lines):
+        entry = summary[line[0]]
+        resolved_before = baseline.resolved_quantities(line, quantities)
+        resolved_after = candidate.resolved_quantities(line, quantities)
+        for color in sorted(lines[line]):
+            for lamination in (False, True):
+                entry["lines"] += len(quantities)
+                evaluated += 2 * len(quantities)
+                if resolved_before is None or resolved_after is None:
+                    entry["unpriced"] += len(quantities)
+                    continue
+                before = baseline.grid_prices(line, resolved_before, color, lamination)
+                after = candidate.grid_prices(line, resolved_after, color, lamination)
+                entry["baselineFt"] += sum(before)
+                entry["candidateFt"] += sum(after)
+                entry["changed"] += sum(1 for old, new in zip(before, after) if old != new)
+                for name, applies in (
+                    ("paper_170g", line[2] == "170g"),
+                    ("color_4_0", color == "4+0"),
+                    ("color_4_4", color == "4+4"),
+                    ("lamination", lamination),
+                ):
+                    if applies:
+                        coverage[name] += len(quantities)
+    return _finish(summary), evaluated, coverage
+
+
+def run_simulation(
+    db_path: Path,
+    candidate: dict[str, Any],
+    grid: bool = True,
+    max_qty: int = GRID_MAX_QTY,
+    step: int = GRID_QTY_STEP,
+) -> dict[str, Any]:
+    started = time.perf_counter()
+    engine = open_readonly(db_path)
+    try:
+        rows = load_anchor_rows(engine)
+        items, codes = load_order_items(engine)
+        products, print_modes = load_catalog_inputs(engine)
+    finally:
+        engine.dispose()
+    loaded = time.perf_counter()
+
+    candidate_rows, candidate_surcharges = apply_candidate(rows, candidate)
+    baseline = Model(rows, AnchorSurcharges())
+    proposed = Model(candidate_rows, candidate_surcharges)
+
+    report: dict[str, Any] = {
+        "database": str(db_path),
+        "surcharges": {"baseline": asdict(baseline.surcharges), "candidate": asdict(candidate_surcharges)},
+        "orders": simulate_orders(items, codes, baseline, proposed),
+        "orderLines": len(items),
+    }
+    priced_orders = time.perf_counter()
+    if grid:
+        report["grid"], report["gridQuotes"], report["surchargeCoverage"] = simulate_grid(
+            baseline, proposed, grid_quantities(max_qty, step), products, print_modes
+        )
+    report["timings"] = {
+        "loadSeconds": round(loaded - started, 3),
+        "ordersSeconds": round(priced_orders - loaded, 3),
+        "gridSeconds": round(time.perf_counter() - priced_orders, 3),
+    }
+    return report
+
+
+def _print_table(title: str, summary: dict[str, dict[str, Any]]) -> None:
+    print(title)
+    print(f"  {'product':<16}{'lines':>10}{'changed':>10}{'baseline Ft':>16}{'candidate Ft':>16}{'delta Ft':>14}{'delta %':>9}")
+    for product_code, entry in summary.items():
+        pct = f"{entry['deltaPct']:.2f}" if entry["deltaPct"] is not None else "-"
+        print(
+            f"  {product_code or '?':<16}{entry['lines']:>10}{entry['changed']:>10}"
+            f"{entry['baselineFt']:>16,}{entry['candidateFt']:>16,}{entry['deltaFt']:>14,}{pct:>9}"
+        )
+        if entry["unpriced"]:
+            print(f"  {'':<16}{entry['unpriced']:>10} without a price")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.simulation")
+    parser.add_argument("--db", type=Path, required=True, help="copy of app.db (opened read-only)")
+    parser.add_argument("--candidate", type=Path, help="JSON file with candidate anchors/surcharges")
+    parser.add_argument("--no-grid", action="store_true", help="only replay stored orders")
+    parser.add_argument("--max-qty", type=int, default=GRID_MAX_QTY)
+    parser.add_argument("--qty-step", type=int, default=GRID_QTY_STEP)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    candidate = json.loads(args.candidate.read_text(encoding="utf-8")) if args.candidate else {}
+    report = run_simulation(args.db, candidate, grid=not args.no_grid, max_qty=args.max_qty, step=args.qty_step)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    _print_table(f"Stored orders ({report['orderLines']} lines)", report["orders"])
+    if "grid" in report:
+        _print_table(f"Configuration grid ({report['gridQuotes']:,} quotes)", report["grid"])
+        surcharges = report["surcharges"]
+        for name, quotes in report["surchargeCoverage"].items():
+            if not quotes and surcharges["baseline"][name] != surcharges["candidate"][name]:
+                print(f"  {name} changed, but no catalog configuration uses it")
+    timings = report["timings"]
+    print(
+        f"load {timings['loadSeconds']}s, orders {timings['ordersSeconds']}s, grid {timings['gridSeconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from sqlalchemy import Connection, delete, func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+
+from .chunked_uploads import collect_stale_sessions
+from .db import session_scope
+from .models import StorageUsage, StoredFile
+from .thumbnails import thumbnail_path
+from .uploads import ALLOWED_EXTENSIONS, UPLOAD_DIR
+
+# Files no order points at are deleted once they are older than this.
+STORAGE_ORPHAN_TTL_SECONDS = float(os.getenv("STORAGE_ORPHAN_TTL_SECONDS", str(7 * 24 * 3600)))
+# Everything under UPLOAD_DIR, referenced or not.
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(50 * 1024**3)))
+# Per client: bytes in files that no order references yet.
+STORAGE_CLIENT_QUOTA_BYTES = int(os.getenv("STORAGE_CLIENT_QUOTA_BYTES", str(2 * 1024**3)))
+# 0 disables the background sweeper.
+STORAGE_SWEEP_INTERVAL_SECONDS = float(os.getenv("STORAGE_SWEEP_INTERVAL_SECONDS", "60"))
+STORAGE_SWEEP_BATCH = 1000
+# Fresh files may still be registering; the directory walk leaves them alone.
+STORAGE_WALK_MIN_AGE_SECONDS = 3600.0
+STORAGE_TOP_CLIENTS = 10
+TOTAL_KEY = ""
+ID_CHUNK_SIZE = 500
+
+# owner -> [files, bytes, unreferenced_bytes]
+UsageDeltas = dict[str, list[int]]
+
+_walk: Iterator[os.DirEntry] | None = None
+_sweep_lock = threading.Lock()
+_sweep_state: dict[str, Any] = {
+    "lastRunAt": None,
+    "removedFiles": 0,
+    "removedBytes": 0,
+    "registeredFiles": 0,
+    "walkPasses": 0,
+}
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+class StorageQuotaExceeded(ValueError):
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _new_deltas() -> UsageDeltas:
+    return defaultdict(lambda: [0, 0, 0])
+
+
+def _add(deltas: UsageDeltas, owner: str | None, files: int, size: int, unreferenced: int) -> None:
+    for key in (TOTAL_KEY, owner) if owner else (TOTAL_KEY,):
+        entry = deltas[key]
+        entry[0] += files
+        entry[1] += size
+        entry[2] += unreferenced
+
+
+def _apply_usage(target: Session | Connection, deltas: UsageDeltas) -> None:
+    # Incremented in SQL, in the caller's transaction, like the order stats counters.
+    rows = [
+        {"owner_key": owner, "files": files, "bytes": size, "unreferenced_bytes": unreferenced}
+        for owner, (files, size, unreferenced) in deltas.items()
+        if files or size or unreferenced
+    ]
+    if not rows:
+        return
+
+    statement = insert(StorageUsage).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["owner_key"],
+        set_={
+            "files": StorageUsage.files + statement.excluded.files,
+            "bytes": StorageUsage.bytes + statement.excluded.bytes,
+            "unreferenced_bytes": StorageUsage.unreferenced_bytes + statement.excluded.unreferenced_bytes,
+        },
+    )
+    target.execute(statement)
+
+
+def _chunks(values: list[str]):
+    for start in range(0, len(values), ID_CHUNK_SIZE):
+        yield values[start : start + ID_CHUNK_SIZE]
+
+
+def _file_on_disk(file_id: str) -> Path | None:
+    for extension in ALLOWED_EXTENSIONS:
+        path = UPLOAD_DIR / f"{file_id}{extension}"
+        if path.is_file():
+            return path
+    return None
+
+
+def order_file_ids(items: Iterable[dict[str, Any]]) -> list[str]:
+    file_ids = []
+    for item in items or []:
+        upload = item.get("upload") if isinstance(item, dict) else None
+        file_id = upload.get("fileId") if isinstance(upload, dict) else None
+        if isinstance(file_id, str) and file_id and file_id not in file_ids:
+            file_ids.append(file_id)
+    return file_ids
+
+
+def check_quota(owner: str | None, size: int) -> None:
+    keys = [TOTAL_KEY, owner] if owner else [TOTAL_KEY]
+    with session_scope() as session:
+        usage = {
+            row.owner_key: (row.bytes, row.unreferenced_bytes)
+            for row in session.exec(select(StorageUsage).where(StorageUsage.owner_key.in_(keys))).all()
+        }
+
+    total_bytes, _ = usage.get(TOTAL_KEY, (0, 0))
+    if total_bytes + size > STORAGE_QUOTA_BYTES:
+        raise StorageQuotaExceeded("A tárhely megtelt, kérjük próbálja újra később", status_code=507)
+    if owner:
+        _, unreferenced = usage.get(owner, (0, 0))
+        if unreferenced + size > STORAGE_CLIENT_QUOTA_BYTES:
+            raise StorageQuotaExceeded(
+                "Túl sok megrendeletlen feltöltött fájl, adja le a rendelést vagy próbálja később",
+                status_code=413,
+            )
+
+
+def register_upload(file_id: str, stored_name: str, size: int, owner: str | None) -> None:
+    deltas = _new_deltas()
+    _add(deltas, owner, 1, size, size)
+    with session_scope() as session:
+        session.add(StoredFile(file_id=file_id, stored_name=stored_name, size=size, owner_key=owner))
+        session.flush()
+        _apply_usage(session, deltas)
+
+
+def reference_uploads(target: Session | Connection, file_ids: Iterable[str]) -> None:
+    # Called in the order's transaction; a file referenced by any order is never swept.
+    counts = Counter(file_ids)
+    by_count: dict[int, list[str]] = defaultdict(list)
+    for file_id, count in counts.items():
+        by_count[count].append(file_id)
+
+    deltas = _new_deltas()
+    found: set[str] = set()
+    for count, ids in by_count.items():
+        for chunk in _chunks(ids):
+            rows = target.execute(
+                update(StoredFile)
+                .where(StoredFile.file_id.in_(chunk))
+                .values(ref_count=StoredFile.ref_count + count)
+                .returning(StoredFile.file_id, StoredFile.ref_count, StoredFile.size, StoredFile.owner_key)
+            ).all()
+            for file_id, ref_count, size, owner in rows:
+                found.add(file_id)
+                if ref_count == count:
+                    _add(deltas, owner, 0, 0, -size)
+
+    # Uploaded before tracking began and not reached by the sweep's walk yet.
+    untracked = []
+    for file_id in counts.keys() - found:
+        path = _file_on_disk(file_id)
+        if path is not None:
+            size = path.stat().st_size
+            untracked.append(
+                {
+                    "file_id": file_id,
+                    "stored_name": path.name,
+                    "size": size,
+                    "ref_count": counts[file_id],
+                    "created_at": datetime.utcnow(),
+                }
+            )
+            _add(deltas, None, 1, size, 0)
+    if untracked:
+        target.execute(insert(StoredFile).values(untracked).on_conflict_do_nothing())
+    _apply_usage(target, deltas)
+
+
+def sweep_orphans(limit: int = STORAGE_SWEEP_BATCH) -> tuple[int, int]:
+    cutoff = datetime.utcnow() - timedelta(seconds=STORAGE_ORPHAN_TTL_SECONDS)
+    candidates = (
+        select(StoredFile.file_id)
+        .where(StoredFile.ref_count == 0, StoredFile.created_at < cutoff, StoredFile.protected.is_(False))
+        .order_by(StoredFile.ref_count, StoredFile.created_at)
+        .limit(limit)
+    )
+    deltas = _new_deltas()
+    with session_scope() as session:
+        # The ref_count guard makes concurrent sweeps in other workers harmless:
+        # each row is deleted, and its bytes subtracted, exactly once.
+        rows = session.execute(
+            delete(StoredFile)
+            .where(StoredFile.file_id.in_(candidates), StoredFile.ref_count == 0, StoredFile.protected.is_(False))
+            .returning(StoredFile.file_id, StoredFile.stored_name, StoredFile.size, StoredFile.owner_key)
+        ).all()
+        for _, _, size, owner in rows:
+            _add(deltas, owner, -1, -size, -size)
+        _apply_usage(session, deltas)
+
+    # Unlinked after the commit; a crash in between leaves files the walk re-registers.
+    for file_id, stored_name, _, _ in rows:
+        (UPLOAD_DIR / stored_name).unlink(missing_ok=True)
+        thumbnail_path(file_id).unlink(missing_ok=True)
+    return len(rows), sum(row[2] for row in rows)
+
+
+def _next_entries(limit: int) -> list[os.DirEntry]:
+    # One scandir pass is spread over many sweeps, so millions of files cost a
+    # bounded amount of work per tick and never a full listing in memory.
+    global _walk
+    if _walk is None:
+        _walk = os.scandir(UPLOAD_DIR)
+    batch = []
+    for entry in _walk:
+        batch.append(entry)
+        if len(batch) >= limit:
+            return batch
+    _walk.close()
+    _walk = None
+    _sweep_state["walkPasses"] += 1
+    return batch
+
+
+def register_untracked(entries: list[os.DirEntry]) -> int:
+    now = time.time()
+    candidates: dict[str, dict[str, Any]] = {}
+    for entry in entries:
+        file_id, extension = os.path.splitext(entry.name)
+        if entry.name.startswith(".") or extension.lower() not in ALLOWED_EXTENSIONS:
+            continue
+        try:
+            if not entry.is_file():
+                continue
+            stat_result = entry.stat()
+        except FileNotFoundError:
+            continue
+        if now - stat_result.st_mtime < STORAGE_WALK_MIN_AGE_SECONDS:
+            continue
+        # Nothing says whether an order uses this file, so it is kept until released,
+        # and its TTL only starts counting from now.
+        candidates[file_id] = {
+            "file_id": file_id,
+            "stored_name": entry.name,
+            "size": stat_result.st_size,
+            "protected": True,
+            "created_at": datetime.utcnow(),
+        }
+    if not candidates:
+        return 0
+
+    registered = 0
+    with session_scope() as session:
+        for chunk in _chunks(list(candidates)):
+            known = set(session.exec(select(StoredFile.file_id).where(StoredFile.file_id.in_(chunk))).all())
+            rows = [candidates[file_id] for file_id in chunk if file_id not in known]
+            if not rows:
+                continue
+            sizes = session.execute(
+                insert(StoredFile).values(rows).on_conflict_do_nothing().returning(StoredFile.size)
+            ).scalars().all()
+            deltas = _new_deltas()
+            for size in sizes:
+                _add(deltas, None, 1, size, size)
+            _apply_usage(session, deltas)
+            registered += len(sizes)
+    return registered
+
+
+def run_sweep(batch: int = STORAGE_SWEEP_BATCH) -> dict[str, Any]:
+    with _sweep_lock:
+        removed, removed_bytes = sweep_orphans(batch)
+        registered = register_untracked(_next_entries(batch))
+        collect_stale_sessions()
+        _sweep_state["lastRunAt"] = datetime.utcnow().isoformat()
+        _sweep_state["removedFiles"] += removed
+        _sweep_state["removedBytes"] += removed_bytes
+        _sweep_state["registeredFiles"] += registered
+        return {"removedFiles": removed, "removedBytes": removed_bytes, "registeredFiles": registered}
+
+
+def _sweep_loop() -> None:
+    while not _stop.wait(STORAGE_SWEEP_INTERVAL_SECONDS):
+        try:
+            run_sweep()
+        except Exception:
+            # Nothing is lost; the next tick picks up where this one stopped.
+            continue
+
+
+def start_storage_sweeper() -> None:
+    global _thread
+    if STORAGE_SWEEP_INTERVAL_SECONDS <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_sweep_loop, name="storage-sweeper", daemon=True)
+    _thread.start()
+
+
+def stop_storage_sweeper() -> None:
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5.0)
+        _thread = None
+
+
+def release_protected(file_ids: list[str] | None = None) -> int:
+    # Hands walked files over to the normal orphan TTL, counted from the release.
+    statement = update(StoredFile).where(StoredFile.protected.is_(True))
+    if file_ids is not None:
+        statement = statement.where(StoredFile.file_id.in_(file_ids))
+    with session_scope() as session:
+        return int(
+            session.exec(statement.values(protected=False, created_at=datetime.utcnow())).rowcount or 0
+        )
+
+
+def storage_report() -> dict[str, Any]:
+    cutoff = datetime.utcnow() - timedelta(seconds=STORAGE_ORPHAN_TTL_SECONDS)
+    with session_scope() as session:
+        total = session.get(StorageUsage, TOTAL_KEY)
+        totals = {
+            "files": total.files if total is not None else 0,
+            "bytes": total.bytes if total is not None else 0,
+            "unreferencedBytes": total.unreferenced_bytes if total is not None else 0,
+        }
+        expired = session.exec(
+            select(func.count())
+            .select_from(StoredFile)
+            .where(StoredFile.ref_count == 0, StoredFile.created_at < cutoff, StoredFile.protected.is_(False))
+        ).one()
+        protected = session.exec(
+            select(func.count(), func.coalesce(func.sum(StoredFile.size), 0)).where(
+                StoredFile.protected.is_(True)
+            )
+        ).one()
+        clients = [
+            {
+                "ownerKey": row.owner_key,
+                "files": row.files,
+                "bytes": row.bytes,
+                "unreferencedBytes": row.unreferenced_bytes,
+            }
+            for row in session.exec(
+                select(StorageUsage)
+                .where(StorageUsage.owner_key != TOTAL_KEY)
+                .order_by(StorageUsage.unreferenced_bytes.desc())
+                .limit(STORAGE_TOP_CLIENTS)
+            ).all()
+        ]
+
+    disk = shutil.disk_usage(UPLOAD_DIR)
+    return {
+        **totals,
+        "expiredOrphans": int(expired or 0),
+        "protectedFiles": int(protected[0]),
+        "protectedBytes": int(protected[1]),
+        "quotaBytes": STORAGE_QUOTA_BYTES,
+        "clientQuotaBytes": STORAGE_CLIENT_QUOTA_BYTES,
+        "orphanTtlSeconds": STORAGE_ORPHAN_TTL_SECONDS,
+        "disk": {"totalBytes": disk.total, "usedBytes": disk.used, "freeBytes": disk.free},
+        "topClients": clients,
+        "sweep": {**_sweep_state, "walkInProgress": _walk is not None},
+    }
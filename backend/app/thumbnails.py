@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+from .uploads import ALLOWED_EXTENSIONS, UPLOAD_DIR
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+THUMB_DIR = UPLOAD_DIR / "thumbs"
+THUMB_MAX_PX = int(os.getenv("THUMB_MAX_PX", "320"))
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+# Jobs beyond this are not queued, on upload or on demand; the thumb endpoint asks
+# the client to come back later instead.
+THUMB_QUEUE_MAX = int(os.getenv("THUMB_QUEUE_MAX", "64"))
+THUMB_RENDER_TIMEOUT_SECONDS = 30.0
+# Refuses decompression bombs before they reach the worker's memory.
+THUMB_MAX_SOURCE_PIXELS = 200_000_000
+PDFTOPPM = shutil.which("pdftoppm")
+
+_executor: ProcessPoolExecutor | None = None
+_inflight: dict[str, Future] = {}
+_lock = threading.Lock()
+
+
+def thumbnails_supported() -> bool:
+    return Image is not None
+
+
+def thumbnail_path(file_id: str) -> Path:
+    return THUMB_DIR / f"{file_id}.webp"
+
+
+def find_source(file_id: str) -> Path | None:
+    for extension in ALLOWED_EXTENSIONS:
+        path = UPLOAD_DIR / f"{file_id}{extension}"
+        if path.is_file():
+            return path
+    return None
+
+
+def _rasterize_pdf(source: str, workdir: str) -> str | None:
+    if PDFTOPPM is None:
+        return None
+    prefix = os.path.join(workdir, "page")
+    subprocess.run(
+        [PDFTOPPM, "-f", "1", "-l", "1", "-singlefile", "-png", "-scale-to", str(THUMB_MAX_PX * 2), source, prefix],
+        check=True,
+        capture_output=True,
+        timeout=THUMB_RENDER_TIMEOUT_SECONDS,
+    )
+    return prefix + ".png"
+
+
+def render_thumbnail(source: str, target: str, max_px: int = THUMB_MAX_PX) -> bool:
+    # Runs in a worker process. Writes via rename so readers never see a partial file
+    # and concurrent renders of the same file are harmless.
+    if os.path.exists(target):
+        return True
+    if Image is None:
+        return False
+
+    Image.MAX_IMAGE_PIXELS = THUMB_MAX_SOURCE_PIXELS
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(target)) as workdir:
+        image_path = source
+        if source.lower().endswith(".pdf"):
+            image_path = _rasterize_pdf(source, workdir)
+            if image_path is None:
+                return False
+
+        with Image.open(image_path) as image:
+            image.draft("RGB", (max_px, max_px))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_px, max_px))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            partial = os.path.join(workdir, "thumb.webp")
+            image.save(partial, "WEBP", quality=80, method=4)
+        os.replace(partial, target)
+    return True
+
+
+def start_thumbnails() -> None:
+    # Created at startup, so no request ever pays for building the pool.
+    global _executor
+    if _executor is None and thumbnails_supported():
+        # spawn: forking a process that runs server threads is not safe.
+        _executor = ProcessPoolExecutor(
+            max_workers=THUMB_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+
+
+def thumbnail_queue_full() -> bool:
+    return len(_inflight) >= THUMB_QUEUE_MAX
+
+
+def _forget(file_id: str, future: Future) -> None:
+    with _lock:
+        if _inflight.get(file_id) is future:
+            del _inflight[file_id]
+
+
+def schedule_thumbnail(file_id: str) -> Future | None:
+    # Never blocks: returns the pending job, or None when there is nothing to do
+    # or the queue is full.
+    executor = _executor
+    if executor is None:
+        return None
+    target = thumbnail_path(file_id)
+    if target.exists():
+        return None
+
+    with _lock:
+        future = _inflight.get(file_id)
+        if future is not None:
+            return future
+        if len(_inflight) >= THUMB_QUEUE_MAX:
+            return None
+        source = find_source(file_id)
+        if source is None:
+            return None
+        future = executor.submit(render_thumbnail, str(source), str(target))
+        _inflight[file_id] = future
+    future.add_done_callback(lambda done: _forget(file_id, done))
+    return future
+
+
+def shutdown_thumbnails() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+ALLOWED_MIME_TYPES = {"application/pdf", "image/jpeg", "image/png"}
+ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
+# Stored names are fresh uuids and never rewritten, so clients may cache forever.
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ETAG_CACHE_MAX_ENTRIES = 10_000
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# stored name -> (size, mtime_ns, etag)
+_etags: dict[str, tuple[int, int, str]] = {}
+
+
+def resolve_upload(name: str) -> Path | None:
+    # Only plain stored names directly under UPLOAD_DIR are served.
+    if not name or name != Path(name).name or name.startswith("."):
+        return None
+    path = UPLOAD_DIR / name
+    return path if path.is_file() else None
+
+
+def content_etag(data: bytes) -> str:
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def remember_etag(name: str, stat_result: os.stat_result, etag: str) -> None:
+    if len(_etags) >= ETAG_CACHE_MAX_ENTRIES:
+        _etags.clear()
+    _etags[name] = (stat_result.st_size, stat_result.st_mtime_ns, etag)
+
+
+def file_etag(path: Path, stat_result: os.stat_result) -> str:
+    # Strong ETag from the content hash, computed once per file and process.
+    cached = _etags.get(path.name)
+    if cached is not None and cached[:2] == (stat_result.st_size, stat_result.st_mtime_ns):
+        return cached[2]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as handle:
+        while chunk := handle.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()}"'
+    remember_etag(path.name, stat_result, etag)
+    return etag
@@ -0,0 +1,54 @@
+import os
+import random
+import time
+from typing import Callable
+
+import pytest
+
+# Every run is reproducible: a failing case prints its seed, and
+# PRICING_FUZZ_SEED=<seed> replays it exactly.
+FUZZ_SEED = int(os.getenv("PRICING_FUZZ_SEED", "20240601"))
+FUZZ_CASES = int(os.getenv("PRICING_FUZZ_CASES", "300"))
+# Time budgets depend on the machine, so they only run when asked for.
+RUN_PERF = os.getenv("PRICING_PERF") == "1"
+# Multiplies every time budget; raise it on slow or shared CI machines.
+BUDGET_SCALE = float(os.getenv("PRICING_BUDGET_SCALE", "1.0"))
+
+
+def pytest_collection_modifyitems(config, items) -> None:
+    if RUN_PERF:
+        return
+    skip = pytest.mark.skip(reason="time budget; set PRICING_PERF=1 to run")
+    for item in items:
+        if "perf" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def rng(request) -> random.Random:
+    seed = f"{FUZZ_SEED}:{request.node.nodeid}"
+    print(f"fuzz seed: {seed}")
+    return random.Random(seed)
+
+
+@pytest.fixture
+def fuzz_cases() -> int:
+    return FUZZ_CASES
+
+
+def _assert_within_budget(call: Callable[[], object], budget_us: float, repeat: int = 2000) -> None:
+    # Best of five batches, so a single scheduler hiccup does not fail the run.
+    call()
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            call()
+        best = min(best, (time.perf_counter() - started) / repeat * 1e6)
+    limit = budget_us * BUDGET_SCALE
+    assert best <= limit, f"{best:.2f}us per call, budget {limit:.2f}us"
+
+
+@pytest.fixture
+def within_budget() -> Callable[..., None]:
+    return _assert_within_budget
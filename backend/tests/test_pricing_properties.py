@@ -0,0 +1,197 @@
+import random
+
+import pytest
+
+from app.models import FLYER_SIZE_MM, PrintSheet, ProductSpec, QuoteRequest, SheetPrice
+from app.price_snapshot import AnchorRecord, PricingSnapshot, SheetPriceRecord, SheetRecord, SpecRecord, compile_snapshot
+from app.pricing import MIN_PRICE, build_quote, calculate_anchor_price, quote_from_snapshot
+from app.pricing_service import calc_per_sheet, resolve_anchor_price
+
+PAPERS = ("130g", "170g")
+COLORS = ("1+0", "4+0", "4+4")
+SIZES = ("A6", "A5", "A4")
+
+
+def random_anchor_map(rng: random.Random) -> dict[int, float]:
+    # Totals grow with quantity, as in every real price list.
+    quantities = sorted(rng.sample(range(1, 20_000), rng.randint(1, 12)))
+    price = rng.uniform(0, 20_000)
+    anchors = {}
+    for qty in quantities:
+        anchors[qty] = round(price, 2)
+        price += rng.uniform(0, 30_000)
+    return anchors
+
+
+def random_snapshot(rng: random.Random) -> tuple[PricingSnapshot, dict[tuple[str, str], dict[int, float]]]:
+    tables = {(paper, size): random_anchor_map(rng) for paper in PAPERS for size in SIZES}
+    rows = [
+        AnchorRecord("flyer", paper, size, qty, price)
+        for (paper, size), anchors in tables.items()
+        for qty, price in anchors.items()
+    ]
+    rng.shuffle(rows)
+    return PricingSnapshot(compile_snapshot(rng.randint(1, 1000), rows, [], [], [])), tables
+
+
+def random_geometry(rng: random.Random) -> tuple[SheetRecord, SpecRecord]:
+    width, height = rng.randint(50, 1000), rng.randint(50, 1000)
+    sheet = SheetRecord("S", width, height, rng.randint(1, width), rng.randint(1, height))
+    spec = SpecRecord("flyer", rng.randint(1, 400), rng.randint(1, 400), rng.randint(0, 10), "S")
+    return sheet, spec
+
+
+def random_request(rng: random.Random, qty: int) -> QuoteRequest:
+    # build_quote is exercised beyond the API's quantity choices, so validation is skipped.
+    return QuoteRequest.model_construct(
+        product="flyer",
+        size=rng.choice(SIZES),
+        paper=rng.choice(PAPERS),
+        color=rng.choice(COLORS),
+        qty=qty,
+        lamination=rng.random() < 0.5,
+        currency="HUF",
+    )
+
+
+def brute_force_per_sheet(sheet: SheetRecord, spec: SpecRecord) -> int:
+    item_w = spec.finished_w_mm + 2 * spec.bleed_mm
+    item_h = spec.finished_h_mm + 2 * spec.bleed_mm
+    best = 0
+    for w, h in ((item_w, item_h), (item_h, item_w)):
+        columns = 0
+        while (columns + 1) * w <= sheet.printable_width_mm:
+            columns += 1
+        rows = 0
+        while (rows + 1) * h <= sheet.printable_height_mm:
+            rows += 1
+        best = max(best, columns * rows)
+    return best
+
+
+def test_resolve_anchor_price_picks_largest_anchor_not_above_qty(rng, fuzz_cases):
+    for _ in range(fuzz_cases):
+        anchors = random_anchor_map(rng)
+        qty = rng.randint(1, 25_000)
+        resolved_qty, price = resolve_anchor_price(anchors, qty)
+        below = [anchor for anchor in anchors if anchor <= qty]
+        assert resolved_qty == (max(below) if below else min(anchors))
+        assert price == anchors[resolved_qty]
+
+
+def test_resolve_anchor_price_rejects_empty_table():
+    with pytest.raises(ValueError):
+        resolve_anchor_price({}, 100)
+
+
+def test_snapshot_resolve_anchor_matches_reference(rng, fuzz_cases):
+    for _ in range(max(1, fuzz_cases // 30)):
+        snapshot, tables = random_snapshot(rng)
+        for (paper, size), anchors in tables.items():
+            assert snapshot.anchor_map("flyer", paper, size) == anchors
+            for _ in range(30):
+                qty = rng.randint(1, 25_000)
+                assert snapshot.resolve_anchor("flyer", paper, size, qty) == resolve_anchor_price(anchors, qty)
+        assert snapshot.resolve_anchor("flyer", "90g", "A5", 100) is None
+
+
+def test_anchor_price_is_monotone_in_qty_and_floored(rng, fuzz_cases):
+    for _ in range(max(1, fuzz_cases // 30)):
+        snapshot, _ = random_snapshot(rng)
+        paper, size, color = rng.choice(PAPERS), rng.choice(SIZES), rng.choice(COLORS)
+        lamination = rng.random() < 0.5
+        previous = 0
+        for qty in sorted(rng.sample(range(1, 25_000), 30)):
+            result = calculate_anchor_price(snapshot, "flyer", size, paper, color, qty, lamination)
+            assert result.final_price >= MIN_PRICE
+            assert result.final_price >= previous
+            assert sum(line.amount for line in result.breakdown) == result.final_price
+            previous = result.final_price
+
+
+def test_calc_per_sheet_matches_brute_force_grid(rng, fuzz_cases):
+    for _ in range(fuzz_cases * 3):
+        sheet, spec = random_geometry(rng)
+        assert calc_per_sheet(sheet, spec) == brute_force_per_sheet(sheet, spec)
+
+
+def test_build_quote_invariants(rng, fuzz_cases):
+    for _ in range(fuzz_cases):
+        sheet, spec = random_geometry(rng)
+        sheet_price = SheetPriceRecord("S", rng.choice(COLORS), rng.randint(0, 2_000), rng.randint(0, 20_000))
+        per_sheet = calc_per_sheet(sheet, spec)
+        request = random_request(rng, rng.randint(1, 20_000))
+        if per_sheet <= 0:
+            with pytest.raises(ValueError):
+                build_quote(request, spec, sheet, sheet_price)
+            continue
+
+        previous = 0
+        for qty in sorted(rng.sample(range(1, 20_000), 10)):
+            request = request.model_copy(update={"qty": qty})
+            result = build_quote(request, spec, sheet, sheet_price)
+            assert result.final_price >= MIN_PRICE
+            assert result.final_price >= previous
+            assert sum(line.amount for line in result.breakdown) == result.final_price
+            previous = result.final_price
+
+
+def test_quote_from_snapshot_matches_build_quote(rng, fuzz_cases):
+    # calculate_quote is quote_from_snapshot on the live snapshot; here the snapshot
+    # is compiled from random sheets, specs and sheet prices instead of the database.
+    for _ in range(max(1, fuzz_cases // 30)):
+        # Large enough for most flyer sizes to fit, so most cases produce a quote.
+        width, height = rng.randint(200, 1000), rng.randint(200, 1000)
+        sheet = SheetRecord("S", width, height, rng.randint(150, width), rng.randint(150, height))
+        specs = {
+            size: SpecRecord("flyer", w_mm, h_mm, rng.randint(0, 5), sheet.code)
+            for size, (w_mm, h_mm) in FLYER_SIZE_MM.items()
+        }
+        prices = {
+            color: SheetPriceRecord(sheet.code, color, rng.randint(0, 2_000), rng.randint(0, 20_000))
+            for color in COLORS
+            if rng.random() < 0.8
+        }
+        # compile_snapshot reads database rows, so the records go in as unsaved models.
+        snapshot = PricingSnapshot(
+            compile_snapshot(
+                rng.randint(1, 1000),
+                [],
+                [ProductSpec(**spec._asdict()) for spec in specs.values()],
+                [PrintSheet(**sheet._asdict())],
+                [SheetPrice(**price._asdict()) for price in prices.values()],
+            )
+        )
+
+        for _ in range(30):
+            request = random_request(rng, rng.randint(1, 20_000))
+            spec, sheet_price = specs[request.size], prices.get(request.color)
+            if sheet_price is None or calc_per_sheet(sheet, spec) <= 0:
+                with pytest.raises(ValueError):
+                    quote_from_snapshot(snapshot, request)
+                continue
+            result = quote_from_snapshot(snapshot, request)
+            assert result == build_quote(request, spec, sheet, sheet_price)
+            assert result.final_price >= MIN_PRICE
+            assert sum(line.amount for line in result.breakdown) == result.final_price
+
+        missing = random_request(rng, 100).model_copy(update={"size": "A3"})
+        with pytest.raises(ValueError):
+            quote_from_snapshot(snapshot, missing)
+
+
+@pytest.mark.perf
+def test_pricing_core_time_budgets(within_budget):
+    rng = random.Random(0)
+    anchors = random_anchor_map(rng)
+    snapshot, _ = random_snapshot(rng)
+    sheet = SheetRecord("SRA3", 320, 450, 310, 440)
+    spec = SpecRecord("flyer", 148, 210, 2, "SRA3")
+    sheet_price = SheetPriceRecord("SRA3", "4+0", 120, 3_000)
+    request = random_request(rng, 1_000)
+
+    within_budget(lambda: resolve_anchor_price(anchors, 5_000), budget_us=10)
+    within_budget(lambda: snapshot.resolve_anchor("flyer", "130g", "A5", 5_000), budget_us=15)
+    within_budget(lambda: calc_per_sheet(sheet, spec), budget_us=5)
+    within_budget(lambda: build_quote(request, spec, sheet, sheet_price), budget_us=40)
+    within_budget(lambda: calculate_anchor_price(snapshot, "flyer", "A5", "170g", "4+4", 5_000, True), budget_us=40)
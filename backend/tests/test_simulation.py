@@ -0,0 +1,88 @@
+from app.price_snapshot import AnchorRecord
+from app.pricing import MIN_PRICE, SURCHARGE_COLOR_4_4, AnchorSurcharges
+from app.simulation import Model, apply_candidate, simulate_grid, simulate_orders
+
+ROWS = [
+    AnchorRecord("flyer", "130g", "A5", 100, 9_000.0),
+    AnchorRecord("flyer", "130g", "A5", 500, 20_000.0),
+    AnchorRecord("flyer", "170g", "A5", 100, 11_000.0),
+    AnchorRecord("banner", "vinyl", "custom", 1, 3_500.0),
+]
+CODES = {"szorolap-a5": "flyer", "banner": "banner"}
+
+
+def order_item(slug: str, size: str, paper: str, color: str, qty: int, lamination: bool = False) -> dict:
+    extras = ["Fóliázás"] if lamination else []
+    return {
+        "productSlug": slug,
+        "selections": {"size": size, "paper": paper, "color": color, "quantity": qty, "extras": extras},
+    }
+
+
+def anchor_entry(material: str, size: str, qty: int, price: float | None) -> dict:
+    return {
+        "product_code": "flyer",
+        "material_code": material,
+        "size_key": size,
+        "anchor_qty": qty,
+        "anchor_price": price,
+    }
+
+
+def test_apply_candidate_scales_before_explicit_anchors():
+    rows, surcharges = apply_candidate(
+        ROWS,
+        {
+            "scale": {"flyer": 2},
+            "anchors": [
+                anchor_entry("130g", "A5", 500, 25_000),
+                anchor_entry("170g", "A5", 100, None),
+                anchor_entry("130g", "A4", 100, 12_000),
+            ],
+            "surcharges": {"color_4_4": 4_000},
+        },
+    )
+    prices = {
+        (row.material_code, row.size_key, row.anchor_qty): row.anchor_price for row in rows if row.product_code == "flyer"
+    }
+    assert prices == {("130g", "A5", 100): 18_000.0, ("130g", "A5", 500): 25_000.0, ("130g", "A4", 100): 12_000.0}
+    assert [row for row in rows if row.product_code == "banner"] == [ROWS[3]]
+    assert surcharges == AnchorSurcharges(color_4_4=4_000)
+
+
+def test_simulate_orders_weights_lines_and_counts_unpriced():
+    items = [
+        order_item("szorolap-a5", "A5", "130g", "4+4", 200),
+        order_item("szorolap-a5", "A5", "130g", "4+4", 200),
+        order_item("szorolap-a5", "A5", "130g", "1+0", 600, lamination=True),
+        order_item("szorolap-a5", "A4", "130g", "4+4", 200),
+        order_item("ismeretlen", "A5", "130g", "4+4", 200),
+    ]
+    baseline = Model(ROWS, AnchorSurcharges())
+    candidate = Model(ROWS, AnchorSurcharges(color_4_4=SURCHARGE_COLOR_4_4 + 1_000))
+
+    summary = simulate_orders(items, CODES, baseline, candidate)
+    flyer = summary["flyer"]
+    assert flyer["lines"] == 4
+    assert flyer["unpriced"] == 1
+    assert flyer["changed"] == 2
+    assert flyer["deltaFt"] == 2_000
+    assert flyer["baselineFt"] == 2 * baseline.line_price(("flyer", "A5", "130g", "4+4", 200, False)) + (
+        baseline.line_price(("flyer", "A5", "130g", "1+0", 600, True))
+    )
+    # Items that cannot be normalized are reported under their slug.
+    assert (summary["ismeretlen"]["lines"], summary["ismeretlen"]["unpriced"]) == (1, 1)
+
+
+def test_simulate_grid_covers_catalog_papers_and_reports_surcharge_use():
+    baseline = Model(ROWS, AnchorSurcharges())
+    candidate = Model(ROWS, AnchorSurcharges(paper_170g=2_000, min_price=MIN_PRICE))
+    quantities = [50, 100, 300, 800]
+
+    summary, evaluated, coverage = simulate_grid(baseline, candidate, quantities, print_modes=["1+0", "4+4"])
+    # flyer: two papers x two colors x lamination; banner: one paper x two colors x lamination.
+    assert evaluated == 2 * (2 * 2 * 2 + 2 * 2) * len(quantities)
+    assert coverage["paper_170g"] == 2 * 2 * len(quantities)
+    assert coverage["color_4_0"] == 0
+    assert summary["flyer"]["changed"] > 0
+    assert summary["banner"]["changed"] == 0
@@ -49,9 +49,7 @@ function filterCombinations(
 
 function allowedSizes(product: CatalogProduct | null): string[] {
   if (!product) return [];
-  if (product.product_code === "business_card") {
-    return ["90x50"];
-  }
+  if (product.fixedSize) return [product.fixedSize];
   return product.options.sizes;
 }
 
@@ -192,7 +190,7 @@ export function CalculatorFeature({
     const filtered = filterCombinations(combinations, { size: "", paper, color, qty });
     const dynamic = uniqueStrings(filtered.map((combo) => combo.size));
 
-    if (selectedProduct.product_code === "business_card") return ["90x50"];
+    if (selectedProduct.fixedSize) return [selectedProduct.fixedSize];
     return dynamic.length ? dynamic : sizeBase;
   }, [selectedProduct, combinations, sizeBase, paper, color, qty]);
 
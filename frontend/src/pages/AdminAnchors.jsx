@@ -1,4 +1,4 @@
-﻿import { useEffect, useMemo, useState } from "react";
+﻿import { useEffect, useMemo, useRef, useState } from "react";
 
 import { AnchorsTable } from "../components/admin/AnchorsTable.jsx";
 import { AdminToolbar } from "../components/admin/AdminToolbar.jsx";
@@ -11,6 +11,7 @@ import {
   createAnchorPrice,
   deleteAnchorPrice,
   fetchAnchors,
+  openAdminEvents,
   updateAnchorPrice,
 } from "../services/api";
 
@@ -92,6 +93,57 @@ export default function AdminAnchors({ onOpenOrders }) {
     loadData();
   }, [page, pageSize, filters.product, filters.paper, filters.size, filters.qty, filters.q]);
 
+  const rowsRef = useRef(rows);
+  rowsRef.current = rows;
+  const hasLocalEditsRef = useRef(false);
+  hasLocalEditsRef.current = Object.keys(dirtyMap).length > 0 || selectedIds.size > 0;
+
+  useEffect(() => {
+    const events = openAdminEvents(["anchors"]);
+    let reloadTimer = null;
+
+    function reload() {
+      if (hasLocalEditsRef.current) {
+        setNotice("Az anchor árak máshol módosultak, mentés után frissül a lista.");
+        return;
+      }
+      if (reloadTimer) return;
+      reloadTimer = setTimeout(() => {
+        reloadTimer = null;
+        loadData();
+      }, 300);
+    }
+
+    function applyChanges(changes) {
+      const visibleIds = new Set(rowsRef.current.map((row) => row.id));
+      if (changes.some((change) => change.action !== "delete" && !visibleIds.has(change.anchor.id))) {
+        reload();
+        return;
+      }
+      setRows((prev) => {
+        const byId = new Map(prev.map((row) => [row.id, row]));
+        for (const change of changes) {
+          if (change.action === "delete") byId.delete(change.id);
+          else byId.set(change.anchor.id, change.anchor);
+        }
+        return prev.filter((row) => byId.has(row.id)).map((row) => byId.get(row.id));
+      });
+    }
+
+    events.addEventListener("anchors", (event) => {
+      const payload = JSON.parse(event.data);
+      // Changes made through another server worker arrive without row deltas.
+      if (payload.changes) applyChanges(payload.changes);
+      else reload();
+    });
+    events.addEventListener("resync", reload);
+
+    return () => {
+      clearTimeout(reloadTimer);
+      events.close();
+    };
+  }, [page, pageSize, filters.product, filters.paper, filters.size, filters.qty, filters.q]);
+
   const dirtyEntries = Object.entries(dirtyMap);
 
   function setFilter(key, value) {
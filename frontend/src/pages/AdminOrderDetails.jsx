@@ -1,5 +1,5 @@
 ﻿import { useEffect, useState } from "react";
-import { fetchAdminOrder, updateAdminOrder } from "../services/api";
+import { fetchAdminOrder, updateAdminOrder, uploadThumbnailUrl } from "../services/api";
 
 const STATUS_OPTIONS = ["Beérkezett", "Gyártás alatt", "Kész", "Átadva", "Elutasítva"];
 
@@ -108,6 +108,19 @@ export default function AdminOrderDetails({ orderId, onBack }) {
                           Fájl: <a href={item.upload.url} target="_blank" rel="noreferrer">{item.upload.originalName || "megnyitás"}</a>
                         </p>
                       )}
+                      {item.upload?.fileId && (
+                        <a href={item.upload.url} target="_blank" rel="noreferrer">
+                          <img
+                            className="admin-upload-thumb"
+                            src={uploadThumbnailUrl(item.upload.fileId)}
+                            alt={item.upload.originalName || "Előnézet"}
+                            loading="lazy"
+                            onError={(event) => {
+                              event.currentTarget.style.display = "none";
+                            }}
+                          />
+                        </a>
+                      )}
                       <p><strong>{Number(item.lineTotalFt || 0).toLocaleString("hu-HU")} Ft</strong></p>
                     </div>
                   </article>
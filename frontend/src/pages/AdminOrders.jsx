@@ -1,9 +1,14 @@
-﻿import { useEffect, useState } from "react";
+﻿import { useEffect, useRef, useState } from "react";
 
 import { AdminToolbar } from "../components/admin/AdminToolbar.jsx";
 import { OrdersTable } from "../components/admin/OrdersTable.jsx";
 import { Pagination } from "../components/admin/Pagination.jsx";
-import { bulkUpdateAdminOrderStatus, fetchAdminOrders, updateAdminOrder } from "../services/api";
+import {
+  bulkUpdateAdminOrderStatus,
+  fetchAdminOrders,
+  openAdminEvents,
+  updateAdminOrder,
+} from "../services/api";
 
 const STATUS_OPTIONS = ["", "Beérkezett", "Gyártás alatt", "Kész", "Átadva", "Elutasítva"];
 
@@ -32,6 +37,8 @@ export default function AdminOrders({ onOpenAnchors, onOpenDetails }) {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
   const [notice, setNotice] = useState("");
+  const selectedCountRef = useRef(0);
+  selectedCountRef.current = selectedIds.size;
 
   async function loadData() {
     setLoading(true);
@@ -58,6 +65,38 @@ export default function AdminOrders({ onOpenAnchors, onOpenDetails }) {
     loadData();
   }, [page, pageSize, statusFilter, debouncedSearch]);
 
+  useEffect(() => {
+    const events = openAdminEvents(["orders"]);
+    let reloadTimer = null;
+
+    function reload(message) {
+      setNotice(message);
+      if (selectedCountRef.current || reloadTimer) return;
+      // Coalesces bursts (e.g. several new orders) into a single list request.
+      reloadTimer = setTimeout(() => {
+        reloadTimer = null;
+        loadData();
+      }, 300);
+    }
+
+    events.addEventListener("orders", (event) => {
+      const change = JSON.parse(event.data);
+      if (change.kind === "created") {
+        reload("Új rendelés érkezett.");
+        return;
+      }
+      const field = change.kind === "status" ? "status" : "adminNote";
+      setRows((prev) => prev.map((row) => (row.id === change.orderId ? { ...row, [field]: change.value } : row)));
+    });
+    // Sent when this tab fell too far behind to replay individual changes.
+    events.addEventListener("resync", () => reload("A lista frissült."));
+
+    return () => {
+      clearTimeout(reloadTimer);
+      events.close();
+    };
+  }, [page, pageSize, statusFilter, debouncedSearch]);
+
   async function saveRow(orderId) {
     const nextStatus = draftStatus[orderId];
     const current = rows.find((row) => row.id === orderId)?.status;
@@ -84,9 +123,14 @@ export default function AdminOrders({ onOpenAnchors, onOpenDetails }) {
     if (!selectedIds.size || !status) return;
     setError("");
     try {
-      await bulkUpdateAdminOrderStatus(Array.from(selectedIds), status);
+      const result = await bulkUpdateAdminOrderStatus(Array.from(selectedIds), status);
       await loadData();
-      setNotice("Kijelölt rendelések státusza frissítve.");
+      const skipped = result.conflictIds?.length || 0;
+      setNotice(
+        skipped
+          ? `Kijelölt rendelések státusza frissítve (${skipped} rendelést közben más módosított, azok nem frissültek).`
+          : "Kijelölt rendelések státusza frissítve."
+      );
     } catch (e) {
       setError(e.message || "Tömeges státuszfrissítési hiba.");
     }
@@ -7,7 +7,7 @@ import { useCart } from "../context/CartContext";
 
 const FALLBACK_IMAGE =
   "https://images.unsplash.com/photo-1568667256549-094345857637?auto=format&fit=crop&w=1200&q=80";
-const MAX_FILE_SIZE = 20 * 1024 * 1024;
+const MAX_FILE_SIZE = 512 * 1024 * 1024;
 const ALLOWED_FILE_TYPES = ["application/pdf", "image/jpeg", "image/png"];
 
 function createCartId() {
@@ -175,7 +175,7 @@ export default function ProductDetails({ slug, onBack, onGoCart }) {
             />
 
             <section className="upload-section">
-              <h3>Nyomdai fájl feltöltése (PDF/JPG/PNG, max 20MB)</h3>
+              <h3>Nyomdai fájl feltöltése (PDF/JPG/PNG, max 512MB)</h3>
               <input type="file" accept=".pdf,.jpg,.jpeg,.png" onChange={handleFileChange} />
 
               {selectedFile && (
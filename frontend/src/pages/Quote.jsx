@@ -1,4 +1,4 @@
-﻿import { useMemo, useState } from "react";
+﻿import { useMemo, useRef, useState } from "react";
 import { useCart } from "../context/CartContext";
 import { submitQuoteRequest } from "../services/api";
 
@@ -29,6 +29,8 @@ export default function QuotePage({ onGoProducts }) {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
   const [success, setSuccess] = useState("");
+  // A resubmit of an unchanged form reuses the key, so the server answers with the first order.
+  const pendingSubmission = useRef(null);
 
   const hasItems = items.length > 0;
   const isFormValid = form.name.trim() && form.email.trim() && form.phone.trim();
@@ -48,22 +50,31 @@ export default function QuotePage({ onGoProducts }) {
     setSuccess("");
 
     try {
-      const payload = {
-        customer: {
-          name: form.name,
-          email: form.email,
-          phone: form.phone,
-          company: form.company || null,
-          deadline: form.deadline || null,
-          note: form.note || null,
-        },
-        items,
-        totalFt: subtotalFt,
-        createdAt: new Date().toISOString(),
+      const customer = {
+        name: form.name,
+        email: form.email,
+        phone: form.phone,
+        company: form.company || null,
+        deadline: form.deadline || null,
+        note: form.note || null,
       };
-
-      const response = await submitQuoteRequest(payload);
-      setSuccess(`${response.message} (#${response.id})`);
+      const signature = JSON.stringify({ customer, items, totalFt: subtotalFt });
+      if (pendingSubmission.current?.signature !== signature) {
+        pendingSubmission.current = {
+          signature,
+          key: crypto.randomUUID(),
+          payload: { customer, items, totalFt: subtotalFt, createdAt: new Date().toISOString() },
+        };
+      }
+      const { key, payload } = pendingSubmission.current;
+
+      const response = await submitQuoteRequest(payload, key);
+      pendingSubmission.current = null;
+      const totalNote =
+        typeof response.totalFt === "number" && response.totalFt !== subtotalFt
+          ? ` – végleges összeg: ${formatHuf(response.totalFt)}`
+          : "";
+      setSuccess(`${response.message} (#${response.id})${totalNote}`);
       clearCart();
       window.setTimeout(() => onGoProducts(), 1500);
     } catch (err) {
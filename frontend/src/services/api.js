@@ -34,9 +34,39 @@ export async function fetchProductBySlug(slug) {
   return parseJsonResponse(response, "Nem sikerült betölteni a terméket.");
 }
 
+// Compact catalogs carry one bit per size × paper × quantity × color cell
+// (row-major over the option lists, least significant bit first).
+function decodeCombinationBits(product) {
+  const { sizes, papers, quantities, colors } = product.options;
+  const bits = Uint8Array.from(atob(product.validCombinationBits || ""), (char) => char.charCodeAt(0));
+  const combinations = [];
+  let index = 0;
+  for (const size of sizes) {
+    for (const paper of papers) {
+      for (const quantity of quantities) {
+        for (const color of colors) {
+          if (bits[index >> 3] & (1 << (index & 7))) {
+            combinations.push({ size, paper, quantity, color });
+          }
+          index += 1;
+        }
+      }
+    }
+  }
+  return combinations;
+}
+
 export async function fetchCatalog() {
-  const response = await fetch(`${API_BASE}/catalog`);
-  return parseJsonResponse(response, "Nem sikerült betölteni a kalkulátor katalógust.");
+  const response = await fetch(`${API_BASE}/catalog?format=compact`);
+  const catalog = await parseJsonResponse(response, "Nem sikerült betölteni a kalkulátor katalógust.");
+  if (catalog.format !== "compact") return catalog;
+  return {
+    ...catalog,
+    products: catalog.products.map(({ validCombinationBits, ...product }) => ({
+      ...product,
+      validCombinations: decodeCombinationBits({ ...product, validCombinationBits }),
+    })),
+  };
 }
 
 export async function fetchHealth() {
@@ -53,16 +83,97 @@ export async function requestQuote(payload) {
   return parseJsonResponse(response, "Nem sikerült árat számolni.");
 }
 
-export async function submitQuoteRequest(payload) {
+export async function submitQuoteRequest(payload, idempotencyKey) {
+  const headers = { "Content-Type": "application/json" };
+  if (idempotencyKey) headers["Idempotency-Key"] = idempotencyKey;
   const response = await fetch(`${API_BASE}/quote`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers,
     body: JSON.stringify(payload)
   });
   return parseJsonResponse(response, "Nem sikerült elküldeni az ajánlatkérést.");
 }
 
+export function uploadThumbnailUrl(fileId) {
+  return `${API_BASE}/uploads/${fileId}/thumb`;
+}
+
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const PARALLEL_CHUNK_UPLOADS = 3;
+const CHUNK_UPLOAD_ATTEMPTS = 3;
+
+async function sha256Hex(blob) {
+  const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, "0")).join("");
+}
+
+async function openUploadSession(file, resumeKey) {
+  const savedId = localStorage.getItem(resumeKey);
+  if (savedId) {
+    const response = await fetch(`${API_BASE}/uploads/sessions/${savedId}`);
+    if (response.ok) return response.json();
+  }
+
+  const response = await fetch(`${API_BASE}/uploads/sessions`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, size: file.size, contentType: file.type }),
+  });
+  const session = await parseJsonResponse(response, "Nem sikerült elindítani a feltöltést.");
+  localStorage.setItem(resumeKey, session.uploadId);
+  return session;
+}
+
+async function putChunk(session, file, offset) {
+  const chunk = file.slice(offset, offset + session.chunkSize);
+  const checksum = await sha256Hex(chunk);
+  for (let attempt = 1; ; attempt += 1) {
+    try {
+      const response = await fetch(`${API_BASE}/uploads/sessions/${session.uploadId}?offset=${offset}`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/octet-stream", "X-Chunk-Sha256": checksum },
+        body: chunk,
+      });
+      if (response.ok || attempt >= CHUNK_UPLOAD_ATTEMPTS) {
+        return parseJsonResponse(response, "Nem sikerült feltölteni a fájlt.");
+      }
+    } catch (err) {
+      if (attempt >= CHUNK_UPLOAD_ATTEMPTS) throw err;
+    }
+  }
+}
+
+// Large files go up in parallel chunks; an interrupted upload resumes from the
+// chunks the server already has when the same file is picked again.
+async function uploadFileChunked(file) {
+  const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  const session = await openUploadSession(file, resumeKey);
+  const pending = [...session.missingOffsets];
+  // The server checks the assembled file against this before accepting it.
+  const fileChecksum = sha256Hex(file);
+
+  async function worker() {
+    while (pending.length) {
+      await putChunk(session, file, pending.shift());
+    }
+  }
+  await Promise.all(Array.from({ length: PARALLEL_CHUNK_UPLOADS }, worker));
+
+  const response = await fetch(`${API_BASE}/uploads/sessions/${session.uploadId}/finalize`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ sha256: await fileChecksum }),
+  });
+  // A corrupt assembly cannot be repaired by resuming; the next attempt starts over.
+  if (response.status === 422) localStorage.removeItem(resumeKey);
+  const data = await parseJsonResponse(response, "Nem sikerült feltölteni a fájlt.");
+  localStorage.removeItem(resumeKey);
+  return { ...data, url: toAbsoluteUrl(data.url) };
+}
+
 export async function uploadFile(file) {
+  if (file.size > CHUNKED_UPLOAD_THRESHOLD) return uploadFileChunked(file);
+
   const formData = new FormData();
   formData.append("file", file);
 
@@ -156,6 +267,10 @@ export async function updateAdminOrder(id, payload) {
   return parseJsonResponse(response, "Nem sikerült frissíteni a rendelést.");
 }
 
+export function openAdminEvents(topics) {
+  return new EventSource(`${API_BASE}/admin/events?topics=${topics.join(",")}`);
+}
+
 export async function bulkUpdateAdminOrderStatus(ids, status) {
   const response = await fetch(`${API_BASE}/admin/orders/bulk-status`, {
     method: "PATCH",
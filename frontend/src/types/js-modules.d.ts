@@ -13,6 +13,7 @@ declare module "*.js" {
   export const requestQuote: any;
   export const submitQuoteRequest: any;
   export const uploadFile: any;
+  export const uploadThumbnailUrl: any;
   export const fetchAnchors: any;
   export const createAnchorPrice: any;
   export const updateAnchorPrice: any;
@@ -23,4 +24,5 @@ declare module "*.js" {
   export const fetchAdminOrder: any;
   export const updateAdminOrder: any;
   export const bulkUpdateAdminOrderStatus: any;
+  export const openAdminEvents: any;
 }
@@ -18,7 +18,7 @@ export interface QuoteBreakdownItem {
 
 export interface QuoteResponse {
   final_price: number;
-  currency: "HUF";
+  currency: string;
   breakdown: QuoteBreakdownItem[];
 }
 
@@ -37,6 +37,7 @@ export interface CatalogProduct {
   basePrice: number;
   imageUrl: string;
   product_code: string;
+  fixedSize?: string | null;
   options: {
     sizes: string[];
     papers: string[];